@@ -0,0 +1,104 @@
+import threading
+
+
+class PageSizer:
+    # Picks the number of features requested per page, between 1 and the
+    # layer's maxRecordCount. Pages that come back within the target time
+    # and size grow it by a tenth of maxRecordCount, slower or bigger ones
+    # cut it down to what would have fit, and failed pages halve it. A page
+    # the server truncated caps it for good at what the server returned.
+    def __init__(self, max_size, target_seconds=5.0,
+                 target_bytes=16 * 1024 * 1024):
+        self.max_size = max_size
+        self.size = max_size
+        self.target_seconds = target_seconds
+        self.target_bytes = target_bytes
+        self.step = max(1, max_size // 10)
+        self._lock = threading.Lock()
+
+    def observe(self, count, seconds, size=None):
+        if not count:
+            return
+        ideal = count * self.target_seconds / max(seconds, 0.001)
+        if size:
+            ideal = min(ideal, count * self.target_bytes / size)
+
+        with self._lock:
+            if ideal >= self.size:
+                self.size = min(self.max_size, self.size + self.step)
+            else:
+                self.size = max(1, int(ideal))
+
+    def shrink(self):
+        with self._lock:
+            self.size = max(1, self.size // 2)
+
+    def cap(self, count):
+        # the server's transfer limit, pages never need to be bigger
+        with self._lock:
+            self.max_size = max(1, min(self.max_size, count))
+            self.size = min(self.size, self.max_size)
+
+
+class ConcurrencyLimiter:
+    # Limits the pages in flight to between 1 and `workers`. The limit is
+    # halved when the time per feature rises to `tolerance` times the best
+    # seen so far, and grows back by one after as many fast pages as the
+    # current limit. Used as a context manager around each request.
+    def __init__(self, workers, tolerance=2.0):
+        self.workers = workers
+        self.limit = workers
+        self.tolerance = tolerance
+        self._active = 0
+        self._best = None
+        self._fast = 0
+        self._since_decrease = 0
+        self._condition = threading.Condition()
+
+    def __enter__(self):
+        with self._condition:
+            while self._active >= self.limit:
+                self._condition.wait()
+            self._active += 1
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        with self._condition:
+            self._active -= 1
+            self._condition.notify_all()
+
+    def observe(self, count, seconds):
+        with self._condition:
+            self._adjust(count, seconds)
+            self._condition.notify_all()
+
+    def _adjust(self, count, seconds):
+        if not count:
+            return
+        per_feature = seconds / count
+
+        if self._best is None or per_feature < self._best:
+            self._best = per_feature
+        self._since_decrease += 1
+
+        if per_feature > self._best * self.tolerance:
+            self._fast = 0
+            # pages already in flight when the limit was cut would halve it
+            # again for the same slowdown
+            if self._since_decrease >= self.limit and self.limit > 1:
+                self.limit = max(1, self.limit // 2)
+                self._since_decrease = 0
+        else:
+            self._fast += 1
+            if self._fast >= self.limit and self.limit < self.workers:
+                self.limit += 1
+                self._fast = 0
+
+
+def adaptive_chunks(items, sizer):
+    # like chunks(), but each chunk is as big as the sizer says right now
+    i = 0
+    while i < len(items):
+        size = sizer.size
+        yield items[i:i + size]
+        i += size
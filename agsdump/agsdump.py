@@ -1,27 +1,308 @@
-import sys
 import os
 import json
+import shutil
+import argparse
 import datetime
+from collections import Counter
+from multiprocessing.pool import ThreadPool
 
 from slugify import slugify
-from mapservice import MapService
-from layer import Layer
+from .mapservice import MapService
+from .layer import Layer
+from .symbols import IconStore, SymbolizerCache
+from .writers import WRITERS, NDJSONWriter, get_writer
+from .manifest import Manifest
+from .query import QueryOptions
+from .files import COMPRESSIONS, atomic_write
+from .incremental import (DATA_KEYS, STYLE_KEYS, fingerprint,
+                          last_edit_date, edit_date_field, edited_since,
+                          merge_changes)
+from .jobs import run_layer_jobs
+from .attachments import AttachmentDump
+from .catalog import crawl, load_services
+from .metrics import metrics
+from .cache import ResponseCache
+from .concurrency import ordered_map
+from .planner import (WORKERS, plan_layers, schedule, summary, print_plan,
+                      write_plan)
+from . import session
 
-reload(sys)
-sys.setdefaultencoding('utf8')
+# lists the files of a layer dumped with --tiles
+TILE_INDEX = 'tiles.json'
+
+# written into the dump folder by --dry-run
+PLAN_FILE = 'plan.json'
 
 def main():
-    if len(sys.argv) != 3:
-        print('Usage: agsdump map_name map_url')
-        exit(1)
+    parser = argparse.ArgumentParser(prog='agsdump',
+                                     description='Dump ArcGIS Service')
+    parser.add_argument('map_name', nargs='?',
+                        help='dump folder; with --catalog or --services the '
+                        'folder the services are dumped under')
+    parser.add_argument('map_url', nargs='?')
+    parser.add_argument('--catalog', metavar='URL',
+                        help='dump every MapServer and FeatureServer found '
+                        'under this services directory '
+                        '(.../arcgis/rest/services)')
+    parser.add_argument('--services', metavar='FILE',
+                        help='dump the services listed in this json or yaml '
+                        'file, a list of {"name": ..., "url": ...}')
+    parser.add_argument('--service-jobs', type=int, default=1, metavar='N',
+                        help='number of services dumped concurrently by '
+                        '--catalog and --services (default: 1)')
+    parser.add_argument('--jobs', type=int, default=1, metavar='N',
+                        help='number of layers processed concurrently '
+                        '(default: 1)')
+    parser.add_argument('--page-workers', type=int, default=1, metavar='N',
+                        help='number of pages downloaded concurrently '
+                        'per layer (default: 1)')
+    parser.add_argument('--adaptive', action='store_true',
+                        help='size pages by the server\'s response times '
+                        'and payload sizes, and download fewer pages '
+                        'concurrently while it slows down')
+    parser.add_argument('--quadtree', action='store_true',
+                        help='fetch layers by quadtree cells of their '
+                        'extent instead of by objectId, for servers that '
+                        'cannot page; partial layers are not resumed')
+    parser.add_argument('--tiles', action='store_true',
+                        help='with --quadtree, write one file per cell '
+                        'into a folder per layer, with a tiles.json index')
+    parser.add_argument('--format', choices=sorted(WRITERS),
+                        default='geojson',
+                        help='output format of the layer data '
+                        '(default: geojson)')
+    parser.add_argument('--compress', choices=sorted(COMPRESSIONS),
+                        help='compress geojson and ndjson output on the fly')
+    parser.add_argument('--pg-dsn', default='', metavar='DSN',
+                        help='PostgreSQL connection string for --format '
+                        'postgis (default: libpq environment variables)')
+    parser.add_argument('--pg-schema', default='public', metavar='SCHEMA',
+                        help='schema the postgis tables are created in '
+                        '(default: public)')
+    parser.add_argument('--fields', metavar='FIELD,...',
+                        help='only dump these attribute fields')
+    parser.add_argument('--where', metavar='CLAUSE',
+                        help='only dump features matching this where clause')
+    parser.add_argument('--bbox', metavar='XMIN,YMIN,XMAX,YMAX',
+                        help='only dump features intersecting this box')
+    parser.add_argument('--bbox-sr', type=int, metavar='WKID',
+                        help='spatial reference of --bbox (default: the '
+                        'layer\'s)')
+    parser.add_argument('--out-sr', type=int, metavar='WKID',
+                        help='spatial reference of the output geometries '
+                        '(default: 4326)')
+    parser.add_argument('--max-allowable-offset', type=float,
+                        metavar='DISTANCE',
+                        help='let the server generalize geometries by up to '
+                        'this distance, in --out-sr units')
+    parser.add_argument('--geometry-precision', type=int, metavar='DIGITS',
+                        help='number of decimals in output coordinates')
+    parser.add_argument('--query-config', metavar='FILE',
+                        help='json file with query options per layer, see '
+                        'QueryOptions.from_config')
+    parser.add_argument('--attachments', action='store_true',
+                        help='also download the attachments of the '
+                        'features dumped, with an index per layer')
+    parser.add_argument('--attachment-workers', type=int, default=4,
+                        metavar='N',
+                        help='number of attachments downloaded '
+                        'concurrently per layer (default: 4)')
+    parser.add_argument('--dry-run', action='store_true',
+                        help='count the features of all layers concurrently '
+                        'and print the estimated size and duration of the '
+                        'dump, also written to plan.json, without dumping')
+    parser.add_argument('--resume', action='store_true',
+                        help='skip layers completed by a previous run and '
+                        'continue partial ones from their last batch')
+    parser.add_argument('--incremental', action='store_true',
+                        help='skip layers and styles unchanged since the '
+                        'previous run and only fetch edited features')
+    parser.add_argument('--pool-size', type=int, metavar='N',
+                        help='maximum number of pooled connections per host '
+                        '(default: jobs * page workers, at least 10)')
+    parser.add_argument('--retries', type=int, default=5, metavar='N',
+                        help='retries on timeouts and 5xx responses '
+                        '(default: 5)')
+    parser.add_argument('--backoff', type=float, default=0.5,
+                        metavar='SECONDS',
+                        help='exponential backoff factor between retries '
+                        '(default: 0.5)')
+    parser.add_argument('--timeout', type=float, default=60,
+                        metavar='SECONDS',
+                        help='request timeout (default: 60)')
+    parser.add_argument('--max-requests', type=int, metavar='N',
+                        help='maximum number of requests in flight across '
+                        'all layers and services')
+    parser.add_argument('--rate-limit', type=float, metavar='REQUESTS',
+                        help='maximum number of requests per second sent '
+                        'to any one host')
+    parser.add_argument('--cache', action='store_true',
+                        help='keep responses on disk and reuse them, '
+                        'revalidated by ETag or Last-Modified where the '
+                        'server sends them')
+    parser.add_argument('--cache-dir', metavar='DIR',
+                        help='folder of the cache (default: .cache in the '
+                        'dump folder)')
+    parser.add_argument('--cache-size', type=float, default=1024,
+                        metavar='MB',
+                        help='evict the least recently used responses '
+                        'beyond this size (default: 1024)')
+    parser.add_argument('--cache-ttl', type=float, default=3600,
+                        metavar='SECONDS',
+                        help='reuse responses without ETag or Last-Modified '
+                        'for this long (default: 3600)')
+    parser.add_argument('--offline', action='store_true',
+                        help='answer every request from the cache and never '
+                        'contact the server')
+    parser.add_argument('--report', metavar='FILE',
+                        help='write request and phase timings, bytes, '
+                        'retries and features per second to this json file')
+    parser.add_argument('--prometheus', metavar='FILE',
+                        help='write the same metrics in the Prometheus '
+                        'textfile format')
+    args = parser.parse_args()
+
+    batch = args.catalog or args.services
+    if batch and args.map_url:
+        parser.error('map_url cannot be combined with --catalog/--services')
+    if not batch and not args.map_url:
+        parser.error('map_name and map_url are required')
+
+    writer_options = {}
+    if args.format == 'postgis':
+        writer_options = {'dsn': args.pg_dsn, 'schema': args.pg_schema}
+    if args.compress:
+        if args.format not in ('geojson', 'ndjson'):
+            parser.error('--compress needs --format geojson or ndjson')
+        writer_options = {'compression': args.compress}
+
+    if args.tiles:
+        if not args.quadtree:
+            parser.error('--tiles needs --quadtree')
+        if args.format == 'postgis':
+            parser.error('--tiles needs a file format')
+
+    # options not given are left to the query config or QueryOptions
+    query_options = dict((option, getattr(args, option))
+                         for option in QueryOptions.options
+                         if getattr(args, option) is not None)
+    if args.query_config:
+        query = QueryOptions.from_config(args.query_config, **query_options)
     else:
-        map_name = sys.argv[1]
-        map_url = sys.argv[2]
+        query = QueryOptions(**query_options)
+
+    workers = args.page_workers
+    if args.attachments:
+        workers = max(workers, args.attachment_workers)
+    pool_size = args.pool_size or max(
+        10, args.service_jobs * args.jobs * workers)
+    cache = None
+    if args.cache or args.offline:
+        cache_dir = args.cache_dir or os.path.join(args.map_name or '',
+                                                   '.cache')
+        cache = ResponseCache(os.path.abspath(cache_dir),
+                              max_size=int(args.cache_size * 1024 * 1024),
+                              ttl=args.cache_ttl, offline=args.offline)
+
+    session.configure(pool_size=pool_size, retries=args.retries,
+                      backoff=args.backoff, timeout=args.timeout,
+                      max_requests=args.max_requests,
+                      rate_limit=args.rate_limit, cache=cache)
+
+    styles_options = {'jobs': args.jobs, 'incremental': args.incremental}
+    data_options = {
+        'jobs': args.jobs,
+        'page_workers': args.page_workers,
+        'adaptive': args.adaptive,
+        'quadtree': args.quadtree,
+        'tiles': args.tiles,
+        'resume': args.resume,
+        'incremental': args.incremental,
+        'output_format': args.format,
+        'writer_options': writer_options,
+        'query': query,
+    }
+    attachments_options = None
+    if args.attachments:
+        attachments_options = {
+            'jobs': args.jobs,
+            'workers': args.attachment_workers,
+            'resume': args.resume,
+            'query': query,
+        }
+
+    plan_options = None
+    if args.dry_run:
+        plan_options = {
+            'jobs': args.jobs,
+            'page_workers': args.page_workers,
+            'query': query,
+        }
 
-    dump_styles(map_name, map_url)
-    dump_data(map_name, map_url)
+    metrics.reset()
+    try:
+        if batch:
+            if args.catalog:
+                services = crawl(args.catalog)
+            else:
+                services = load_services(args.services)
+            if args.map_name:
+                services = [(os.path.join(args.map_name, name), url)
+                            for name, url in services]
+            dump_services(services, styles_options, data_options,
+                          jobs=args.service_jobs,
+                          attachments_options=attachments_options,
+                          plan_options=plan_options)
+        elif plan_options is not None:
+            plan_data(args.map_name, args.map_url, **plan_options)
+        else:
+            dump_styles(args.map_name, args.map_url, **styles_options)
+            dump_data(args.map_name, args.map_url, **data_options)
+            if attachments_options is not None:
+                dump_attachments(args.map_name, args.map_url,
+                                 **attachments_options)
+    finally:
+        # also written for failed runs, that is when they are most useful
+        if args.report:
+            metrics.write_report(args.report)
+        if args.prometheus:
+            metrics.write_prometheus(args.prometheus)
 
-def dump_styles(map_name, map_url):
+def dump_services(services, styles_options, data_options, jobs=1,
+                  attachments_options=None, plan_options=None):
+    # dump many services in one process; a failing service is reported in
+    # the summary and does not stop the others. With plan_options the
+    # services are only planned.
+    def dump_service(service):
+        map_name, map_url = service
+        print("\n=== {} ({})".format(map_name, map_url))
+        try:
+            if plan_options is not None:
+                plan_data(map_name, map_url, **plan_options)
+                return map_name, None
+            dump_styles(map_name, map_url, **styles_options)
+            dump_data(map_name, map_url, **data_options)
+            if attachments_options is not None:
+                dump_attachments(map_name, map_url, **attachments_options)
+        except Exception as exc:
+            print("  {}: {}".format(type(exc).__name__, exc))
+            return map_name, exc
+        return map_name, None
+
+    pool = ThreadPool(jobs)
+    try:
+        results = pool.map(dump_service, services)
+    finally:
+        pool.terminate()
+
+    failed = [(name, exc) for name, exc in results if exc is not None]
+    dumped = len(results) - len(failed)
+    print("\nServices: {} dumped, {} failed".format(dumped, len(failed)))
+    for name, exc in failed:
+        print("  {}: {}".format(name, exc))
+    return results
+
+def dump_styles(map_name, map_url, jobs=1, incremental=False):
 
     # get dump folder
     dump_folder = get_dump_folder(map_name, 'styles')
@@ -29,17 +310,39 @@ def dump_styles(map_name, map_url):
     # initialize map service
     map_service = MapService(map_url)
 
-    for layer in map_service.layers:
+    # styles generated by previous runs
+    manifest = Manifest(dump_folder)
+
+    # icons and converted symbols shared by all layers
+    icons = IconStore(dump_folder)
+    symbolizers = SymbolizerCache()
+
+    def dump_layer_style(layer, job):
         layer_id = layer.get('id')
         layer_name = slugify(layer.get('name')).replace("-", "_")
         layer_name = layer.get('name')
-        print("\n{} {}".format(layer_id, layer_name))
+        job.log("\n{} {}".format(layer_id, layer_name))
 
-        layer = Layer(map_url, layer_id, dump_folder)
+        layer = Layer(map_url, layer_id, dump_folder, log=job.log,
+                      icons=icons, symbolizers=symbolizers)
+
+        style_hash = fingerprint(layer.descriptor, STYLE_KEYS)
+        if (incremental and
+                manifest.get(layer_id).get('fingerprint') == style_hash and
+                os.path.exists(layer.sld_file_path)):
+            job.log("  unchanged")
+            return
 
         layer.dump_sld_file()
 
-def dump_data(map_name, map_url):
+        manifest.reset(layer_id, fingerprint=style_hash)
+
+    return run_layer_jobs(dump_layer_style, map_service.layers, jobs,
+                          name=map_name + '/styles')
+
+def dump_data(map_name, map_url, jobs=1, page_workers=1, adaptive=False,
+              quadtree=False, tiles=False, resume=False, incremental=False,
+              output_format='geojson', writer_options=None, query=None):
 
     # get dump folder
     dump_folder = get_dump_folder(map_name, 'data')
@@ -47,28 +350,324 @@ def dump_data(map_name, map_url):
     # initialize map service
     map_service = MapService(map_url)
 
-    for layer in map_service.layers:
+    # progress of this and previous runs
+    manifest = Manifest(dump_folder)
+
+    writer_class = get_writer(output_format)
+    query = query or QueryOptions()
+
+    suffix = writer_class.extension
+    if (writer_options or {}).get('compression'):
+        suffix += COMPRESSIONS[writer_options['compression']]
+
+    file_names = unique_names(map_service.layers)
+
+    def layer_state(layer):
+        # Where the layer goes, what a previous run left of it and, in
+        # `skip`, why this run can leave it alone: 'done' when resuming a
+        # complete layer, 'unchanged' when it was not edited since the last
+        # incremental dump.
+        layer_id = layer.get('id')
+        if tiles:
+            # a folder of tiles
+            layer_file = os.path.join(dump_folder, file_names[layer_id])
+            exists = os.path.exists(os.path.join(layer_file, TILE_INDEX))
+        else:
+            layer_file = os.path.join(dump_folder,
+                                      file_names[layer_id] + suffix)
+            exists = writer_class.exists(layer_file)
+
+        state = manifest.get(layer_id)
+        if (resume and state.get('status') == 'complete' and
+                (not state.get('count') or exists)):
+            return {'skip': 'done'}
+
+        descriptor = map_service.get_descriptor_for_layer(layer_id)
+        layer_hash = fingerprint(descriptor, DATA_KEYS)
+        edit_date = last_edit_date(descriptor)
+
+        layer_query = query.for_layer(layer_id, layer.get('name'))
+        metadata = {
+            'source': map_service._build_request(layer_id),
+            'query': layer_query.metadata(),
+        }
+
+        # a previous complete dump with the same schema and query that can
+        # be updated
+        previous = (incremental and not tiles and
+                    state.get('status') == 'complete' and
+                    state.get('fingerprint') == layer_hash and
+                    state.get('query') == metadata['query'] and
+                    state.get('last_edit_date') and
+                    (not state.get('count') or exists))
+
+        return {
+            'skip': ('unchanged' if previous and
+                     state.get('last_edit_date') == edit_date else None),
+            'file': layer_file,
+            'state': state,
+            'descriptor': descriptor,
+            'fingerprint': layer_hash,
+            'edit_date': edit_date,
+            'query': layer_query,
+            'metadata': metadata,
+            'previous': previous,
+        }
+
+    def skip_reason(layer):
+        try:
+            return layer_state(layer)['skip']
+        except Exception:
+            # group layers and the like, the dump reports them
+            return None
+
+    # with several jobs, count the layers left to dump up front and start
+    # the longest ones first
+    layers = map_service.layers
+    counts = {}
+    if jobs > 1:
+        pending = layers
+        if resume or incremental:
+            # layers this run skips are neither counted nor in the plan
+            skipped = list(ordered_map(skip_reason, layers, WORKERS))
+            pending = [layer for layer, skip in zip(layers, skipped)
+                       if skip is None]
+        plans = plan_layers(map_service, pending, query, page_workers)
+        print("\n" + summary(plans, jobs))
+        layers = schedule(layers, plans)
+        counts = dict((plan.layer_id, plan.count) for plan in plans
+                      if plan.error is None)
+
+    def dump_layer_data(layer, job):
         layer_id = layer.get('id')
-        layer_name = slugify(layer.get('name')).replace("-", "_")
         layer_name = layer.get('name')
 
-        suffix = '.json'
-        layer_file = os.path.join(dump_folder, layer_name + suffix)
-        
-        feat_count = map_service.get(layer_id, count_only=True)
-        
-        print("\n{} {} ({})".format(layer_id, layer_name, feat_count))
-    
+        layer_info = layer_state(layer)
+        if layer_info['skip']:
+            job.log("\n{} {} ({})".format(layer_id, layer_name,
+                                          layer_info['skip']))
+            return
+
+        layer_file = layer_info['file']
+        state = layer_info['state']
+        descriptor = layer_info['descriptor']
+        layer_hash = layer_info['fingerprint']
+        edit_date = layer_info['edit_date']
+        layer_query = layer_info['query']
+        metadata = layer_info['metadata']
+        previous = layer_info['previous']
+
+        feat_count = counts.get(layer_id)
+        if feat_count is None:
+            feat_count = map_service.get_count(layer_id, layer_query)
+
+        job.log("\n{} {} ({})".format(layer_id, layer_name, feat_count))
+
         if feat_count > 0:
             x = datetime.datetime.now()
-            print '     Start: ', x
-            layer_data = map_service.get(layer_id)
+            job.log('     Start:  {}'.format(x))
 
-            with open(layer_file, 'w') as f:
-                json.dump(layer_data, f)
+            edit_field = edit_date_field(descriptor)
+            if previous and edit_field and writer_class.is_dump(layer_file):
+                changes = edited_since(edit_field, state['last_edit_date'])
+                count, changed = merge_changes(map_service, layer_id,
+                                               layer_file, layer_query,
+                                               changes,
+                                               writer_class=writer_class,
+                                               workers=page_workers,
+                                               metadata=metadata)
+                job.log('   Changed:  {}'.format(changed))
+                metrics.inc('features_total', count, layer=job.label)
+                job.log('  Features:  {}'.format(count))
+            elif quadtree:
+                dump_layer_cells(layer_id, layer_file, descriptor,
+                                 layer_query, metadata, job)
+            else:
+                dump_layer_file(layer_id, layer_file, descriptor,
+                                layer_query, metadata, state, job)
 
             x = datetime.datetime.now()
-            print '    Finish: ', x
+            job.log('    Finish:  {}'.format(x))
+
+        manifest.reset(layer_id, status='complete', count=feat_count,
+                       fingerprint=layer_hash, last_edit_date=edit_date,
+                       query=metadata['query'])
+
+    def dump_layer_file(layer_id, layer_file, descriptor, layer_query,
+                        metadata, state, job):
+        writer = writer_class(layer_file, descriptor, srid=layer_query.epsg,
+                              metadata=metadata, **(writer_options or {}))
+        last_oid = None
+        if (resume and state.get('status') == 'partial' and
+                state.get('query') == metadata['query'] and
+                writer.can_resume(state)):
+            writer.resume(state)
+            last_oid = state.get('last_oid')
+            job.log('   Resume:  after {} ({} features)'.format(
+                last_oid, writer.count))
+        else:
+            writer.open()
+            manifest.reset(layer_id, status='partial',
+                           query=metadata['query'])
+        resumed = writer.count
+
+        with writer:
+            for last_oid, features in map_service.iter_batches(
+                    layer_id, layer_query, workers=page_workers,
+                    after=last_oid, adaptive=adaptive):
+                with metrics.timer('serialization'):
+                    writer.write(features)
+                manifest.update(layer_id, last_oid=last_oid,
+                                **writer.checkpoint())
+        job.log('  Features:  {}'.format(writer.count))
+        metrics.inc('features_total', writer.count - resumed,
+                    layer=job.label)
+
+    def dump_layer_cells(layer_id, layer_file, descriptor, layer_query,
+                         metadata, job):
+        # cells do not arrive in objectId order, so there is no batch to
+        # resume from and a partial layer starts over
+        manifest.reset(layer_id, status='partial', query=metadata['query'])
+
+        def open_writer(path, metadata):
+            return writer_class(path, descriptor, srid=layer_query.epsg,
+                                metadata=metadata, **(writer_options or {}))
+
+        cells = map_service.iter_cells(layer_id, layer_query,
+                                       workers=page_workers)
+        count = 0
+        if tiles:
+            # one file per non-empty cell, named after its quadkey
+            if os.path.exists(layer_file):
+                shutil.rmtree(layer_file)
+            os.makedirs(layer_file)
+            index = []
+            for cell, features in cells:
+                if not features:
+                    continue
+                tile = dict(cell.as_dict(), count=len(features),
+                            file=cell.name + suffix)
+                tile_file = os.path.join(layer_file, tile['file'])
+                with open_writer(tile_file,
+                                 dict(metadata, tile=cell.as_dict())) as tw:
+                    with metrics.timer('serialization'):
+                        tw.write(features)
+                index.append(tile)
+                count += len(features)
+            atomic_write(os.path.join(layer_file, TILE_INDEX),
+                         json.dumps({'tiles': index}, indent=2))
+            job.log('     Tiles:  {}'.format(len(index)))
+        else:
+            with open_writer(layer_file, metadata) as writer:
+                for cell, features in cells:
+                    with metrics.timer('serialization'):
+                        writer.write(features)
+            count = writer.count
+
+        job.log('  Features:  {}'.format(count))
+        metrics.inc('features_total', count, layer=job.label)
+
+    return run_layer_jobs(dump_layer_data, layers, jobs,
+                          name=map_name + '/data')
+
+def plan_data(map_name, map_url, jobs=1, page_workers=1, query=None):
+    # counts every layer and estimates the dump, without fetching features
+
+    map_service = MapService(map_url)
+    plans = plan_layers(map_service, map_service.layers, query, page_workers)
+    print_plan(plans, jobs)
+
+    folder = os.path.join(os.getcwd(), map_name)
+    if not os.path.exists(folder):
+        os.makedirs(folder)
+    write_plan(os.path.join(folder, PLAN_FILE), plans, jobs)
+    return plans
+
+def dump_attachments(map_name, map_url, jobs=1, workers=4, resume=False,
+                     query=None):
+
+    # get dump folder
+    dump_folder = get_dump_folder(map_name, 'attachments')
+
+    # initialize map service
+    map_service = MapService(map_url)
+
+    # progress of this and previous runs
+    manifest = Manifest(dump_folder)
+
+    query = query or QueryOptions()
+    file_names = unique_names(map_service.layers)
+
+    def dump_layer_attachments(layer, job):
+        layer_id = layer.get('id')
+        layer_name = layer.get('name')
+
+        if not map_service.has_attachments(layer_id):
+            job.log("\n{} {} (no attachments)".format(layer_id, layer_name))
+            return
+
+        file_name = file_names[layer_id]
+        index_file = os.path.join(dump_folder,
+                                  file_name + NDJSONWriter.extension)
+        state = manifest.get(layer_id)
+        if (resume and state.get('status') == 'complete' and
+                NDJSONWriter.exists(index_file)):
+            job.log("\n{} {} (done)".format(layer_id, layer_name))
+            return
+
+        layer_query = query.for_layer(layer_id, layer_name)
+        metadata = {
+            'source': map_service._build_request(layer_id),
+            'query': layer_query.metadata(),
+        }
+
+        job.log("\n{} {}".format(layer_id, layer_name))
+
+        # the files go next to the index, one folder per feature
+        index = NDJSONWriter(index_file, metadata=metadata)
+        last_oid = None
+        if (resume and state.get('status') == 'partial' and
+                state.get('query') == metadata['query'] and
+                index.can_resume(state)):
+            index.resume(state)
+            last_oid = state.get('last_oid')
+            job.log('   Resume:  after {} ({} attachments)'.format(
+                last_oid, index.count))
+        else:
+            index.open()
+            manifest.reset(layer_id, status='partial',
+                           query=metadata['query'])
+
+        attachments = AttachmentDump(map_service, layer_id,
+                                     os.path.join(dump_folder, file_name),
+                                     index, layer_query, workers=workers,
+                                     label=job.label)
+
+        def checkpoint(last_oid):
+            manifest.update(layer_id, last_oid=last_oid,
+                            **index.checkpoint())
+
+        with index:
+            attachments.run(after=last_oid, checkpoint=checkpoint)
+        job.log('  Attachments:  {} ({} downloaded, {} already on disk)'
+                .format(index.count, attachments.downloaded,
+                        attachments.skipped))
+
+        manifest.reset(layer_id, status='complete', count=index.count,
+                       query=metadata['query'])
+
+    return run_layer_jobs(dump_layer_attachments, map_service.layers, jobs,
+                          name=map_name + '/attachments')
+
+def unique_names(layers):
+    # layer id -> the name its files (or table) are written under; layers
+    # sharing a name get their id appended, so they do not overwrite each
+    # other
+    counts = Counter(layer.get('name') for layer in layers)
+    return dict((layer.get('id'),
+                 layer.get('name') if counts[layer.get('name')] == 1
+                 else "{}_{}".format(layer.get('name'), layer.get('id')))
+                for layer in layers)
 
 def get_dump_folder(map_name, sub_folder):
     # create dump folder if it does not exist
@@ -0,0 +1,274 @@
+import time
+import atexit
+import asyncio
+import threading
+from collections import deque
+from urllib.parse import urlparse
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+from . import session
+from .session import ACCEPT_ENCODING, RETRY_STATUSES, RateLimiter
+from .adaptive import ConcurrencyLimiter
+from .metrics import metrics
+
+# connection level failures worth retrying, or splitting a page over
+ClientError = aiohttp.ClientError if aiohttp else OSError
+
+
+def available():
+    return aiohttp is not None
+
+
+class HTTPError(Exception):
+    # a response that still failed after all retries
+    def __init__(self, status, url):
+        super().__init__("{} Error for url: {}".format(status, url))
+        self.status = status
+
+
+class AsyncResponse:
+    # the parts of a requests.Response the MapService reads
+    def __init__(self, status_code, content, url, headers):
+        self.status_code = status_code
+        self.content = content
+        self.url = url
+        self.headers = headers
+
+    @property
+    def text(self):
+        return self.content.decode('utf-8')
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise HTTPError(self.status_code, self.url)
+
+
+def _form(params):
+    # aiohttp only takes strings; booleans the way ArcGIS spells them
+    return dict((key, ('true' if value else 'false')
+                 if isinstance(value, bool) else str(value))
+                for key, value in params.items())
+
+
+class AsyncSession:
+    # The aiohttp counterpart of session.Session, with the same options.
+    # It lives on the shared event loop. Connection errors, timeouts and
+    # RETRY_STATUSES are retried with exponential backoff, honouring
+    # Retry-After. The rate limiter and the max_requests slots, a
+    # threading semaphore, are shared with the sync session so that their
+    # requests count against the same limits.
+    def __init__(self, pool_size=10, retries=5, backoff=0.5, timeout=60,
+                 max_requests=None, rate_limit=None, rate_limiter=None,
+                 slots=None):
+        if aiohttp is None:
+            raise ValueError("aiohttp is not installed")
+
+        self.pool_size = pool_size
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.max_requests = max_requests
+        self.rate_limiter = rate_limiter
+        if rate_limiter is None and rate_limit:
+            self.rate_limiter = RateLimiter(rate_limit)
+        self.slots = slots
+        if slots is None and max_requests:
+            self.slots = threading.BoundedSemaphore(max_requests)
+        self.options = None
+        self._client = None
+
+    def _get_client(self):
+        # created on first use, aiohttp needs the running loop
+        if self._client is None:
+            self._client = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.pool_size),
+                timeout=aiohttp.ClientTimeout(total=self.timeout),
+                headers={'Accept-Encoding': ACCEPT_ENCODING})
+        return self._client
+
+    async def _acquire(self):
+        # polls the shared semaphore, blocking on it would stall the loop
+        delay = 0.001
+        while not self.slots.acquire(blocking=False):
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 0.05)
+
+    def _delay(self, attempt, retry_after=None):
+        if retry_after:
+            try:
+                return float(retry_after)
+            except ValueError:
+                pass
+        return self.backoff * 2 ** (attempt - 1)
+
+    async def _send(self, method, url, params, data):
+        client = self._get_client()
+        async with client.request(method, url, params=params,
+                                  data=data) as response:
+            content = await response.read()
+            return AsyncResponse(response.status, content, str(response.url),
+                                 response.headers), response.content_length
+
+    async def request(self, method, url, params=None, data=None):
+        params = _form(params) if params else None
+        data = _form(data) if data else None
+        host = urlparse(url).netloc
+
+        attempt = 0
+        while True:
+            if self.rate_limiter is not None:
+                delay = self.rate_limiter.reserve(host)
+                if delay > 0:
+                    await asyncio.sleep(delay)
+
+            retry_after = None
+            start = time.time()
+            try:
+                self._get_client()
+                if self.slots is None:
+                    response, wire_size = await self._send(method, url,
+                                                           params, data)
+                else:
+                    await self._acquire()
+                    try:
+                        response, wire_size = await self._send(
+                            method, url, params, data)
+                    finally:
+                        self.slots.release()
+            except (ClientError, asyncio.TimeoutError):
+                metrics.request(host, 'error', time.time() - start)
+                if attempt >= self.retries:
+                    raise
+            else:
+                metrics.request(host, response.status_code,
+                                time.time() - start, len(response.content),
+                                wire_size)
+                if (response.status_code not in RETRY_STATUSES or
+                        attempt >= self.retries):
+                    return response
+                retry_after = response.headers.get('Retry-After')
+
+            attempt += 1
+            metrics.inc('http_retries_total', host=host)
+            await asyncio.sleep(self._delay(attempt, retry_after))
+
+    async def get(self, url, params=None):
+        return await self.request('GET', url, params=params)
+
+    async def post(self, url, data=None):
+        return await self.request('POST', url, data=data)
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.close()
+            self._client = None
+
+
+class AsyncConcurrencyLimiter(ConcurrencyLimiter):
+    # ConcurrencyLimiter for coroutines on the shared loop. Without
+    # `adaptive` it simply allows `workers` pages in flight.
+    def __init__(self, workers, adaptive=False, tolerance=2.0):
+        super().__init__(workers, tolerance)
+        self.adaptive = adaptive
+        self._waiters = None
+
+    async def __aenter__(self):
+        if self._waiters is None:
+            self._waiters = asyncio.Condition()
+        async with self._waiters:
+            await self._waiters.wait_for(lambda: self._active < self.limit)
+            self._active += 1
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        async with self._waiters:
+            self._active -= 1
+            self._waiters.notify_all()
+
+    def observe(self, count, seconds):
+        # only called from the loop, waiters are woken by __aexit__
+        if self.adaptive:
+            self._adjust(count, seconds)
+
+
+class EventLoop:
+    # An asyncio loop on a daemon thread, shared by the whole process so
+    # one connection pool serves every layer and service. Sync code hands
+    # it coroutines with submit() or run().
+    def __init__(self):
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self.loop.run_forever,
+                                        name='agsdump-aio', daemon=True)
+        self._thread.start()
+
+    def submit(self, coroutine):
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop)
+
+    def run(self, coroutine):
+        return self.submit(coroutine).result()
+
+
+_loop = None
+_session = None
+_lock = threading.Lock()
+
+
+def get_loop():
+    global _loop
+    with _lock:
+        if _loop is None:
+            _loop = EventLoop()
+            atexit.register(close)
+        return _loop
+
+
+def close():
+    # closes the async session's connections, at the latest on exit
+    global _session
+    with _lock:
+        closing, _session = _session, None
+    if closing is not None and _loop is not None:
+        _loop.run(closing.close())
+
+
+def get_async_session():
+    # follows session.configure(), sharing its rate limiter and slots
+    global _session
+    options = session.get_options()
+    sync_session = session.get_session()
+    loop = get_loop()
+    with _lock:
+        if _session is None or _session.options is not options:
+            if _session is not None:
+                loop.submit(_session.close())
+            # the response cache only sits in the requests session
+            _session = AsyncSession(rate_limiter=sync_session.rate_limiter,
+                                    slots=sync_session.slots,
+                                    **dict((key, value)
+                                           for key, value in options.items()
+                                           if key != 'cache'))
+            _session.options = options
+        return _session
+
+
+def ordered_gather(coroutines, window):
+    # The asyncio counterpart of concurrency.ordered_map: runs coroutines
+    # on the shared loop, keeping at most `window` of them ahead of the
+    # consumer, and yields their results in order.
+    loop = get_loop()
+    pending = deque()
+    try:
+        for coroutine in coroutines:
+            pending.append(loop.submit(coroutine))
+            if len(pending) >= window:
+                yield pending.popleft().result()
+
+        while pending:
+            yield pending.popleft().result()
+    finally:
+        for future in pending:
+            future.cancel()
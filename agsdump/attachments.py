@@ -0,0 +1,136 @@
+import os
+import re
+from multiprocessing.pool import ThreadPool
+
+from .session import get_session
+from .concurrency import ordered_map, chunks
+from .query import QueryOptions
+from .metrics import metrics
+
+# objectIds per queryAttachments request
+BATCH_SIZE = 100
+CHUNK_SIZE = 64 * 1024
+
+_UNSAFE = re.compile(r'[^\w.-]+')
+
+
+def file_name(info):
+    # attachment names are whatever the editor uploaded; keep them
+    # recognisable but safe on any file system, and unique by id
+    name = os.path.basename((info.get('name') or '').replace('\\', '/'))
+    name = _UNSAFE.sub('_', name).strip('._') or 'attachment'
+    return "{}-{}".format(info.get('id'), name)
+
+
+def is_downloaded(path, info):
+    # an earlier run got this file; without a size all we know is that it
+    # was moved into place
+    if not os.path.exists(path):
+        return False
+    return info.get('size') is None or os.path.getsize(path) == info['size']
+
+
+def download(url, path, params=None, chunk_size=CHUNK_SIZE):
+    # streams url to path through the shared session, so a large file
+    # never sits in memory; returns the number of bytes written
+    part_path = path + '.part'
+    size = 0
+    response = get_session().get(url, params=params, stream=True)
+    try:
+        response.raise_for_status()
+        with open(part_path, 'wb') as f:
+            for chunk in response.iter_content(chunk_size):
+                f.write(chunk)
+                size += len(chunk)
+    finally:
+        response.close()
+    os.replace(part_path, path)
+    return size
+
+
+class AttachmentDump:
+    # Downloads the attachments of one layer into folder/<objectId>/ and
+    # writes an index row per attachment, linking it to its feature, with
+    # `index` (an NDJSONWriter). objectIds are handled in batches of
+    # batch_size: the attachment infos of the next batches are fetched
+    # while the files of the current one download on `workers` threads.
+    def __init__(self, map_service, layer, folder, index, query=None,
+                 workers=4, batch_size=BATCH_SIZE, label=None):
+        self.map_service = map_service
+        self.layer = layer
+        self.folder = folder
+        self.index = index
+        self.query = query or QueryOptions()
+        self.workers = workers
+        self.batch_size = batch_size
+        self.label = label or str(layer)
+        self.downloaded = 0
+        self.skipped = 0
+
+    def _params(self):
+        if self.map_service.token:
+            return {'token': self.map_service.token}
+        return None
+
+    def _infos(self, batch):
+        return batch[-1], self.map_service.get_attachment_infos(self.layer,
+                                                                batch)
+
+    def _fetch(self, item):
+        oid, info = item
+        path = os.path.join(self.folder, str(oid), file_name(info))
+        if is_downloaded(path, info):
+            return path, None
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        url = self.map_service.get_attachment_url(self.layer, oid,
+                                                  info.get('id'))
+        with metrics.timer('attachment'):
+            size = download(url, path, self._params())
+        return path, size
+
+    def _row(self, oid, info, path):
+        # the path is relative to the index, so the dump can be moved
+        relative = os.path.relpath(path, os.path.dirname(self.index.path))
+        return {
+            'objectId': oid,
+            'attachmentId': info.get('id'),
+            'globalId': info.get('globalId'),
+            'name': info.get('name'),
+            'contentType': info.get('contentType'),
+            'size': info.get('size'),
+            'keywords': info.get('keywords'),
+            'path': relative.replace(os.sep, '/'),
+        }
+
+    def run(self, after=None, checkpoint=None):
+        # checkpoint(last_oid) is called once a batch is completely on
+        # disk; `after` skips the objectIds a previous run finished
+        object_ids = self.map_service.get_object_ids(self.layer, self.query)
+        if after is not None:
+            object_ids = [oid for oid in object_ids if oid > after]
+
+        pool = ThreadPool(self.workers)
+        try:
+            batches = chunks(object_ids, self.batch_size)
+            for last_oid, infos in ordered_map(self._infos, batches,
+                                               self.workers):
+                items = [(oid, info) for oid in sorted(infos)
+                         for info in infos[oid]]
+                rows = []
+                for (oid, info), (path, size) in zip(
+                        items, pool.map(self._fetch, items)):
+                    if size is None:
+                        self.skipped += 1
+                    else:
+                        self.downloaded += 1
+                        metrics.inc('attachment_bytes_total', size,
+                                    layer=self.label)
+                    rows.append(self._row(oid, info, path))
+
+                self.index.write(rows)
+                metrics.inc('attachments_total', len(rows), layer=self.label)
+                if checkpoint is not None:
+                    checkpoint(last_oid)
+        finally:
+            pool.terminate()
@@ -0,0 +1,204 @@
+import os
+import json
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+
+import requests
+from requests.structures import CaseInsensitiveDict
+from . import jsonlib
+from .files import atomic_write
+from .metrics import metrics
+
+# response headers kept with a cached body
+STORED_HEADERS = ('Content-Type', 'ETag', 'Last-Modified')
+
+# parameters that do not change the response
+IGNORED_PARAMS = ('token', )
+
+
+class CacheMiss(Exception):
+    # an offline request that is not in the cache
+    pass
+
+
+def cache_key(method, url, params=None):
+    # the same request gives the same key whatever order its parameters
+    # were given in, and whatever token it was sent with
+    items = sorted((str(key), str(value))
+                   for key, value in (params or {}).items()
+                   if key not in IGNORED_PARAMS)
+    data = json.dumps([method.upper(), url.rstrip('/'), items])
+    return hashlib.sha1(data.encode('utf-8')).hexdigest()
+
+
+def is_error(content):
+    # ArcGIS reports failures, like an expired token, as a 200 whose json
+    # body has a top-level error
+    if not content or not content.lstrip().startswith(b'{'):
+        return False
+    try:
+        return bool(jsonlib.loads(content).get('error'))
+    except Exception:
+        return False
+
+
+class ResponseCache:
+    # An on-disk cache of successful responses, keyed by method, url and
+    # parameters. Responses the server gave an ETag or Last-Modified are
+    # revalidated with a conditional request on every use, the others are
+    # reused for `ttl` seconds. Once the bodies outgrow max_size bytes the
+    # least recently used are evicted. Offline, every request is answered
+    # from the cache or fails with CacheMiss, no matter how old the entry.
+    def __init__(self, folder, max_size=1024 ** 3, ttl=3600, offline=False):
+        self.folder = folder
+        self.max_size = max_size
+        self.ttl = ttl
+        self.offline = offline
+        self.size = 0
+        # key -> body size, least recently used first
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._load()
+
+    def _path(self, key, extension):
+        return os.path.join(self.folder, key[:2], key + extension)
+
+    def _load(self):
+        if not os.path.exists(self.folder):
+            return
+        found = []
+        for root, _, files in os.walk(self.folder):
+            for name in files:
+                if not name.endswith('.json'):
+                    continue
+                meta_path = os.path.join(root, name)
+                body_path = meta_path[:-len('.json')] + '.body'
+                if os.path.exists(body_path):
+                    found.append((os.path.getmtime(meta_path),
+                                  name[:-len('.json')],
+                                  os.path.getsize(body_path)))
+        for _, key, size in sorted(found):
+            self._entries[key] = size
+            self.size += size
+
+    def get(self, key):
+        # (meta, body) of a cached response or None
+        try:
+            with open(self._path(key, '.json'), 'rb') as f:
+                meta = json.loads(f.read())
+            with open(self._path(key, '.body'), 'rb') as f:
+                body = f.read()
+        except (IOError, ValueError):
+            return None
+        self._touch(key)
+        return meta, body
+
+    def _touch(self, key):
+        # marks key used; the meta file's mtime survives the process
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+        try:
+            os.utime(self._path(key, '.json'))
+        except OSError:
+            pass
+
+    def put(self, key, response):
+        meta = {
+            'url': response.url,
+            'status': response.status_code,
+            'headers': dict((name, response.headers[name])
+                            for name in STORED_HEADERS
+                            if name in response.headers),
+            'stored': time.time(),
+        }
+        os.makedirs(os.path.dirname(self._path(key, '.body')), exist_ok=True)
+        # the body goes first, a meta file always has its body
+        atomic_write(self._path(key, '.body'), response.content)
+        atomic_write(self._path(key, '.json'), json.dumps(meta))
+
+        size = len(response.content)
+        with self._lock:
+            self.size += size - self._entries.pop(key, 0)
+            self._entries[key] = size
+            evicted = []
+            while self.size > self.max_size and len(self._entries) > 1:
+                old_key, old_size = self._entries.popitem(last=False)
+                self.size -= old_size
+                evicted.append(old_key)
+        for old_key in evicted:
+            self._remove(old_key)
+        if evicted:
+            metrics.inc('cache_evictions_total', len(evicted))
+        return meta
+
+    def _remove(self, key):
+        for extension in ('.json', '.body'):
+            try:
+                os.remove(self._path(key, extension))
+            except OSError:
+                pass
+
+    def _refresh(self, key, meta):
+        # a 304 restarts the entry's ttl
+        meta['stored'] = time.time()
+        atomic_write(self._path(key, '.json'), json.dumps(meta))
+
+    def _response(self, meta, body):
+        response = requests.Response()
+        response.status_code = meta['status']
+        response.url = meta['url']
+        response.headers = CaseInsensitiveDict(meta['headers'])
+        response._content = body
+        response.encoding = 'utf-8'
+        return response
+
+    def _validators(self, meta):
+        headers = {}
+        if meta['headers'].get('ETag'):
+            headers['If-None-Match'] = meta['headers']['ETag']
+        if meta['headers'].get('Last-Modified'):
+            headers['If-Modified-Since'] = meta['headers']['Last-Modified']
+        return headers
+
+    def request(self, method, url, kwargs, send):
+        # answers a requests.Session.request call, send(method, url,
+        # **kwargs) is the uncached request
+        if kwargs.get('stream'):
+            # downloads that are too big to keep
+            if self.offline:
+                raise CacheMiss("{} is not cached".format(url))
+            return send(method, url, **kwargs)
+
+        params = kwargs.get('params') or kwargs.get('data')
+        key = cache_key(method, url, params if isinstance(params, dict)
+                        else None)
+        cached = self.get(key)
+
+        if cached is not None:
+            meta, body = cached
+            validators = self._validators(meta)
+            if (self.offline or not validators and
+                    time.time() - meta['stored'] < self.ttl):
+                metrics.inc('cache_hits_total')
+                return self._response(meta, body)
+        elif self.offline:
+            metrics.inc('cache_misses_total')
+            raise CacheMiss("{} is not cached".format(url))
+
+        if cached is not None and validators:
+            kwargs = dict(kwargs, headers=dict(kwargs.get('headers') or {},
+                                               **validators))
+        response = send(method, url, **kwargs)
+
+        if cached is not None and response.status_code == 304:
+            metrics.inc('cache_revalidations_total')
+            self._refresh(key, meta)
+            return self._response(meta, body)
+
+        metrics.inc('cache_misses_total')
+        if response.status_code == 200 and not is_error(response.content):
+            self.put(key, response)
+        return response
@@ -0,0 +1,63 @@
+import os
+import json
+from . import jsonlib
+from .session import get_session
+
+try:
+    import yaml
+except ImportError:
+    yaml = None
+
+SERVICE_TYPES = ('MapServer', 'FeatureServer')
+
+
+def _get_json(url):
+    response = get_session().get(url, params={'f': 'json'})
+    response.raise_for_status()
+    return jsonlib.loads(response.content)
+
+
+def service_name(name, service_type):
+    # "Folder/Parcels" MapServer -> Folder/Parcels_MapServer, so a map and
+    # a feature service of the same name do not share a dump folder
+    return os.path.join(*name.split('/')) + '_' + service_type
+
+
+def crawl(services_url):
+    # Walks an ArcGIS Server services directory (.../arcgis/rest/services)
+    # and all of its folders, returning (name, url) of every MapServer and
+    # FeatureServer found.
+    root = services_url.rstrip('/')
+    services = []
+    folders = ['']
+
+    while folders:
+        folder = folders.pop(0)
+        jsobj = _get_json("/".join([root, folder]) if folder else root)
+
+        for sub_folder in jsobj.get('folders') or []:
+            folders.append("/".join([folder, sub_folder])
+                           if folder else sub_folder)
+
+        for service in jsobj.get('services') or []:
+            if service.get('type') not in SERVICE_TYPES:
+                continue
+            # service names already include their folder
+            url = "/".join([root, service['name'], service['type']])
+            services.append((service_name(service['name'], service['type']),
+                             url))
+
+    return services
+
+
+def load_services(path):
+    # a json or yaml list of {"name": ..., "url": ...}
+    with open(path) as f:
+        if path.endswith(('.yml', '.yaml')):
+            if yaml is None:
+                raise ValueError("PyYAML is needed to read {}".format(path))
+            entries = yaml.safe_load(f)
+        else:
+            entries = json.load(f)
+
+    return [(entry['name'], entry['url']) for entry in entries]
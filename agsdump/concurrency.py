@@ -0,0 +1,30 @@
+from collections import deque
+from multiprocessing.pool import ThreadPool
+
+
+def ordered_map(func, items, workers):
+    # Like map(), but runs func on up to `workers` items concurrently and
+    # still yields results in input order. Only a small window of results
+    # is kept in flight, so a slow consumer never buffers the whole input.
+    if workers <= 1:
+        for item in items:
+            yield func(item)
+        return
+
+    pool = ThreadPool(workers)
+    pending = deque()
+    try:
+        for item in items:
+            pending.append(pool.apply_async(func, (item, )))
+            if len(pending) >= workers * 2:
+                yield pending.popleft().get()
+
+        while pending:
+            yield pending.popleft().get()
+    finally:
+        pool.terminate()
+
+
+def chunks(items, size):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
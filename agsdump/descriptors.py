@@ -0,0 +1,57 @@
+import threading
+from collections import Counter
+from . import jsonlib
+from .session import get_session
+from .metrics import metrics
+
+
+class DescriptorCache:
+    # Layer and service descriptors never change during a dump, so every
+    # url is fetched once per run and shared by dump_styles and dump_data.
+    # Each url has its own lock: threads asking for the same descriptor
+    # wait for the one fetching it, different descriptors are fetched in
+    # parallel. Error bodies, which ArcGIS sends with a 200, are returned
+    # but not kept.
+    def __init__(self):
+        self._descriptors = {}
+        self._locks = {}
+        self._lock = threading.Lock()
+        self.fetch_count = Counter()
+
+    def _key(self, url):
+        return str(url).rstrip('/')
+
+    def get(self, url):
+        key = self._key(url)
+        descriptor = self._descriptors.get(key)
+        if descriptor is not None:
+            return descriptor
+
+        with self._lock:
+            lock = self._locks.setdefault(key, threading.Lock())
+        with lock:
+            descriptor = self._descriptors.get(key)
+            if descriptor is None:
+                params = {'f': 'json'}
+                with metrics.timer('descriptor'):
+                    response = get_session().get(key, params=params)
+                    response.raise_for_status()
+                    descriptor = jsonlib.loads(response.content)
+                self.fetch_count[key] += 1
+                if not descriptor.get('error'):
+                    self._descriptors[key] = descriptor
+            return descriptor
+
+    def invalidate(self, url=None):
+        # drop one descriptor, or everything when no url is given
+        with self._lock:
+            if url is None:
+                self._descriptors.clear()
+            else:
+                self._descriptors.pop(self._key(url), None)
+
+    def __contains__(self, url):
+        return self._key(url) in self._descriptors
+
+
+descriptor_cache = DescriptorCache()
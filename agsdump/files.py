@@ -0,0 +1,101 @@
+import io
+import os
+import gzip
+import tempfile
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+COMPRESSIONS = {
+    'gzip': '.gz',
+    'zstd': '.zst',
+}
+
+
+def fsync(f):
+    f.flush()
+    os.fsync(f.fileno())
+
+
+def atomic_write(path, data):
+    # write to a temporary file next to path and move it into place, so
+    # readers only ever see the old or the new content
+    folder = os.path.dirname(os.path.abspath(path))
+    if not isinstance(data, bytes):
+        data = data.encode('utf-8')
+    fd, tmp_path = tempfile.mkstemp(dir=folder, prefix='.tmp-')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+            fsync(f)
+        os.replace(tmp_path, path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+class ZstdFile:
+    # minimal file object streaming through a zstd frame
+    def __init__(self, path, mode='rb'):
+        if zstandard is None:
+            raise ValueError("zstandard is not installed")
+
+        self._file = open(path, mode)
+        self._writing = 'r' not in mode
+        if not self._writing:
+            self._stream = io.BufferedReader(
+                zstandard.ZstdDecompressor().stream_reader(self._file))
+        else:
+            self._stream = zstandard.ZstdCompressor().stream_writer(
+                self._file)
+
+    def write(self, data):
+        self._stream.write(data)
+
+    def __iter__(self):
+        return iter(self._stream)
+
+    def readline(self):
+        return self._stream.readline()
+
+    def flush(self):
+        self._stream.flush()
+        self._file.flush()
+
+    def fileno(self):
+        return self._file.fileno()
+
+    def close(self):
+        if self._file.closed:
+            return
+        if self._writing:
+            self._stream.flush(zstandard.FLUSH_FRAME)
+        self._file.flush()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def compression_of(path):
+    for compression, extension in COMPRESSIONS.items():
+        if path.endswith(extension) or path.endswith(extension + '.part'):
+            return compression
+    return None
+
+
+def open_file(path, mode='rb', compression=None):
+    # open path, compressing or decompressing on the fly; the compression
+    # is taken from the file extension unless given
+    compression = compression or compression_of(path)
+    if compression == 'gzip':
+        return gzip.open(path, mode)
+    if compression == 'zstd':
+        return ZstdFile(path, mode)
+    return open(path, mode)
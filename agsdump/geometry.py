@@ -0,0 +1,137 @@
+# Conversion of Esri JSON geometries to GeoJSON.
+#
+# Esri polygons are a flat list of rings: outer rings run clockwise and
+# holes counter-clockwise, and nothing says which hole belongs to which
+# outer ring. GeoJSON wants every hole grouped with its polygon and, per
+# RFC 7946, outer rings counter-clockwise and holes clockwise.
+
+
+def ring_area(ring):
+    # signed area, positive for counter-clockwise rings
+    area = 0.0
+    x0, y0 = ring[0][0], ring[0][1]
+    for coords in ring[1:]:
+        x1, y1 = coords[0], coords[1]
+        area += x0 * y1 - x1 * y0
+        x0, y0 = x1, y1
+    return area / 2.0
+
+
+def _bbox(ring):
+    xs = [c[0] for c in ring]
+    ys = [c[1] for c in ring]
+    return min(xs), min(ys), max(xs), max(ys)
+
+
+def point_in_ring(point, ring):
+    # even-odd ray casting
+    x, y = point[0], point[1]
+    inside = False
+    j = len(ring) - 1
+    for i in range(len(ring)):
+        xi, yi = ring[i][0], ring[i][1]
+        xj, yj = ring[j][0], ring[j][1]
+        if (yi > y) != (yj > y) and x < (xj - xi) * (y - yi) / float(
+                yj - yi) + xi:
+            inside = not inside
+        j = i
+    return inside
+
+
+def convert_polygon(rings):
+    rings = [ring for ring in rings if len(ring) >= 4]
+    if not rings:
+        return None
+    areas = [ring_area(ring) for ring in rings]
+
+    # [ring oriented counter-clockwise, area, bbox, holes]
+    outers = []
+    holes = []
+    for ring, area in zip(rings, areas):
+        if area < 0:
+            outers.append([ring[::-1], -area, None, []])
+        else:
+            holes.append(ring)
+
+    if not outers:
+        # no clockwise ring at all, treat every ring as a polygon
+        outers = [[ring, area, None, []] for ring, area in zip(rings, areas)]
+        holes = []
+
+    if holes:
+        for outer in outers:
+            outer[2] = _bbox(outer[0])
+
+    for hole in holes:
+        point = hole[0]
+        # nested islands: the smallest outer ring around the hole wins
+        owner = None
+        for outer in outers:
+            xmin, ymin, xmax, ymax = outer[2]
+            if not (xmin <= point[0] <= xmax and ymin <= point[1] <= ymax):
+                continue
+            if owner is not None and owner[1] <= outer[1]:
+                continue
+            if point_in_ring(point, outer[0]):
+                owner = outer
+        if owner is None:
+            # a hole outside every polygon is really a polygon itself
+            outers.append([hole, 0, _bbox(hole), []])
+        else:
+            owner[3].append(hole[::-1])
+
+    polygons = [[outer[0]] + outer[3] for outer in outers]
+
+    if len(polygons) == 1:
+        return {"type": "Polygon", "coordinates": polygons[0]}
+    return {"type": "MultiPolygon", "coordinates": polygons}
+
+
+def convert_polyline(paths):
+    paths = [path for path in paths if path]
+    if not paths:
+        return None
+    if len(paths) == 1:
+        return {"type": "LineString", "coordinates": paths[0]}
+    return {"type": "MultiLineString", "coordinates": paths}
+
+
+def convert_point(geometry):
+    x = geometry.get('x')
+    y = geometry.get('y')
+    if x is None or y is None or x == 'NaN':
+        return None
+
+    coordinates = [x, y]
+    if geometry.get('z') is not None:
+        coordinates.append(geometry.get('z'))
+    return {"type": "Point", "coordinates": coordinates}
+
+
+def convert_multipoint(points):
+    if not points:
+        return None
+    return {"type": "MultiPoint", "coordinates": points}
+
+
+def esri_to_geojson(geometry):
+    if not geometry:
+        return None
+    if 'rings' in geometry:
+        return convert_polygon(geometry['rings'])
+    if 'paths' in geometry:
+        return convert_polyline(geometry['paths'])
+    if 'points' in geometry:
+        return convert_multipoint(geometry['points'])
+    if 'x' in geometry:
+        return convert_point(geometry)
+    return None
+
+
+def features_to_geojson(features):
+    # Converts a page of Esri features
+    return [{
+        "type": "Feature",
+        "properties": feature.get('attributes'),
+        "geometry": esri_to_geojson(feature.get('geometry'))
+    } for feature in features]
@@ -0,0 +1,64 @@
+import json
+import hashlib
+import datetime
+from .writers import GeoJSONWriter
+
+# descriptor keys that change the dumped data or the generated sld
+DATA_KEYS = ('objectIdField', 'geometryType', 'fields')
+STYLE_KEYS = ('type', 'name', 'geometryType', 'drawingInfo', 'minScale',
+              'maxScale')
+
+
+def fingerprint(descriptor, keys):
+    content = dict((key, descriptor.get(key)) for key in keys)
+    return hashlib.sha1(
+        json.dumps(content, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+def last_edit_date(descriptor):
+    return (descriptor.get('editingInfo') or {}).get('lastEditDate')
+
+
+def edit_date_field(descriptor):
+    return (descriptor.get('editFieldsInfo') or {}).get('editDateField')
+
+
+def edited_since(field, timestamp):
+    # lastEditDate is in milliseconds since the epoch (UTC). Compare with >=
+    # since the where clause only has second precision, fetching a feature
+    # twice is harmless.
+    since = datetime.datetime.utcfromtimestamp(timestamp // 1000)
+    return "{} >= timestamp '{}'".format(field,
+                                         since.strftime('%Y-%m-%d %H:%M:%S'))
+
+
+def merge_changes(map_service, layer_id, layer_file, query, changes,
+                  writer_class=GeoJSONWriter, workers=1, metadata=None):
+    # Rewrites layer_file with the features matching the `changes` where
+    # clause fetched again, and features no longer on the server (or no
+    # longer matching `query`) dropped. Both the existing file and the
+    # changes are in objectId order, so they are merged as streams and
+    # only the changed features are kept in memory.
+    oid_field = map_service.get_object_id_field(layer_id)
+    current_ids = set(map_service.get_object_ids(layer_id, query))
+
+    changed = {}
+    for last_oid, features in map_service.iter_batches(
+            layer_id, query.and_where(changes), workers=workers):
+        for feature in features:
+            changed[feature['properties'].get(oid_field)] = feature
+    pending = sorted(changed)
+
+    with writer_class(layer_file, metadata=metadata) as writer:
+        i = 0
+        for feature in writer_class.read(layer_file):
+            oid = feature['properties'].get(oid_field)
+            while i < len(pending) and pending[i] < oid:
+                writer.write([changed[pending[i]]])
+                i += 1
+            if oid in changed or oid not in current_ids:
+                continue
+            writer.write([feature])
+        writer.write([changed[key] for key in pending[i:]])
+
+    return writer.count, len(changed)
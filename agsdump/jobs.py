@@ -0,0 +1,78 @@
+import sys
+import time
+import traceback
+from multiprocessing.pool import ThreadPool
+from .metrics import metrics
+
+
+class LayerJob:
+    # Collects the console output of one layer so that layers processed
+    # concurrently still print as one uninterrupted block.
+    def __init__(self, layer, echo=False, name=None):
+        self.layer_id = layer.get('id')
+        self.layer_name = layer.get('name')
+        self.label = ("{}/{}".format(name, self.layer_id) if name
+                      else str(self.layer_id))
+        self.lines = []
+        self.error = None
+        self.duration = None
+        self._echo = echo
+
+    @property
+    def failed(self):
+        return self.error is not None
+
+    def log(self, message):
+        if self._echo:
+            print(message)
+        else:
+            self.lines.append(message)
+
+    def flush(self):
+        for line in self.lines:
+            print(line)
+        self.lines = []
+        sys.stdout.flush()
+
+
+def run_layer_jobs(func, layers, jobs=1, name=None):
+    # Runs func(layer, job) for every layer on `jobs` threads. A failing
+    # layer is reported and skipped, it never aborts the others. `name`
+    # labels the layers in the run report.
+    def run(layer):
+        job = LayerJob(layer, echo=jobs <= 1, name=name)
+        start = time.time()
+        try:
+            func(layer, job)
+        except Exception as exc:
+            job.error = "{}: {}".format(type(exc).__name__, exc)
+            job.log(traceback.format_exc().rstrip())
+        job.duration = time.time() - start
+        metrics.observe('layer_seconds', job.duration, layer=job.label)
+        return job
+
+    results = []
+    if jobs <= 1:
+        results = [run(layer) for layer in layers]
+    else:
+        pool = ThreadPool(jobs)
+        try:
+            for job in pool.imap_unordered(run, layers):
+                job.flush()
+                results.append(job)
+        finally:
+            pool.terminate()
+
+    print_summary(results)
+    return results
+
+
+def print_summary(results):
+    failed = [job for job in results if job.failed]
+
+    print("\nSummary: {} layers, {} failed".format(len(results),
+                                                   len(failed)))
+    for job in sorted(results, key=lambda job: job.layer_id):
+        status = "failed ({})".format(job.error) if job.failed else "ok"
+        print("  {} {}: {} in {:.1f}s".format(job.layer_id, job.layer_name,
+                                              status, job.duration))
@@ -0,0 +1,44 @@
+import json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgspec
+except ImportError:
+    msgspec = None
+
+
+def _stdlib_dumps(obj):
+    return json.dumps(obj, separators=(',', ':')).encode('utf-8')
+
+
+# name: (loads, dumps); loads takes bytes or str, dumps returns utf-8 bytes
+BACKENDS = {
+    'json': (json.loads, _stdlib_dumps),
+}
+if msgspec is not None:
+    BACKENDS['msgspec'] = (msgspec.json.decode, msgspec.json.encode)
+if orjson is not None:
+    BACKENDS['orjson'] = (orjson.loads, orjson.dumps)
+
+# fastest first
+PREFERENCE = ('orjson', 'msgspec', 'json')
+
+backend = None
+loads = None
+dumps = None
+
+
+def use(name):
+    # switch every feature page and output file to another backend
+    global backend, loads, dumps
+    if name not in BACKENDS:
+        raise ValueError("json backend {} is not installed".format(name))
+    backend = name
+    loads, dumps = BACKENDS[name]
+
+
+use([name for name in PREFERENCE if name in BACKENDS][0])
@@ -1,17 +1,29 @@
 import os
-import sld
-import json
+import errno
 import base64
-import requests
-import lxml.etree
 from slugify import slugify
-
-class Layer(object):
-    def __init__(self, service_url, layer_id, dump_folder=None):
+from . import sldbuilder
+from .sldbuilder import SLD, OGC, sub, css
+from .descriptors import descriptor_cache
+from .session import get_session
+from .symbols import IconStore, SymbolizerCache
+from .metrics import metrics
+
+def _print(message):
+    print(message)
+
+class Layer:
+    def __init__(self, service_url, layer_id, dump_folder=None, log=None,
+                 icons=None, symbolizers=None):
         self.service_url = service_url
         self.layer_id = str(layer_id)
-        self.sld_doc = sld.StyledLayerDescriptor()
+        self.sld_doc = sldbuilder.document()
         self._dump_folder = dump_folder
+        self.log = log or _print
+
+        # shared between the layers of a dump_styles run
+        self._icons = icons
+        self.symbolizers = symbolizers or SymbolizerCache()
 
         self._renderers = {
             'simple': self._render_esriSimple,
@@ -49,11 +61,15 @@ class Layer(object):
 
         return self._dump_folder
 
+    @property
+    def icons(self):
+        if self._icons is None:
+            self._icons = IconStore(self.dump_folder)
+        return self._icons
+
     @property
     def descriptor(self):
-        params = {'f': 'json'}
-        response = requests.get(self._url, params=params)
-        return json.loads(response.text)
+        return descriptor_cache.get(self._url)
 
     @property
     def name(self):
@@ -95,9 +111,8 @@ class Layer(object):
                                           self._convert_esriStyleDefault)
 
     def _parse_drawingInfo(self):
-        namedLayer = self.sld_doc.create_namedlayer(self.name)
-        userStyle = namedLayer.create_userstyle()
-        featureTypeStyle = userStyle.create_featuretypestyle()
+        featureTypeStyle = sldbuilder.feature_type_style(self.sld_doc,
+                                                         self.name)
 
         renderer_type = self.renderer.get('type')
 
@@ -117,8 +132,7 @@ class Layer(object):
             symbol = labelRule.get('symbol')
             symbolType = symbol.get('type')
 
-            rule = featureTypeStyle.create_rule("Labels")
-            del rule.PointSymbolizer
+            rule = sldbuilder.rule(featureTypeStyle, "Labels")
 
             converter = self._determine_type_converter(symbolType)
             converter(rule, labelExpression, labelPlacement, symbol)
@@ -126,17 +140,12 @@ class Layer(object):
     def _render_esriSimple(self, featureTypeStyle):
         scales = self._convert_esriScales()
 
-        rule = featureTypeStyle.create_rule(
-            self.name,
-            MinScaleDenominator=scales.get('max_scale'),
-            MaxScaleDenominator=scales.get('min_scale'))
-        del rule.PointSymbolizer
+        rule = sldbuilder.rule(featureTypeStyle, self.name,
+                               scales.get('max_scale'),
+                               scales.get('min_scale'))
 
         symbol = self.renderer.get('symbol')
-        symbol_type = symbol.get('type')
-
-        type_converter = self._determine_type_converter(symbol_type)
-        type_converter(rule, symbol)
+        self._convert_symbol(rule, symbol)
 
     def _render_uniqueValue(self, featureTypeStyle):
         field1 = self.renderer.get('field1')
@@ -147,19 +156,13 @@ class Layer(object):
             rule_label = uniqueValue.get('label')
             rule_value = uniqueValue.get('value')
 
-            rule = featureTypeStyle.create_rule(
-                rule_label,
-                MinScaleDenominator=scales.get('max_scale'),
-                MaxScaleDenominator=scales.get('min_scale'))
-            del rule.PointSymbolizer
-
-            rule.create_filter(field1, '==', rule_value)
+            rule = sldbuilder.rule(
+                featureTypeStyle, rule_label,
+                scales.get('max_scale'), scales.get('min_scale'),
+                [sldbuilder.comparison('==', field1, rule_value)])
 
             symbol = uniqueValue.get('symbol')
-            symbol_type = symbol.get('type')
-
-            type_converter = self._determine_type_converter(symbol_type)
-            type_converter(rule, symbol)
+            self._convert_symbol(rule, symbol)
 
     def _render_classBreaks(self, featureTypeStyle):
         field = self.renderer.get('field')
@@ -171,56 +174,58 @@ class Layer(object):
             rule_label = classBreakInfo.get('label')
             classMaxValue = str(classBreakInfo.get('classMaxValue'))
 
-            rule = featureTypeStyle.create_rule(
-                rule_label,
-                MinScaleDenominator=scales.get('max_scale'),
-                MaxScaleDenominator=scales.get('min_scale'))
-            del rule.PointSymbolizer
-
-            filter1 = sld.Filter(rule)
-            filter1.PropertyIsGreaterThanOrEqualTo = sld.PropertyCriterion(
-                filter1, 'PropertyIsGreaterThanOrEqualTo')
-            filter1.PropertyIsGreaterThanOrEqualTo.PropertyName = field
-            filter1.PropertyIsGreaterThanOrEqualTo.Literal = minValue
-
-            filter2 = sld.Filter(rule)
-            filter2.PropertyIsLessThanOrEqualTo = sld.PropertyCriterion(
-                filter2, 'PropertyIsLessThanOrEqualTo')
-            filter2.PropertyIsLessThanOrEqualTo.PropertyName = field
-            filter2.PropertyIsLessThanOrEqualTo.Literal = classMaxValue
-
-            rule.Filter = filter1 + filter2
+            rule = sldbuilder.rule(
+                featureTypeStyle, rule_label,
+                scales.get('max_scale'), scales.get('min_scale'),
+                [sldbuilder.comparison('>=', field, minValue),
+                 sldbuilder.comparison('<=', field, classMaxValue)])
             minValue = classMaxValue
 
             symbol = classBreakInfo.get('symbol')
-            symbol_type = symbol.get('type')
-
-            converter = self._determine_type_converter(symbol_type)
-            converter(rule, symbol)
+            self._convert_symbol(rule, symbol)
 
     def _render_default(self, featureTypeStyle):
+        # the symbolizers python-sld gave a rule by default
         scales = self._convert_esriScales()
+        kind = self._default_symbolizers.get(self.geometryType)
+        if kind is None:
+            return
 
-        if self.geometryType == "esriGeometryPoint":
-            rule = featureTypeStyle.create_rule(
-                self.name,
-                symbolizer=sld.PointSymbolizer,
-                MinScaleDenominator=scales.get('max_scale'),
-                MaxScaleDenominator=scales.get('min_scale'))
-
-        elif self.geometryType == "esriGeometryPolyline":
-            rule = featureTypeStyle.create_rule(
-                self.name,
-                symbolizer=sld.LineSymbolizer,
-                MinScaleDenominator=scales.get('max_scale'),
-                MaxScaleDenominator=scales.get('min_scale'))
-
-        elif self.geometryType == "esriGeometryPolygon":
-            rule = featureTypeStyle.create_rule(
-                self.name,
-                symbolizer=sld.PolygonSymbolizer,
-                MinScaleDenominator=scales.get('max_scale'),
-                MaxScaleDenominator=scales.get('min_scale'))
+        rule = sldbuilder.rule(featureTypeStyle, self.name,
+                               scales.get('max_scale'),
+                               scales.get('min_scale'))
+        symbolizer = sldbuilder.symbolizer(rule, kind)
+
+        if kind == 'Point':
+            mark = sub(sub(symbolizer, SLD + 'Graphic'), SLD + 'Mark')
+            sub(mark, SLD + 'WellKnownName', 'square')
+            css(sub(mark, SLD + 'Fill'), 'fill', '#ff0000')
+
+        elif kind == 'Line':
+            css(sub(symbolizer, SLD + 'Stroke'), 'stroke', '#0000ff')
+
+        else:
+            css(sub(symbolizer, SLD + 'Fill'), 'fill', '#AAAAAA')
+            stroke = sub(symbolizer, SLD + 'Stroke')
+            css(stroke, 'stroke', '#000000')
+            css(stroke, 'stroke-width', '1')
+
+    _default_symbolizers = {
+        'esriGeometryPoint': 'Point',
+        'esriGeometryPolyline': 'Line',
+        'esriGeometryPolygon': 'Polygon',
+    }
+
+    def _convert_symbol(self, rule, symbol):
+        nodes = self.symbolizers.get(symbol)
+        if nodes is not None:
+            rule.extend(nodes)
+            return
+
+        converted = len(rule)
+        type_converter = self._determine_type_converter(symbol.get('type'))
+        type_converter(rule, symbol)
+        self.symbolizers.put(symbol, list(rule)[converted:])
 
     def _convert_esriScales(self):
         min_scale = self.descriptor.get('minScale')
@@ -239,54 +244,57 @@ class Layer(object):
         return {'min_scale': min_scale, 'max_scale': max_scale}
 
     def _convert_esriPMS(self, rule, symbol, img_type='img'):
-        symbolizer = rule.create_symbolizer('Point')
-        graphic = symbolizer.create_element("sld", 'Graphic')
-        externalGraphic = graphic.create_element("sld", "ExternalGraphic")
+        symbolizer = sldbuilder.symbolizer(rule, 'Point')
+        graphic = sub(symbolizer, SLD + 'Graphic')
+        externalGraphic = sub(graphic, SLD + 'ExternalGraphic')
 
         symbol_size = str(symbol.get('width'))
         symbol_contentType = symbol.get('contentType')
-        base64data = symbol.get('imageData')
+        base64data = symbol.get('imageData') or self._symbol_image(symbol)
 
         sld_icon_format = None
         icon_ext = None
-        icon_name = slugify(rule.Title).replace("-", "_")
         if img_type == 'img':
             icon_ext = symbol_contentType.split('/')[1]
             sld_icon_format = "image/{}".format(icon_ext)
         else:
             icon_ext = "svg"
             sld_icon_format = "image/svg+xml"
-            graphic.Size = symbol_size
+            sub(graphic, SLD + 'Size', symbol_size)
 
-        icon_file_name = os.path.join(self.name, "{}.{}".format(
-            icon_name, icon_ext))
-        icon_file_path = os.path.join(self.dump_folder, icon_file_name)
-        self.dump_icon_file(icon_file_path, base64data)
+        icon_file_name = self.icons.add(base64data, icon_ext,
+                                        self.dump_icon_file)
 
-        externalGraphic.create_online_resource(icon_file_name)
-        externalGraphic.Format = sld_icon_format
+        sldbuilder.online_resource(externalGraphic, icon_file_name)
+        sub(externalGraphic, SLD + 'Format', sld_icon_format)
+
+    def _symbol_image(self, symbol):
+        # picture symbols without inline imageData reference the layer's
+        # images resource instead
+        url = self.urljoin(self._url, 'images', symbol.get('url'))
+        response = get_session().get(url)
+        response.raise_for_status()
+        return base64.b64encode(response.content).decode('ascii')
 
     def _convert_esriSFS(self, rule, symbol):
-        symbolizer = rule.create_symbolizer('Polygon')
+        symbolizer = sldbuilder.symbolizer(rule, 'Polygon')
 
         fill_color = symbol.get('color')
         if fill_color:
-            fill = symbolizer.create_fill()
+            fill = sub(symbolizer, SLD + 'Fill')
             fill_opacity = str(fill_color[3] / 255)
-            fill.create_cssparameter('fill', self._convert_color(fill_color))
-            fill.create_cssparameter('fill-opacity', fill_opacity)
+            css(fill, 'fill', self._convert_color(fill_color))
+            css(fill, 'fill-opacity', fill_opacity)
 
         stroke_color = symbol.get('outline').get('color')
         if stroke_color:
-            stroke = symbolizer.create_stroke()
+            stroke = sub(symbolizer, SLD + 'Stroke')
             stroke_width = str(symbol.get('outline').get('width'))
 
-            stroke.create_cssparameter('stroke',
-                                       self._convert_color(stroke_color))
-            stroke.create_cssparameter('stroke-width', stroke_width)
-            stroke.create_cssparameter('stroke-linejoin', 'bevel')
-            stroke.create_cssparameter('stroke-opacity',
-                                       str(stroke_color[3] / 255))
+            css(stroke, 'stroke', self._convert_color(stroke_color))
+            css(stroke, 'stroke-width', stroke_width)
+            css(stroke, 'stroke-linejoin', 'bevel')
+            css(stroke, 'stroke-opacity', str(stroke_color[3] / 255))
 
         symbol_style = symbol.get('style')
         style_converter = self._determine_style_converter(symbol_style)
@@ -303,102 +311,100 @@ class Layer(object):
             stroke_width = str(outline.get('width'))
             stroke_style = outline.get('style')
 
-        symbolizer = rule.create_symbolizer('Line')
-        stroke = symbolizer.create_stroke()
+        symbolizer = sldbuilder.symbolizer(rule, 'Line')
+        stroke = sub(symbolizer, SLD + 'Stroke')
 
-        stroke.create_cssparameter('stroke', self._convert_color(stroke_color))
-        stroke.create_cssparameter('stroke-width', stroke_width)
-        stroke.create_cssparameter('stroke-linejoin', 'bevel')
+        css(stroke, 'stroke', self._convert_color(stroke_color))
+        css(stroke, 'stroke-width', stroke_width)
+        css(stroke, 'stroke-linejoin', 'bevel')
 
         style_converter = self._determine_style_converter(stroke_style)
         style_converter(symbolizer, symbol)
 
     def _convert_esriSMS(self, rule, symbol):
-        symbolizer = rule.create_symbolizer('Point')
+        symbolizer = sldbuilder.symbolizer(rule, 'Point')
 
         symbol_style = symbol.get('style')
         style_converter = self._determine_style_converter(symbol_style)
         style_converter(symbolizer, symbol)
 
     def _convert_esriTS(self, rule, labelExpression, labelPlacement, symbol):
-        symbolizer = rule.create_symbolizer('Text')
+        symbolizer = sldbuilder.symbolizer(rule, 'Text')
 
-        label = symbolizer.create_label()
-        label.PropertyName = labelExpression
+        label = sub(symbolizer, SLD + 'Label')
+        sub(label, OGC + 'PropertyName', labelExpression)
 
-        fill = symbolizer.create_fill()
+        fill = sub(symbolizer, SLD + 'Fill')
 
         fill_color = symbol.get('color')
         fill_opacity = str(fill_color[3] / 255)
 
-        fill.create_cssparameter('fill', self._convert_color(fill_color))
-        fill.create_cssparameter('fill-opacity', fill_opacity)
+        css(fill, 'fill', self._convert_color(fill_color))
+        css(fill, 'fill-opacity', fill_opacity)
 
         agsfont = symbol.get('font')
         font_family = agsfont.get('family')
         font_size = str(agsfont.get('size'))
         font_style = agsfont.get('style')
         font_weight = agsfont.get('weight')
-        font_decoration = agsfont.get('decoration')
 
-        font = symbolizer.create_font()
-        font.create_cssparameter('font-family', font_family)
-        font.create_cssparameter('font-size', font_size)
-        font.create_cssparameter('font-style', font_style)
-        font.create_cssparameter('font-weight', font_weight)
+        font = sub(symbolizer, SLD + 'Font')
+        css(font, 'font-family', font_family)
+        css(font, 'font-size', font_size)
+        css(font, 'font-style', font_style)
+        css(font, 'font-weight', font_weight)
 
         if symbol.get('haloSize'):
-            halo = symbolizer.create_halo()
+            halo = sub(symbolizer, SLD + 'Halo')
             halo_size = str(symbol.get('haloSize'))
-            halo.Radius = halo_size
+            sub(halo, SLD + 'Radius', halo_size)
 
-            halo_fill = halo.create_fill()
+            halo_fill = sub(halo, SLD + 'Fill')
             halo_fill_color = symbol.get('haloColor')
-            halo_fill_opacity = str(halo_fill_color[3] / 255)
-            halo_fill.create_cssparameter('fill',
-                                          self._convert_color(halo_fill_color))
+            css(halo_fill, 'fill', self._convert_color(halo_fill_color))
 
         verticalAlignment = symbol.get('verticalAlignment')
         horizontalAlignment = symbol.get('horizontalAlignment')
 
-        label_placement = symbolizer.create_label_placement()
-        point_placement = label_placement.create_point_placement()
-        anchor_point = point_placement.create_anchor_point()
+        label_placement = sub(symbolizer, SLD + 'LabelPlacement')
+        point_placement = sub(label_placement, SLD + 'PointPlacement')
+        anchor_point = sub(point_placement, SLD + 'AnchorPoint')
 
         if horizontalAlignment == "left":
-            anchor_point.AnchorPointX = "0.0"
+            sub(anchor_point, SLD + 'AnchorPointX', "0.0")
         elif horizontalAlignment == "center":
-            anchor_point.AnchorPointX = "0.5"
+            sub(anchor_point, SLD + 'AnchorPointX', "0.5")
         else:
-            anchor_point.AnchorPointX = "1.0"
+            sub(anchor_point, SLD + 'AnchorPointX', "1.0")
 
         if verticalAlignment == "bottom" or verticalAlignment == "baseline":
-            anchor_point.AnchorPointY = "0.0"
+            sub(anchor_point, SLD + 'AnchorPointY', "0.0")
         elif verticalAlignment == "center":
-            anchor_point.AnchorPointY = "0.5"
+            sub(anchor_point, SLD + 'AnchorPointY', "0.5")
         else:
-            anchor_point.AnchorPointY = "1.0"
+            sub(anchor_point, SLD + 'AnchorPointY', "1.0")
 
     def _convert_esriTypeDefault(self, rule, symbol):
         pass
 
     def _convert_esriSMSCircle(self, symbolizer, symbol):
-        graphic = symbolizer.create_element("sld", 'Graphic')
-        graphic.Size = str(symbol.get('size'))
+        graphic = sub(symbolizer, SLD + 'Graphic')
+        sub(graphic, SLD + 'Size', str(symbol.get('size')))
 
-        mark = graphic.create_element("sld", "Mark")
-        mark.WellKnownName = "circle"
+        mark = sub(graphic, SLD + 'Mark')
+        sub(mark, SLD + 'WellKnownName', "circle")
 
-        fill = mark.create_fill()
+        fill = sub(mark, SLD + 'Fill')
         fill_color = symbol.get('color')
         fill_opacity = str(fill_color[3] / 255)
 
-        fill.create_cssparameter('fill', self._convert_color(fill_color))
-        fill.create_cssparameter('fill-opacity', fill_opacity)
+        css(fill, 'fill', self._convert_color(fill_color))
+        css(fill, 'fill-opacity', fill_opacity)
 
     def _convert_esriSLSDash(self, symbolizer, symbol):
-        symbolizer.Stroke.create_cssparameter('stroke-linecap', 'square')
-        symbolizer.Stroke.create_cssparameter('stroke-dasharray', '4 2')
+        stroke = symbolizer.find(SLD + 'Stroke')
+        css(stroke, 'stroke-linecap', 'square')
+        css(stroke, 'stroke-dasharray', '4 2')
 
     def _convert_esriSLSDashDotDot(self, symbolizer, symbol):
         pass
@@ -410,18 +416,18 @@ class Layer(object):
         pass
 
     def _convert_esriStyleDefault(self, symbolizer, symbol):
-        graphic = symbolizer.create_element("sld", 'Graphic')
-        graphic.Size = str(symbol.get('size'))
+        graphic = sub(symbolizer, SLD + 'Graphic')
+        sub(graphic, SLD + 'Size', str(symbol.get('size')))
 
-        mark = graphic.create_element("sld", "Mark")
-        mark.WellKnownName = "dot"
+        mark = sub(graphic, SLD + 'Mark')
+        sub(mark, SLD + 'WellKnownName', "dot")
 
-        fill = mark.create_fill()
+        fill = sub(mark, SLD + 'Fill')
         fill_color = symbol.get('color')
         fill_opacity = str(fill_color[3] / 255)
 
-        fill.create_cssparameter('fill', self._convert_color(fill_color))
-        fill.create_cssparameter('fill-opacity', fill_opacity)
+        css(fill, 'fill', self._convert_color(fill_color))
+        css(fill, 'fill-opacity', fill_opacity)
 
     def _convert_color(self, color):
         r, g, b, a = color
@@ -447,38 +453,34 @@ class Layer(object):
 
             endSvgTag = """</svg>"""
             base64String = '<image xlink:href="data:image/png;base64,{0}" width="240" height="240" x="0" y="0" />'.format(
-                base64data.decode('utf-8'))
-            data = startSvgTag + base64String + endSvgTag
+                base64data)
+            data = (startSvgTag + base64String + endSvgTag).encode('utf-8')
         else:
             data = base64.b64decode(base64data.encode())
-        with open(icon_file, "wb") as fh:
+        with metrics.timer('icon'), open(icon_file, "wb") as fh:
             fh.write(data)
 
-        print("  {}".format(os.path.basename(icon_file)))
+        self.log("  {}".format(os.path.basename(icon_file)))
 
-    def dump_sld_file(self):
+    @property
+    def sld_file_path(self):
+        sld_file = "{}.{}".format(self.name, "sld")
+        return os.path.join(self.dump_folder, sld_file)
 
-        self.parse()
+    def dump_sld_file(self):
 
-        sld_name = self.name
-        sld_file = "{}.{}".format(sld_name, "sld")
-        sld_file_path = os.path.join(self.dump_folder, sld_file)
+        with metrics.timer('sld'):
+            self.parse()
+            data = sldbuilder.tostring(self.sld_doc)
 
-        self.sld_doc.normalize()
+        sld_file_path = self.sld_file_path
 
-        with open(sld_file_path, 'w') as the_file:
-            the_file.write(
-                lxml.etree.tostring(
-                    self.sld_doc._node,
-                    pretty_print=True,
-                    encoding="UTF-8",
-                    xml_declaration=True))
-        # TODO: use logger instead of print function
-        print("  {}".format(os.path.basename(sld_file_path)))
+        with open(sld_file_path, 'wb') as the_file:
+            the_file.write(data)
+        self.log("  {}".format(os.path.basename(sld_file_path)))
 
     def parse(self):
         if self.descriptor.get('type') == "Feature Layer":
             self._parse_drawingInfo()
         else:
-            # TODO: use logger instead of print function
-            print("  {} not parsed...".format(self.descriptor.get('type')))
\ No newline at end of file
+            self.log("  {} not parsed...".format(self.descriptor.get('type')))
\ No newline at end of file
@@ -0,0 +1,37 @@
+import os
+import json
+import threading
+from .files import atomic_write
+
+
+class Manifest:
+    # Per-layer progress of a dump, stored next to the dumped files and
+    # rewritten atomically on every update so that a crashed run can be
+    # picked up where it stopped.
+    filename = '.agsdump.json'
+
+    def __init__(self, folder):
+        self.path = os.path.join(folder, self.filename)
+        self.layers = {}
+        self._lock = threading.Lock()
+
+        if os.path.exists(self.path):
+            with open(self.path) as f:
+                self.layers = json.load(f).get('layers', {})
+
+    def get(self, layer_id):
+        return dict(self.layers.get(str(layer_id), {}))
+
+    def update(self, layer_id, **values):
+        with self._lock:
+            self.layers.setdefault(str(layer_id), {}).update(values)
+            self._save()
+
+    def reset(self, layer_id, **values):
+        with self._lock:
+            self.layers[str(layer_id)] = values
+            self._save()
+
+    def _save(self):
+        data = json.dumps({'layers': self.layers}, indent=2, sort_keys=True)
+        atomic_write(self.path, data)
@@ -1,18 +1,400 @@
+import time
+import asyncio
+from contextlib import nullcontext
+
 import requests
-import json
+from . import aio
+from . import jsonlib
+from . import quadtree
+from .session import get_session
+from .descriptors import descriptor_cache
+from .concurrency import ordered_map, chunks
+from .adaptive import PageSizer, ConcurrencyLimiter, adaptive_chunks
+from .geometry import features_to_geojson
+from .query import QueryOptions
+from .metrics import metrics
+
+class ServerError(Exception):
+    # an error the server reported in the body of a 200 response
+    pass
+
+
+# failures that a smaller page may not run into
+SPLIT_ERRORS = (requests.Timeout, requests.ConnectionError, ServerError)
+ASYNC_SPLIT_ERRORS = (asyncio.TimeoutError, aio.ClientError, ServerError)
 
-from arcgis import ArcGIS
 
-class MapService(ArcGIS):
-    def __init__(self, url):
-        ArcGIS.__init__(self, url)
+class MapService:
+    # A MapServer or FeatureServer. Descriptors, counts and objectIds are
+    # fetched with the shared requests session. iter_batches downloads
+    # the feature pages on the asyncio core when aiohttp is installed and
+    # no response cache is used, and on threads otherwise.
+    def __init__(self, url, token=None, object_id_field='OBJECTID'):
+        self.url = url
+        self.token = token
+        self.object_id_field = object_id_field
+
+    def _build_request(self, layer):
+        return "{}/{}".format(self.url.rstrip('/'), layer)
+
+    def _build_query_request(self, layer, operation='query'):
+        return "{}/{}".format(self._build_request(layer), operation)
+
+    def get_attachment_url(self, layer, object_id, attachment_id):
+        return "{}/{}/attachments/{}".format(self._build_request(layer),
+                                             object_id, attachment_id)
 
     @property
     def descriptor(self):
-        params = {'f': 'json'}
-        response = requests.get(self.url, params=params)
-        return json.loads(response.text)
+        return descriptor_cache.get(self.url)
 
     @property
     def layers(self):
-        return self.descriptor.get('layers')
\ No newline at end of file
+        return self.descriptor.get('layers')
+
+    def get_descriptor_for_layer(self, layer):
+        return descriptor_cache.get(self._build_request(layer))
+
+    def get_object_id_field(self, layer):
+        descriptor = self.get_descriptor_for_layer(layer)
+        if descriptor.get('objectIdField'):
+            return descriptor.get('objectIdField')
+
+        for field in descriptor.get('fields') or []:
+            if field.get('type') == 'esriFieldTypeOID':
+                return field.get('name')
+
+        return self.object_id_field
+
+    def get_max_record_count(self, layer):
+        descriptor = self.get_descriptor_for_layer(layer)
+        return descriptor.get('maxRecordCount') or 1000
+
+    def supports_pagination(self, layer):
+        descriptor = self.get_descriptor_for_layer(layer)
+        capabilities = descriptor.get('advancedQueryCapabilities') or {}
+        return bool(capabilities.get('supportsPagination'))
+
+    def get_extent(self, layer, query=None):
+        # the box and spatial reference quadtree cells are cut from: the
+        # query's bbox, or else the layer's extent
+        query = query or QueryOptions()
+        if query.bbox:
+            return query.bbox, query.bbox_sr
+        extent = self.get_descriptor_for_layer(layer).get('extent') or {}
+        bbox = [extent.get(key) for key in ('xmin', 'ymin', 'xmax', 'ymax')]
+        if not quadtree.valid_bbox(bbox):
+            # empty layers and tables
+            return None, None
+        spatial_reference = extent.get('spatialReference') or {}
+        return bbox, (spatial_reference.get('latestWkid') or
+                      spatial_reference.get('wkid'))
+
+    def has_attachments(self, layer):
+        return bool(self.get_descriptor_for_layer(layer).get('hasAttachments'))
+
+    def supports_query_attachments(self, layer):
+        descriptor = self.get_descriptor_for_layer(layer)
+        capabilities = descriptor.get('advancedQueryCapabilities') or {}
+        return bool(capabilities.get('supportsQueryAttachments'))
+
+    def _params(self, params):
+        params = dict(params, f='json')
+        if self.token:
+            params['token'] = self.token
+        return params
+
+    def _request(self, layer, params, method='get', operation='query'):
+        params = self._params(params)
+        url = self._build_query_request(layer, operation)
+        if method == 'post':
+            # objectIds lists quickly outgrow the maximum url length
+            response = get_session().post(url, data=params)
+        else:
+            response = get_session().get(url, params=params)
+        response.raise_for_status()
+        return response
+
+    def _parse(self, response):
+        jsobj = jsonlib.loads(response.content)
+        if jsobj.get('error'):
+            error = jsobj['error']
+            raise ServerError("{} {}".format(error.get('code'),
+                                             error.get('message')))
+        return jsobj
+
+    def query(self, layer, params, method='get', operation='query'):
+        return self._parse(self._request(layer, params, method, operation))
+
+    def get_count(self, layer, query=None):
+        query = query or QueryOptions()
+        params = dict(query.filter_params(), returnCountOnly=True)
+        return self.query(layer, params).get('count')
+
+    def get_object_ids(self, layer, query=None):
+        query = query or QueryOptions()
+        params = dict(query.filter_params(), returnIdsOnly=True)
+        with metrics.timer('ids'):
+            jsobj = self.query(layer, params)
+        return sorted(jsobj.get('objectIds') or [])
+
+    def get_attachment_infos(self, layer, object_ids):
+        # {objectId: [attachmentInfo, ...]} of the features that have any.
+        # One queryAttachments request covers all of object_ids, servers
+        # without it are asked feature by feature.
+        if self.supports_query_attachments(layer):
+            params = {'objectIds': ",".join(str(oid) for oid in object_ids)}
+            jsobj = self.query(layer, params, method='post',
+                               operation='queryAttachments')
+            return dict((group.get('parentObjectId'),
+                         group.get('attachmentInfos') or [])
+                        for group in jsobj.get('attachmentGroups') or []
+                        if group.get('attachmentInfos'))
+
+        infos = {}
+        for oid in object_ids:
+            jsobj = self.query(layer, {},
+                               operation='{}/attachments'.format(oid))
+            if jsobj.get('attachmentInfos'):
+                infos[oid] = jsobj['attachmentInfos']
+        return infos
+
+    def get_features(self, layer, object_ids, query=None, sizer=None,
+                     limiter=None):
+        query = query or QueryOptions()
+        oid_field = self.get_object_id_field(layer)
+        features = self._fetch_features(layer, object_ids, query, oid_field,
+                                        sizer, limiter)
+        return self._to_geojson(features, oid_field)
+
+    def _to_geojson(self, features, oid_field):
+        # servers do not always honour orderByFields on objectIds queries
+        features.sort(key=lambda feat: feat.get('attributes').get(oid_field))
+
+        with metrics.timer('conversion'):
+            return features_to_geojson(features)
+
+    def _feature_params(self, object_ids, query, oid_field):
+        return dict(query.feature_params(oid_field),
+                    objectIds=",".join(str(oid) for oid in object_ids),
+                    orderByFields=oid_field)
+
+    def _split(self, object_ids, sizer):
+        # the halves of a page that failed
+        metrics.inc('page_splits_total')
+        if sizer is not None:
+            sizer.shrink()
+        half = len(object_ids) // 2
+        return object_ids[:half], object_ids[half:]
+
+    def _observe(self, sizer, jsobj, features, elapsed, size):
+        if sizer is None:
+            return
+        if jsobj.get('exceededTransferLimit') and features:
+            # a short page is the server's limit, not a fast one
+            sizer.cap(len(features))
+        else:
+            sizer.observe(len(features), elapsed, size)
+
+    def _missing_batches(self, missing, sizer):
+        # the ids a truncated page left out, in pages the server returns
+        # whole once the sizer knows its limit
+        if sizer is None:
+            return [missing] if missing else []
+        return list(chunks(missing, sizer.size))
+
+    def _missing(self, object_ids, jsobj, oid_field):
+        # the ids a page flagged exceededTransferLimit left out
+        features = jsobj.get('features') or []
+        if not jsobj.get('exceededTransferLimit') or not features:
+            return []
+        returned = set(feat.get('attributes').get(oid_field)
+                       for feat in features)
+        missing = [oid for oid in object_ids if oid not in returned]
+        if missing:
+            metrics.inc('page_splits_total')
+        return missing
+
+    def _fetch_features(self, layer, object_ids, query, oid_field,
+                        sizer=None, limiter=None):
+        # Returns the esri features of object_ids. Pages
+        # that time out or fail are split in half and fetched again, and
+        # features left out of a truncated page are fetched separately.
+        params = self._feature_params(object_ids, query, oid_field)
+        try:
+            # the clock starts once the limiter lets the page through,
+            # waiting for a slot is not the server being slow
+            with limiter or nullcontext(), metrics.timer('page'):
+                start = time.time()
+                response = self._request(layer, params, method='post')
+                jsobj = self._parse(response)
+                elapsed = time.time() - start
+        except SPLIT_ERRORS:
+            if len(object_ids) <= 1:
+                raise
+            halves = [self._fetch_features(layer, ids, query, oid_field,
+                                           sizer, limiter)
+                      for ids in self._split(object_ids, sizer)]
+            return halves[0] + halves[1]
+
+        features = jsobj.get('features') or []
+        self._observe(sizer, jsobj, features, elapsed, len(response.content))
+        if limiter is not None:
+            limiter.observe(len(features), elapsed)
+
+        missing = self._missing(object_ids, jsobj, oid_field)
+        for batch in self._missing_batches(missing, sizer):
+            features += self._fetch_features(layer, batch, query, oid_field,
+                                             sizer, limiter)
+
+        return features
+
+    async def _afetch_features(self, client, layer, object_ids, query,
+                               oid_field, sizer, limiter):
+        # _fetch_features on the event loop; the halves of a failed page
+        # are fetched concurrently
+        url = self._build_query_request(layer)
+        params = self._params(self._feature_params(object_ids, query,
+                                                   oid_field))
+        try:
+            async with limiter:
+                with metrics.timer('page'):
+                    start = time.time()
+                    response = await client.post(url, data=params)
+                    response.raise_for_status()
+                    jsobj = self._parse(response)
+                    elapsed = time.time() - start
+        except ASYNC_SPLIT_ERRORS:
+            if len(object_ids) <= 1:
+                raise
+            halves = await asyncio.gather(*[
+                self._afetch_features(client, layer, ids, query, oid_field,
+                                      sizer, limiter)
+                for ids in self._split(object_ids, sizer)])
+            return halves[0] + halves[1]
+
+        features = jsobj.get('features') or []
+        self._observe(sizer, jsobj, features, elapsed, len(response.content))
+        limiter.observe(len(features), elapsed)
+
+        missing = self._missing(object_ids, jsobj, oid_field)
+        if missing:
+            pages = await asyncio.gather(*[
+                self._afetch_features(client, layer, batch, query, oid_field,
+                                      sizer, limiter)
+                for batch in self._missing_batches(missing, sizer)])
+            for more in pages:
+                features += more
+
+        return features
+
+    def _fetch_cell(self, layer, cell, query, oid_field, page_size):
+        # a cell that fits in a page is fetched with a single spatial
+        # query, anything bigger by objectId
+        if cell.count <= page_size:
+            params = dict(query.filter_params(),
+                          **query.feature_params(oid_field))
+            with metrics.timer('page'):
+                jsobj = self.query(layer, params, method='post')
+            if not jsobj.get('exceededTransferLimit'):
+                return self._to_geojson(jsobj.get('features') or [],
+                                        oid_field)
+
+        object_ids = self.get_object_ids(layer, query)
+        return [feature for batch in chunks(object_ids, page_size)
+                for feature in self.get_features(layer, batch, query)]
+
+    def iter_cells(self, layer, query=None, workers=1,
+                   max_depth=quadtree.MAX_DEPTH):
+        # Yields the layer as (quadtree cell, features), for servers that
+        # cannot page and are slow to take long objectId lists. The extent
+        # is split until a returnCountOnly query of every cell is under
+        # maxRecordCount, then the cells are fetched on `workers` threads.
+        # Features crossing cell borders only come with the first cell, in
+        # key order. Features no cell selected, e.g. without a geometry,
+        # come last with a cell without a bbox.
+        query = query or QueryOptions()
+        oid_field = self.get_object_id_field(layer)
+        page_size = self.get_max_record_count(layer)
+        bbox, bbox_sr = self.get_extent(layer, query)
+
+        def count(cell):
+            return self.get_count(layer, query.within(cell.bbox, bbox_sr))
+
+        cells = quadtree.plan(quadtree.Cell(bbox), count, page_size,
+                              workers, max_depth)
+
+        def fetch(cell):
+            return cell, self._fetch_cell(layer, cell,
+                                          query.within(cell.bbox, bbox_sr),
+                                          oid_field, page_size)
+
+        seen = set()
+        for cell, features in ordered_map(fetch, cells, workers):
+            features = [feature for feature in features
+                        if feature['properties'].get(oid_field) not in seen]
+            seen.update(feature['properties'].get(oid_field)
+                        for feature in features)
+            yield cell, features
+
+        if bbox is None or len(seen) >= self.get_count(layer, query):
+            return
+        missing = [oid for oid in self.get_object_ids(layer, query)
+                   if oid not in seen]
+        if missing:
+            rest = quadtree.Cell(None, 'rest', len(missing))
+            yield rest, [feature for batch in chunks(missing, page_size)
+                         for feature in self.get_features(layer, batch,
+                                                          query)]
+
+    def iter_batches(self, layer, query=None, workers=1, after=None,
+                     adaptive=False):
+        # Fetches the full objectId list up front and downloads it in
+        # maxRecordCount sized batches on `workers` threads. Batches are
+        # yielded in objectId order, as (last objectId, features), whatever
+        # order they complete in. `after` skips the ids already dumped.
+        # With `adaptive` the batch size follows the server's response times
+        # and fewer batches run concurrently while it slows down.
+        object_ids = self.get_object_ids(layer, query)
+        if after is not None:
+            object_ids = [oid for oid in object_ids if oid > after]
+        batch_size = self.get_max_record_count(layer)
+
+        sizer = None
+        if adaptive:
+            sizer = PageSizer(batch_size)
+            batches = adaptive_chunks(object_ids, sizer)
+        else:
+            batches = chunks(object_ids, batch_size)
+
+        # the response cache is only consulted by the requests session
+        if aio.available() and get_session().cache is None:
+            return self._iter_batches_async(layer, batches, query, workers,
+                                            sizer, adaptive)
+
+        limiter = ConcurrencyLimiter(workers) if adaptive else None
+
+        def fetch(batch):
+            return batch[-1], self.get_features(layer, batch, query,
+                                                sizer=sizer, limiter=limiter)
+
+        return ordered_map(fetch, batches, workers)
+
+    def _iter_batches_async(self, layer, batches, query, workers, sizer,
+                            adaptive):
+        # pages are downloaded and parsed on the event loop, and converted
+        # to GeoJSON as the caller consumes them
+        query = query or QueryOptions()
+        oid_field = self.get_object_id_field(layer)
+        client = aio.get_async_session()
+        limiter = aio.AsyncConcurrencyLimiter(workers, adaptive)
+
+        async def fetch(batch):
+            features = await self._afetch_features(
+                client, layer, batch, query, oid_field, sizer, limiter)
+            return batch[-1], features
+
+        pages = aio.ordered_gather((fetch(batch) for batch in batches),
+                                   workers * 2)
+        for last_oid, features in pages:
+            yield last_oid, self._to_geojson(features, oid_field)
@@ -0,0 +1,189 @@
+import json
+import time
+import datetime
+import threading
+from contextlib import contextmanager
+from .files import atomic_write
+
+# upper bounds in seconds, the last bucket catches everything
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0,
+           30.0, 60.0, float('inf'))
+
+
+class Histogram:
+    def __init__(self):
+        self.counts = [0] * len(BUCKETS)
+        self.count = 0
+        self.sum = 0.0
+        self.min = None
+        self.max = None
+
+    def observe(self, value):
+        for i, bound in enumerate(BUCKETS):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        self.count += 1
+        self.sum += value
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+
+    def quantile(self, q):
+        # upper bound of the bucket holding the q-th observation
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(BUCKETS, self.counts):
+            seen += count
+            if seen >= rank:
+                return min(bound, self.max)
+        return self.max
+
+    def as_dict(self):
+        return {
+            'count': self.count,
+            'sum': self.sum,
+            'mean': self.sum / self.count if self.count else None,
+            'min': self.min,
+            'max': self.max,
+            'p50': self.quantile(0.5),
+            'p90': self.quantile(0.9),
+            'p99': self.quantile(0.99),
+        }
+
+
+def _labels(labels):
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+def _label_text(labels):
+    return ",".join('{}="{}"'.format(key, value.replace('\\', '\\\\')
+                                     .replace('"', '\\"'))
+                    for key, value in labels)
+
+
+class Metrics:
+    # Process wide counters and latency histograms for HTTP requests and
+    # dump phases, reported as json or as Prometheus textfile metrics.
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.started = time.time()
+            self.counters = {}
+            self.histograms = {}
+
+    def inc(self, name, value=1, **labels):
+        key = (name, _labels(labels))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name, value, **labels):
+        key = (name, _labels(labels))
+        with self._lock:
+            if key not in self.histograms:
+                self.histograms[key] = Histogram()
+            self.histograms[key].observe(value)
+
+    def request(self, host, status, seconds, size=None, wire_size=None,
+                retries=0):
+        # one HTTP request; size is the decoded body and wire_size what was
+        # actually transferred, when known
+        self.inc('http_requests_total', host=host, status=status)
+        self.observe('http_request_seconds', seconds, host=host)
+        if retries:
+            self.inc('http_retries_total', retries, host=host)
+        if size is not None:
+            self.inc('http_bytes_total', size, host=host)
+        if wire_size is not None:
+            self.inc('http_wire_bytes_total', wire_size, host=host)
+
+    @contextmanager
+    def timer(self, phase):
+        start = time.time()
+        try:
+            yield
+        finally:
+            self.observe('phase_seconds', time.time() - start, phase=phase)
+
+    def _layers(self):
+        layers = {}
+        for (name, labels), value in self.counters.items():
+            if name == 'features_total':
+                layers.setdefault(dict(labels)['layer'], {})['features'] = value
+        for (name, labels), histogram in self.histograms.items():
+            if name == 'layer_seconds':
+                layer = layers.setdefault(dict(labels)['layer'], {})
+                layer['seconds'] = histogram.sum
+        for layer in layers.values():
+            if layer.get('features') and layer.get('seconds'):
+                layer['features_per_second'] = (layer['features'] /
+                                                layer['seconds'])
+        return layers
+
+    def report(self):
+        with self._lock:
+            counters = [(name, dict(labels), value)
+                        for (name, labels), value
+                        in sorted(self.counters.items())]
+            histograms = [(name, dict(labels), histogram.as_dict())
+                          for (name, labels), histogram
+                          in sorted(self.histograms.items(),
+                                    key=lambda item: item[0])]
+            layers = self._layers()
+
+        return {
+            'started': datetime.datetime.utcfromtimestamp(
+                self.started).isoformat() + 'Z',
+            'duration': time.time() - self.started,
+            'counters': [{'name': name, 'labels': labels, 'value': value}
+                         for name, labels, value in counters],
+            'histograms': [{'name': name, 'labels': labels, 'value': value}
+                           for name, labels, value in histograms],
+            'layers': layers,
+        }
+
+    def prometheus(self):
+        lines = []
+        with self._lock:
+            for name in sorted(set(key[0] for key in self.counters)):
+                lines.append('# TYPE agsdump_{} counter'.format(name))
+                for (key, labels), value in sorted(self.counters.items()):
+                    if key == name:
+                        lines.append('agsdump_{}{{{}}} {}'.format(
+                            name, _label_text(labels), value))
+
+            for name in sorted(set(key[0] for key in self.histograms)):
+                lines.append('# TYPE agsdump_{} histogram'.format(name))
+                for (key, labels), histogram in sorted(
+                        self.histograms.items(), key=lambda item: item[0]):
+                    if key != name:
+                        continue
+                    cumulative = 0
+                    for bound, count in zip(BUCKETS, histogram.counts):
+                        cumulative += count
+                        le = '+Inf' if bound == float('inf') else repr(bound)
+                        lines.append('agsdump_{}_bucket{{{}}} {}'.format(
+                            name, _label_text(labels + (('le', le), )),
+                            cumulative))
+                    lines.append('agsdump_{}_sum{{{}}} {}'.format(
+                        name, _label_text(labels), repr(histogram.sum)))
+                    lines.append('agsdump_{}_count{{{}}} {}'.format(
+                        name, _label_text(labels), histogram.count))
+
+            lines.append('# TYPE agsdump_run_seconds gauge')
+            lines.append('agsdump_run_seconds {}'.format(
+                repr(time.time() - self.started)))
+        return "\n".join(lines) + "\n"
+
+    def write_report(self, path):
+        atomic_write(path, json.dumps(self.report(), indent=2,
+                                      sort_keys=True))
+
+    def write_prometheus(self, path):
+        # written atomically, as the node_exporter textfile collector needs
+        atomic_write(path, self.prometheus())
+
+
+metrics = Metrics()
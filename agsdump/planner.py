@@ -0,0 +1,158 @@
+import json
+import time
+from .concurrency import ordered_map
+from .files import atomic_write
+from .query import QueryOptions
+
+# number of layers counted concurrently
+WORKERS = 8
+
+# rough size of a GeoJSON feature: its geometry by type, plus each
+# attribute with its name
+GEOMETRY_BYTES = {
+    None: 0,
+    'esriGeometryPoint': 60,
+    'esriGeometryMultipoint': 240,
+    'esriGeometryPolyline': 1200,
+    'esriGeometryPolygon': 1600,
+    'esriGeometryEnvelope': 120,
+}
+FIELD_BYTES = 24
+
+# rate a page is assumed to arrive at, after the latency of the request
+BYTES_PER_SECOND = 2 * 1024 * 1024
+
+
+class LayerPlan:
+    # What dumping a layer is expected to take. The latency is that of its
+    # count request, the bytes and seconds are estimates from the feature
+    # count, the geometry type and the number of fields. A layer that could
+    # not be counted has an error instead.
+    def __init__(self, layer_id, name, geometry_type=None, count=None,
+                 max_record_count=1000, fields=0, latency=0.0,
+                 page_workers=1, error=None):
+        self.layer_id = layer_id
+        self.name = name
+        self.geometry_type = geometry_type
+        self.count = count
+        self.max_record_count = max_record_count
+        self.fields = fields
+        self.latency = latency
+        self.page_workers = page_workers
+        self.error = error
+
+    @property
+    def pages(self):
+        return -(-(self.count or 0) // self.max_record_count)
+
+    @property
+    def bytes(self):
+        feature_bytes = (GEOMETRY_BYTES.get(self.geometry_type, 0) +
+                         self.fields * FIELD_BYTES)
+        return (self.count or 0) * feature_bytes
+
+    @property
+    def seconds(self):
+        transfer = self.bytes / float(BYTES_PER_SECOND)
+        return (self.pages * self.latency + transfer) / self.page_workers
+
+    def as_dict(self):
+        return {
+            'id': self.layer_id,
+            'name': self.name,
+            'geometryType': self.geometry_type,
+            'count': self.count,
+            'maxRecordCount': self.max_record_count,
+            'pages': self.pages,
+            'bytes': self.bytes,
+            'seconds': round(self.seconds, 1),
+            'error': self.error,
+        }
+
+
+def plan_layer(map_service, layer, query=None, page_workers=1):
+    layer_id = layer.get('id')
+    plan = LayerPlan(layer_id, layer.get('name'), page_workers=page_workers)
+    try:
+        descriptor = map_service.get_descriptor_for_layer(layer_id)
+        layer_query = (query or QueryOptions()).for_layer(layer_id,
+                                                          plan.name)
+        plan.geometry_type = descriptor.get('geometryType')
+        plan.max_record_count = map_service.get_max_record_count(layer_id)
+        plan.fields = (len(layer_query.fields) if layer_query.fields
+                       else len(descriptor.get('fields') or []))
+
+        start = time.time()
+        plan.count = map_service.get_count(layer_id, layer_query)
+        plan.latency = time.time() - start
+    except Exception as exc:
+        # group layers and the like, the dump reports them
+        plan.error = "{}: {}".format(type(exc).__name__, exc)
+    return plan
+
+
+def plan_layers(map_service, layers, query=None, page_workers=1,
+                workers=WORKERS):
+    # the plans of `layers`, in their order, counted on `workers` threads
+    return list(ordered_map(
+        lambda layer: plan_layer(map_service, layer, query, page_workers),
+        layers, workers))
+
+
+def schedule(layers, plans):
+    # Longest first, so that with several jobs the largest layers start
+    # right away instead of being picked up last by a single thread while
+    # the others idle. Layers without a plan go last, in their order.
+    seconds = dict((plan.layer_id, plan.seconds) for plan in plans
+                   if plan.error is None)
+    order = dict((layer.get('id'), i) for i, layer in enumerate(layers))
+    return sorted(layers, key=lambda layer: (
+        -seconds.get(layer.get('id'), -1), order[layer.get('id')]))
+
+
+def totals(plans):
+    planned = [plan for plan in plans if plan.error is None]
+    return {
+        'layers': len(plans),
+        'count': sum(plan.count or 0 for plan in planned),
+        'bytes': sum(plan.bytes for plan in planned),
+        'seconds': round(sum(plan.seconds for plan in planned), 1),
+    }
+
+
+def _megabytes(size):
+    return "{:.1f} MB".format(size / (1024.0 * 1024))
+
+
+def summary(plans, jobs=1):
+    # one line; the seconds are those of one job, spread over `jobs`
+    total = totals(plans)
+    longest = max([plan.seconds for plan in plans if plan.error is None] or
+                  [0])
+    return "Plan: {} layers, {} features, ~{}, ~{:.0f}s".format(
+        total['layers'], total['count'], _megabytes(total['bytes']),
+        max(total['seconds'] / max(jobs, 1), longest))
+
+
+def print_plan(plans, jobs=1):
+    print("\n{:>4} {:<30} {:>10} {:>6} {:>10} {:>8}".format(
+        'id', 'name', 'features', 'pages', 'size', 'seconds'))
+    for plan in plans:
+        if plan.error is not None:
+            print("{:>4} {:<30} {}".format(plan.layer_id, plan.name,
+                                           plan.error))
+            continue
+        print("{:>4} {:<30} {:>10} {:>6} {:>10} {:>8.1f}".format(
+            plan.layer_id, plan.name, plan.count, plan.pages,
+            _megabytes(plan.bytes), plan.seconds))
+    print(summary(plans, jobs))
+
+
+def write_plan(path, plans, jobs=1):
+    atomic_write(path, json.dumps({
+        'layers': [plan.as_dict() for plan in plans],
+        'order': [layer.get('id') for layer in schedule(
+            [{'id': plan.layer_id} for plan in plans], plans)],
+        'totals': totals(plans),
+        'jobs': jobs,
+    }, indent=2))
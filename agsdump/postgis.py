@@ -0,0 +1,247 @@
+import io
+import os
+import re
+import json
+import hashlib
+import datetime
+
+try:
+    import psycopg2
+except ImportError:
+    psycopg2 = None
+
+_column_types = {
+    'esriFieldTypeOID': 'bigint',
+    'esriFieldTypeSmallInteger': 'smallint',
+    'esriFieldTypeInteger': 'integer',
+    'esriFieldTypeSingle': 'real',
+    'esriFieldTypeDouble': 'double precision',
+    'esriFieldTypeString': 'text',
+    'esriFieldTypeDate': 'timestamptz',
+    'esriFieldTypeGUID': 'uuid',
+    'esriFieldTypeGlobalID': 'uuid',
+    'esriFieldTypeXML': 'text',
+}
+
+_geometry_types = {
+    'esriGeometryPoint': 'Point',
+    'esriGeometryMultipoint': 'MultiPoint',
+    'esriGeometryPolyline': 'MultiLineString',
+    'esriGeometryPolygon': 'MultiPolygon',
+}
+
+_copy_escapes = {'\\': '\\\\', '\t': '\\t', '\n': '\\n', '\r': '\\r'}
+
+
+def quote_ident(name):
+    return '"{}"'.format(name.replace('"', '""'))
+
+
+# PostgreSQL truncates longer identifiers, less room for the __part suffix
+MAX_TABLE_NAME = 63 - len('__part')
+
+
+def table_name(name):
+    name = re.sub(r'\W+', '_', name.lower()).strip('_') or 'layer'
+    if len(name) > MAX_TABLE_NAME:
+        # truncated names of different layers would collide
+        digest = hashlib.sha1(name.encode('utf-8')).hexdigest()[:8]
+        name = name[:MAX_TABLE_NAME - 9] + '_' + digest
+    return name
+
+
+def _wkt_coords(coords):
+    return ", ".join(" ".join(repr(c) for c in coord) for coord in coords)
+
+
+def _wkt_rings(rings):
+    return ", ".join("({})".format(_wkt_coords(ring)) for ring in rings)
+
+
+def geojson_to_wkt(geometry, multi=False):
+    # multi promotes single geometries, as a MultiPolygon column also
+    # receives plain polygons
+    geom_type = geometry['type']
+    coords = geometry['coordinates']
+
+    if multi and geom_type in ('LineString', 'Polygon'):
+        geom_type = 'Multi' + geom_type
+        coords = [coords]
+
+    if geom_type == 'Point':
+        body = _wkt_coords([coords])
+    elif geom_type in ('MultiPoint', 'LineString'):
+        body = _wkt_coords(coords)
+    elif geom_type in ('MultiLineString', 'Polygon'):
+        body = _wkt_rings(coords)
+    elif geom_type == 'MultiPolygon':
+        body = ", ".join("({})".format(_wkt_rings(polygon))
+                         for polygon in coords)
+    else:
+        raise ValueError("unsupported geometry type {}".format(geom_type))
+
+    return "{}({})".format(geom_type.upper(), body)
+
+
+def copy_value(value, column_type):
+    # one value in PostgreSQL's text COPY format
+    if value is None:
+        return '\\N'
+    if column_type == 'timestamptz':
+        # esri dates are milliseconds since the epoch (UTC)
+        value = datetime.datetime(1970, 1, 1) + datetime.timedelta(
+            milliseconds=value)
+        return value.isoformat() + '+00'
+    if isinstance(value, float):
+        value = repr(value)
+    elif not isinstance(value, str):
+        value = str(value)
+    return ''.join(_copy_escapes.get(c, c) for c in value)
+
+
+class PostGISWriter:
+    # Streams each batch of features into a PostGIS table with COPY. The
+    # table is loaded under a temporary name without indexes, then replaces
+    # the previous table and gets its primary key and spatial index, all in
+    # the same transaction.
+    extension = ''
+
+    def __init__(self, path, descriptor=None, srid=4326, metadata=None,
+                 dsn='', schema='public'):
+        if psycopg2 is None:
+            raise ValueError("psycopg2 is not installed")
+
+        # path is <service>/data/<layer>; several services dumped into
+        # one schema each get their own tables
+        layer = os.path.basename(path)
+        service = os.path.basename(os.path.dirname(os.path.dirname(path)))
+        self.table = table_name("{}_{}".format(service, layer) if service
+                                else layer)
+        self.descriptor = descriptor or {}
+        self.srid = int(srid)
+        self.metadata = metadata
+        self.dsn = dsn
+        self.schema = schema
+        self.count = 0
+        self._conn = None
+        self._columns = []
+        self._geometry_type = _geometry_types.get(
+            self.descriptor.get('geometryType'))
+        self._oid_field = None
+
+    def _name(self, table):
+        return "{}.{}".format(quote_ident(self.schema), quote_ident(table))
+
+    @property
+    def part_table(self):
+        return self.table + '__part'
+
+    def open(self):
+        columns = []
+        for field in self.descriptor.get('fields') or []:
+            column_type = _column_types.get(field.get('type'))
+            if column_type is None:
+                continue
+            if field.get('type') == 'esriFieldTypeOID':
+                self._oid_field = field.get('name')
+            self._columns.append((field.get('name'), column_type))
+            columns.append("{} {}".format(quote_ident(field.get('name')),
+                                          column_type))
+        if self._geometry_type:
+            columns.append("geom geometry({}, {})".format(
+                self._geometry_type, self.srid))
+
+        self._conn = psycopg2.connect(self.dsn)
+        with self._conn.cursor() as cursor:
+            cursor.execute("DROP TABLE IF EXISTS {}".format(
+                self._name(self.part_table)))
+            cursor.execute("CREATE TABLE {} ({})".format(
+                self._name(self.part_table), ", ".join(columns)))
+        return self
+
+    def can_resume(self, state):
+        return False
+
+    def _copy_row(self, feature):
+        properties = feature.get('properties') or {}
+        values = [copy_value(properties.get(name), column_type)
+                  for name, column_type in self._columns]
+
+        if self._geometry_type:
+            geometry = feature.get('geometry')
+            if geometry:
+                multi = self._geometry_type.startswith('Multi')
+                values.append('SRID={};{}'.format(
+                    self.srid, geojson_to_wkt(geometry, multi)))
+            else:
+                values.append('\\N')
+
+        return '\t'.join(values) + '\n'
+
+    def write(self, features):
+        if not features:
+            return
+
+        data = ''.join(self._copy_row(feature) for feature in features)
+        columns = [quote_ident(name) for name, column_type in self._columns]
+        if self._geometry_type:
+            columns.append('geom')
+
+        with self._conn.cursor() as cursor:
+            cursor.copy_expert(
+                "COPY {} ({}) FROM STDIN".format(self._name(self.part_table),
+                                                 ", ".join(columns)),
+                io.BytesIO(data.encode('utf-8')))
+        self.count += len(features)
+
+    def checkpoint(self):
+        return {'count': self.count}
+
+    def close(self):
+        if self._conn is None:
+            return
+
+        table = self._name(self.table)
+        with self._conn.cursor() as cursor:
+            cursor.execute("DROP TABLE IF EXISTS {}".format(table))
+            cursor.execute("ALTER TABLE {} RENAME TO {}".format(
+                self._name(self.part_table), quote_ident(self.table)))
+            if self._oid_field:
+                cursor.execute("ALTER TABLE {} ADD PRIMARY KEY ({})".format(
+                    table, quote_ident(self._oid_field)))
+            if self._geometry_type:
+                cursor.execute("CREATE INDEX ON {} USING GIST (geom)".format(
+                    table))
+            if self.metadata:
+                cursor.execute("COMMENT ON TABLE {} IS %s".format(table),
+                               (json.dumps(self.metadata, sort_keys=True), ))
+            cursor.execute("ANALYZE {}".format(table))
+        self._conn.commit()
+        self._conn.close()
+        self._conn = None
+
+    def abort(self):
+        if self._conn is not None:
+            self._conn.rollback()
+            self._conn.close()
+            self._conn = None
+
+    @classmethod
+    def exists(cls, path):
+        # tables are only renamed into place once complete
+        return True
+
+    @classmethod
+    def is_dump(cls, path):
+        return False
+
+    def __enter__(self):
+        if self._conn is None:
+            self.open()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
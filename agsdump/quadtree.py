@@ -0,0 +1,69 @@
+import math
+from .concurrency import ordered_map
+
+# a cell 2^16 times smaller than the extent is a single location
+MAX_DEPTH = 16
+
+
+class Cell:
+    # A quadtree cell of a layer's extent. key is its quadkey: '' for the
+    # whole extent and one more digit per level, 0 and 1 for the top left
+    # and top right quarters, 2 and 3 for the bottom ones. Sorting cells by
+    # key keeps neighbours close together. A cell without a bbox stands for
+    # features no box can select, like those without a geometry.
+    def __init__(self, bbox, key='', count=None):
+        self.bbox = bbox
+        self.key = key
+        self.count = count
+
+    @property
+    def depth(self):
+        return len(self.key)
+
+    @property
+    def name(self):
+        # for file names, the root has an empty key
+        return self.key or 'root'
+
+    def children(self):
+        xmin, ymin, xmax, ymax = self.bbox
+        xmid = (xmin + xmax) / 2.0
+        ymid = (ymin + ymax) / 2.0
+        return [Cell((xmin, ymid, xmid, ymax), self.key + '0'),
+                Cell((xmid, ymid, xmax, ymax), self.key + '1'),
+                Cell((xmin, ymin, xmid, ymid), self.key + '2'),
+                Cell((xmid, ymin, xmax, ymid), self.key + '3')]
+
+    def as_dict(self):
+        return {'key': self.key, 'bbox': self.bbox, 'count': self.count}
+
+
+def valid_bbox(bbox):
+    return (bbox is not None and len(bbox) == 4 and
+            all(isinstance(v, (int, float)) and not math.isnan(v)
+                for v in bbox) and
+            bbox[0] <= bbox[2] and bbox[1] <= bbox[3])
+
+
+def plan(root, count, max_count, workers=1, max_depth=MAX_DEPTH):
+    # Splits root until every cell holds at most max_count features, one
+    # level at a time with the cells of a level counted on `workers`
+    # threads. count(cell) returns the features in cell. Returns the
+    # non-empty leaves, in key order, with their counts. Cells that still
+    # hold more at max_depth (or cannot be split) are returned as they are.
+    leaves = []
+    level = [root]
+    while level:
+        counted = ordered_map(lambda cell: (cell, count(cell)), level,
+                              workers)
+        level = []
+        for cell, cell_count in counted:
+            cell.count = cell_count
+            if not cell_count:
+                continue
+            if (cell_count <= max_count or cell.depth >= max_depth or
+                    not valid_bbox(cell.bbox)):
+                leaves.append(cell)
+            else:
+                level.extend(cell.children())
+    return sorted(leaves, key=lambda cell: cell.key)
@@ -0,0 +1,116 @@
+import json
+
+# esri wkids with an EPSG equivalent, for writers that need an EPSG code
+_epsg_codes = {102100: 3857, 102113: 3857}
+
+
+def _split(value):
+    if value is None or isinstance(value, (list, tuple)):
+        return value
+    return [item.strip() for item in str(value).split(',') if item.strip()]
+
+
+class QueryOptions:
+    # What to ask the server for: which features (where clause and
+    # bounding box) and how much of them (fields, output spatial reference
+    # and geometry generalization). Anything left out is not sent.
+    options = ('fields', 'where', 'bbox', 'bbox_sr', 'out_sr',
+               'max_allowable_offset', 'geometry_precision')
+
+    def __init__(self, fields=None, where=None, bbox=None, bbox_sr=None,
+                 out_sr=4326, max_allowable_offset=None,
+                 geometry_precision=None):
+        self.fields = _split(fields)
+        self.where = where
+        self.bbox = [float(v) for v in _split(bbox)] if bbox else None
+        self.bbox_sr = bbox_sr
+        self.out_sr = out_sr
+        self.max_allowable_offset = max_allowable_offset
+        self.geometry_precision = geometry_precision
+
+        if self.bbox is not None and len(self.bbox) != 4:
+            raise ValueError("bbox needs xmin,ymin,xmax,ymax")
+
+        self._layers = {}
+
+    @classmethod
+    def from_config(cls, path, **explicit):
+        # {"defaults": {...}, "layers": {"<layer id or name>": {...}}}
+        # with the keys of QueryOptions; the file's defaults are overridden
+        # by the values given on the command line (those not None), which
+        # are overridden per layer
+        with open(path) as f:
+            config = json.load(f)
+
+        values = dict(config.get('defaults') or {})
+        values.update((k, v) for k, v in explicit.items() if v is not None)
+        query = cls(**values)
+        for key, layer_values in (config.get('layers') or {}).items():
+            merged = dict(values)
+            merged.update(layer_values)
+            query._layers[str(key)] = cls(**merged)
+        return query
+
+    def for_layer(self, layer_id, layer_name=None):
+        return (self._layers.get(str(layer_id)) or
+                self._layers.get(layer_name) or self)
+
+    def and_where(self, clause):
+        query = QueryOptions(**self.as_dict())
+        query.where = ("({}) AND ({})".format(self.where, clause)
+                       if self.where else clause)
+        return query
+
+    def within(self, bbox, bbox_sr=None):
+        # the same query restricted to a box, e.g. a quadtree cell
+        if bbox is None:
+            return self
+        query = QueryOptions(**self.as_dict())
+        query.bbox = list(bbox)
+        query.bbox_sr = bbox_sr
+        return query
+
+    def as_dict(self):
+        return dict((option, getattr(self, option))
+                    for option in self.options)
+
+    @property
+    def epsg(self):
+        out_sr = int(self.out_sr)
+        return _epsg_codes.get(out_sr, out_sr)
+
+    def filter_params(self):
+        # selects the features, shared by count, id and feature queries
+        params = {'where': self.where or '1 = 1'}
+        if self.bbox:
+            params.update({
+                'geometry': ",".join(repr(v) for v in self.bbox),
+                'geometryType': 'esriGeometryEnvelope',
+                'spatialRel': 'esriSpatialRelIntersects',
+            })
+            if self.bbox_sr:
+                params['inSR'] = self.bbox_sr
+        return params
+
+    def feature_params(self, oid_field):
+        # shapes the returned features
+        fields = '*'
+        if self.fields:
+            # the objectId is needed to page, merge and resume
+            fields = [oid_field] + [f for f in self.fields if f != oid_field]
+            fields = ",".join(fields)
+
+        params = {
+            'outFields': fields,
+            'returnGeometry': True,
+            'outSR': self.out_sr,
+        }
+        if self.max_allowable_offset is not None:
+            params['maxAllowableOffset'] = self.max_allowable_offset
+        if self.geometry_precision is not None:
+            params['geometryPrecision'] = self.geometry_precision
+        return params
+
+    def metadata(self):
+        return dict((option, value) for option, value in self.as_dict().items()
+                    if value is not None)
@@ -0,0 +1,158 @@
+import time
+import threading
+import requests
+from urllib.parse import urlparse
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from .metrics import metrics
+
+try:
+    # urllib3 decodes br responses when brotli is installed
+    import brotli
+except ImportError:
+    brotli = None
+
+ACCEPT_ENCODING = 'gzip, deflate, br' if brotli else 'gzip, deflate'
+
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+RETRY_METHODS = frozenset(['GET', 'POST'])
+
+
+def _record(host, response, elapsed, stream=False):
+    # latency, size and retries of one request for the run report
+    if response is None:
+        metrics.request(host, 'error', elapsed)
+        return
+
+    retries = getattr(response.raw, 'retries', None)
+    size = wire_size = None
+    if not stream:
+        # decoded size, and the compressed size read off the wire
+        size = len(response.content)
+        if hasattr(response.raw, 'tell'):
+            wire_size = response.raw.tell()
+    metrics.request(host, response.status_code, elapsed, size, wire_size,
+                    len(retries.history) if retries is not None else 0)
+
+
+def _retry(retries, backoff):
+    options = {
+        'total': retries,
+        'connect': retries,
+        'read': retries,
+        'status': retries,
+        'backoff_factor': backoff,
+        'status_forcelist': RETRY_STATUSES,
+        'respect_retry_after_header': True,
+        'raise_on_status': False,
+    }
+    try:
+        return Retry(allowed_methods=RETRY_METHODS, **options)
+    except TypeError:
+        # urllib3 < 1.26
+        return Retry(method_whitelist=RETRY_METHODS, **options)
+
+
+class RateLimiter:
+    # spaces the requests to each host at least 1 / rate seconds apart
+    def __init__(self, rate):
+        self.interval = 1 / rate
+        self._next = {}
+        self._lock = threading.Lock()
+
+    def reserve(self, host):
+        # books the next slot for host, returns the seconds to wait for it
+        with self._lock:
+            now = time.time()
+            start = max(now, self._next.get(host, now))
+            self._next[host] = start + self.interval
+        return start - now
+
+    def wait(self, host):
+        delay = self.reserve(host)
+        if delay > 0:
+            time.sleep(delay)
+
+
+class Session(requests.Session):
+    # A keep-alive session shared by every ArcGIS request. Connections are
+    # pooled per host, every request gets a timeout, and transient 5xx or
+    # timeout errors are retried with exponential backoff (honouring
+    # Retry-After when the server sends it). max_requests caps the requests
+    # in flight across all threads and rate_limit the requests per second
+    # sent to any one host. With a cache.ResponseCache, responses are kept
+    # on disk and requests answered from it where possible.
+    def __init__(self, pool_size=10, retries=5, backoff=0.5, timeout=60,
+                 max_requests=None, rate_limit=None, cache=None):
+        super().__init__()
+        self.timeout = timeout
+        self.cache = cache
+        # also taken by the asyncio session, for one cap across both
+        self.slots = None
+        self.rate_limiter = None
+        if max_requests:
+            self.slots = threading.BoundedSemaphore(max_requests)
+        if rate_limit:
+            self.rate_limiter = RateLimiter(rate_limit)
+        # feature pages are very repetitive json and compress ~10x
+        self.headers['Accept-Encoding'] = ACCEPT_ENCODING
+
+        adapter = HTTPAdapter(pool_connections=pool_size,
+                              pool_maxsize=pool_size,
+                              max_retries=_retry(retries, backoff))
+        self.mount('http://', adapter)
+        self.mount('https://', adapter)
+
+    def request(self, method, url, **kwargs):
+        if self.cache is not None:
+            return self.cache.request(method, url, kwargs, self._send)
+        return self._send(method, url, **kwargs)
+
+    def _send(self, method, url, **kwargs):
+        kwargs.setdefault('timeout', self.timeout)
+        host = urlparse(url).netloc
+
+        if self.rate_limiter is not None:
+            self.rate_limiter.wait(host)
+
+        response = None
+        start = time.time()
+        try:
+            if self.slots is None:
+                response = super().request(method, url, **kwargs)
+            else:
+                with self.slots:
+                    response = super().request(method, url, **kwargs)
+            return response
+        finally:
+            _record(host, response, time.time() - start,
+                    kwargs.get('stream', False))
+
+
+_session = None
+_options = {}
+_lock = threading.Lock()
+
+
+def configure(**kwargs):
+    # replace the shared session, e.g. with options taken from the cli
+    global _session, _options
+    with _lock:
+        if _session is not None:
+            _session.close()
+        _session = Session(**kwargs)
+        _options = kwargs
+    return _session
+
+
+def get_options():
+    # the options of the shared session, for the async session to match
+    return _options
+
+
+def get_session():
+    global _session
+    with _lock:
+        if _session is None:
+            _session = Session()
+        return _session
@@ -0,0 +1,93 @@
+# Builds SLD 1.0 documents directly as lxml elements. The children of a
+# rule are created in the order the schema wants them, so there is no
+# normalize pass moving filters and scales in front of the symbolizers.
+import lxml.etree
+
+NAMESPACES = {
+    'sld': "http://www.opengis.net/sld",
+    'ogc': "http://www.opengis.net/ogc",
+    'xlink': "http://www.w3.org/1999/xlink",
+    'xsi': "http://www.w3.org/2001/XMLSchema-instance",
+}
+
+SLD = '{%s}' % NAMESPACES['sld']
+OGC = '{%s}' % NAMESPACES['ogc']
+XLINK = '{%s}' % NAMESPACES['xlink']
+
+# esri renderer comparisons -> ogc filter elements
+COMPARISONS = {
+    '==': 'PropertyIsEqualTo',
+    '!=': 'PropertyIsNotEqualTo',
+    '<': 'PropertyIsLessThan',
+    '<=': 'PropertyIsLessThanOrEqualTo',
+    '>': 'PropertyIsGreaterThan',
+    '>=': 'PropertyIsGreaterThanOrEqualTo',
+}
+
+
+def _text(value):
+    return None if value is None else str(value)
+
+
+def sub(parent, tag, text=None, attrib=None):
+    # tag in Clark notation, e.g. SLD + 'Fill'
+    node = lxml.etree.SubElement(parent, tag, attrib)
+    node.text = _text(text)
+    return node
+
+
+def css(parent, name, value):
+    return sub(parent, SLD + 'CssParameter', value, {'name': name})
+
+
+def document():
+    return lxml.etree.Element(SLD + 'StyledLayerDescriptor', version='1.0.0',
+                              nsmap=NAMESPACES)
+
+
+def feature_type_style(doc, name):
+    # the NamedLayer of `name`, down to the FeatureTypeStyle rules go in
+    named_layer = sub(doc, SLD + 'NamedLayer')
+    sub(named_layer, SLD + 'Name', name)
+    user_style = sub(named_layer, SLD + 'UserStyle')
+    return sub(user_style, SLD + 'FeatureTypeStyle')
+
+
+def comparison(operator, field, value):
+    # a detached ogc comparison, one of COMPARISONS
+    node = lxml.etree.Element(OGC + COMPARISONS[operator])
+    sub(node, OGC + 'PropertyName', field)
+    sub(node, OGC + 'Literal', value)
+    return node
+
+
+def rule(parent, title, min_scale=None, max_scale=None, conditions=()):
+    # A Rule with its title, filter and scales; the symbolizers follow.
+    # Several conditions are combined with ogc:And.
+    node = sub(parent, SLD + 'Rule')
+    sub(node, SLD + 'Title', title)
+    if conditions:
+        ogc_filter = sub(node, OGC + 'Filter')
+        if len(conditions) > 1:
+            ogc_filter = sub(ogc_filter, OGC + 'And')
+        ogc_filter.extend(conditions)
+    if min_scale is not None:
+        sub(node, SLD + 'MinScaleDenominator', min_scale)
+    if max_scale is not None:
+        sub(node, SLD + 'MaxScaleDenominator', max_scale)
+    return node
+
+
+def symbolizer(parent, kind):
+    # kind is Point, Line, Polygon or Text
+    return sub(parent, SLD + kind + 'Symbolizer')
+
+
+def online_resource(parent, href):
+    return sub(parent, SLD + 'OnlineResource', attrib={
+        XLINK + 'type': 'simple', XLINK + 'href': href})
+
+
+def tostring(doc):
+    return lxml.etree.tostring(doc, pretty_print=True, encoding='UTF-8',
+                               xml_declaration=True)
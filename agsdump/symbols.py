@@ -0,0 +1,54 @@
+import os
+import copy
+import json
+import hashlib
+import threading
+
+
+class IconStore:
+    # Content addressed store for picture marker icons. Icons are named
+    # after the hash of their image data, so an image used by any number of
+    # rules and layers is written once and shared by all of their SLDs.
+    subfolder = 'icons'
+
+    def __init__(self, folder):
+        self.folder = folder
+        self._icons = set()
+        self._lock = threading.Lock()
+
+    def add(self, base64data, ext, write):
+        # returns the icon path relative to folder; write(path, base64data)
+        # is only called for icons not stored yet
+        digest = hashlib.sha1(base64data.encode('ascii')).hexdigest()
+        icon_name = "{}/{}.{}".format(self.subfolder, digest, ext)
+
+        with self._lock:
+            new = icon_name not in self._icons
+            self._icons.add(icon_name)
+
+        icon_path = os.path.join(self.folder, self.subfolder,
+                                 "{}.{}".format(digest, ext))
+        if new and not os.path.exists(icon_path):
+            write(icon_path, base64data)
+
+        return icon_name
+
+
+class SymbolizerCache:
+    # Converted symbolizer elements keyed by the esri symbol they were
+    # built from. Identical symbols are converted once and copied after.
+    def __init__(self):
+        self._nodes = {}
+
+    def _key(self, symbol):
+        return json.dumps(symbol, sort_keys=True)
+
+    def get(self, symbol):
+        nodes = self._nodes.get(self._key(symbol))
+        if nodes is None:
+            return None
+        return [copy.deepcopy(node) for node in nodes]
+
+    def put(self, symbol, nodes):
+        self._nodes[self._key(symbol)] = [copy.deepcopy(node)
+                                          for node in nodes]
@@ -0,0 +1,371 @@
+import os
+import json
+import datetime
+from . import jsonlib
+from .files import fsync, atomic_write, open_file
+from .postgis import PostGISWriter
+
+try:
+    from osgeo import ogr, osr
+except ImportError:
+    ogr = None
+    osr = None
+
+
+class GeoJSONWriter:
+    # Writes a FeatureCollection incrementally, one feature per line, so
+    # pages can be appended as they arrive and memory stays flat no matter
+    # how big the layer is. Output goes to a .part file that is only moved
+    # into place once the collection is complete. Compressed output is
+    # streamed through the compressor and cannot be resumed.
+    extension = '.json'
+    header = b'{"type": "FeatureCollection", "features": [\n'
+    separator = b',\n'
+    footer = b'\n]}\n'
+
+    def __init__(self, path, descriptor=None, srid=4326, metadata=None,
+                 compression=None):
+        self.path = path
+        self.part_path = path + '.part'
+        self.metadata = metadata
+        self.compression = compression
+        self.count = 0
+        self._file = None
+
+    def _header(self):
+        # metadata goes in a foreign member ahead of the features
+        if not self.metadata:
+            return self.header
+        return ('{"type": "FeatureCollection", "metadata": ' +
+                json.dumps(self.metadata, sort_keys=True) +
+                ', "features": [\n').encode('utf-8')
+
+    def open(self):
+        self._file = open_file(self.part_path, 'wb', self.compression)
+        self._file.write(self._header())
+        return self
+
+    def can_resume(self, state):
+        return (not self.compression and 'offset' in state and
+                os.path.exists(self.part_path) and
+                os.path.getsize(self.part_path) >= state.get('offset', -1))
+
+    def resume(self, state):
+        # continue a .part file from the state returned by checkpoint(),
+        # dropping anything written after it
+        self._file = open(self.part_path, 'r+b')
+        self._file.truncate(state['offset'])
+        self._file.seek(state['offset'])
+        self.count = state['count']
+        return self
+
+    def write(self, features):
+        # the whole batch goes to the file in one write
+        lines = [jsonlib.dumps(feature) for feature in features]
+        if not lines:
+            return
+        if self.count:
+            self._file.write(self.separator)
+        self._file.write(self.separator.join(lines))
+        self.count += len(lines)
+
+    def checkpoint(self):
+        # make everything written so far durable
+        if self.compression:
+            self._file.flush()
+            return {'count': self.count}
+        fsync(self._file)
+        return {'offset': self._file.tell(), 'count': self.count}
+
+    def close(self):
+        if self._file is None:
+            return
+        self._file.write(self.footer)
+        if not self.compression:
+            fsync(self._file)
+        self._file.close()
+        self._file = None
+        os.replace(self.part_path, self.path)
+
+    def abort(self):
+        # leave the .part file behind for a later resume
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    @classmethod
+    def exists(cls, path):
+        return os.path.exists(path)
+
+    @classmethod
+    def _is_header(cls, line):
+        return (line.startswith(b'{"type": "FeatureCollection", ') and
+                line.endswith(b'"features": [\n'))
+
+    @classmethod
+    def is_dump(cls, path):
+        if not os.path.exists(path):
+            return False
+        with open_file(path, 'rb') as f:
+            return cls._is_header(f.readline())
+
+    @classmethod
+    def read(cls, path):
+        # reads back a file written by this writer one feature at a time
+        with open_file(path, 'rb') as f:
+            if not cls._is_header(f.readline()):
+                raise ValueError("{} was not written by agsdump".format(path))
+
+            for line in f:
+                line = line.rstrip().rstrip(b',')
+                if not line or line == b']}':
+                    continue
+                yield jsonlib.loads(line)
+
+    def __enter__(self):
+        if self._file is None:
+            self.open()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+
+class NDJSONWriter(GeoJSONWriter):
+    # newline-delimited GeoJSON, one Feature per line and nothing else;
+    # metadata goes to a .meta.json file next to it
+    extension = '.ndjson'
+    header = b''
+    separator = b'\n'
+    footer = b'\n'
+
+    def _header(self):
+        return self.header
+
+    def close(self):
+        if self._file is not None and self.metadata:
+            write_metadata(self.path, self.metadata)
+        super().close()
+
+    @classmethod
+    def is_dump(cls, path):
+        return os.path.exists(path)
+
+    @classmethod
+    def read(cls, path):
+        with open_file(path, 'rb') as f:
+            for line in f:
+                line = line.strip()
+                if line:
+                    yield jsonlib.loads(line)
+
+
+class OGRWriter:
+    # Writes features through GDAL/OGR, one transaction per batch. The
+    # spatial index is built once, when the writer is closed. OGR datasets
+    # cannot be appended to after a crash, so these writers never resume.
+    extension = None
+    driver_name = None
+    layer_options = []
+
+    _geometry_types = {
+        'esriGeometryPoint': 'wkbPoint',
+        'esriGeometryMultipoint': 'wkbMultiPoint',
+        'esriGeometryPolyline': 'wkbMultiLineString',
+        'esriGeometryPolygon': 'wkbMultiPolygon',
+    }
+
+    _field_types = {
+        'esriFieldTypeOID': 'OFTInteger64',
+        'esriFieldTypeSmallInteger': 'OFTInteger',
+        'esriFieldTypeInteger': 'OFTInteger64',
+        'esriFieldTypeSingle': 'OFTReal',
+        'esriFieldTypeDouble': 'OFTReal',
+        'esriFieldTypeString': 'OFTString',
+        'esriFieldTypeDate': 'OFTDateTime',
+        'esriFieldTypeGUID': 'OFTString',
+        'esriFieldTypeGlobalID': 'OFTString',
+        'esriFieldTypeXML': 'OFTString',
+    }
+
+    def __init__(self, path, descriptor=None, srid=4326, metadata=None):
+        if ogr is None:
+            raise ValueError("GDAL/OGR python bindings are not installed")
+
+        root, ext = os.path.splitext(path)
+        self.path = path
+        self.part_path = root + '.part' + ext
+        self.descriptor = descriptor or {}
+        self.srid = int(srid)
+        self.metadata = metadata
+        self.count = 0
+        self._dataset = None
+        self._layer = None
+        self._fields = []
+
+    @property
+    def layer_name(self):
+        return os.path.splitext(os.path.basename(self.path))[0]
+
+    def open(self):
+        driver = ogr.GetDriverByName(self.driver_name)
+        if driver is None:
+            raise ValueError("GDAL has no {} driver".format(self.driver_name))
+
+        if os.path.exists(self.part_path):
+            driver.DeleteDataSource(self.part_path)
+        self._dataset = driver.CreateDataSource(self.part_path)
+
+        srs = osr.SpatialReference()
+        srs.ImportFromEPSG(self.srid)
+        geometry_type = getattr(ogr, self._geometry_types.get(
+            self.descriptor.get('geometryType'), 'wkbNone'))
+
+        self._layer = self._dataset.CreateLayer(
+            str(self.layer_name), srs, geometry_type,
+            options=self.layer_options)
+
+        for field in self.descriptor.get('fields') or []:
+            field_type = self._field_types.get(field.get('type'))
+            if field_type is None:
+                continue
+            field_defn = ogr.FieldDefn(str(field.get('name')),
+                                       getattr(ogr, field_type))
+            if field_type == 'OFTString' and field.get('length'):
+                field_defn.SetWidth(field.get('length'))
+            self._layer.CreateField(field_defn)
+            self._fields.append((field.get('name'), field_type))
+
+        return self
+
+    def can_resume(self, state):
+        return False
+
+    def _geometry(self, geometry):
+        geom = ogr.CreateGeometryFromJson(
+            jsonlib.dumps(geometry).decode('utf-8'))
+        if geom is None:
+            return None
+
+        layer_type = self._layer.GetGeomType()
+        if layer_type == ogr.wkbMultiPolygon:
+            geom = ogr.ForceToMultiPolygon(geom)
+        elif layer_type == ogr.wkbMultiLineString:
+            geom = ogr.ForceToMultiLineString(geom)
+        return geom
+
+    def _set_field(self, feature, name, field_type, value):
+        if value is None:
+            feature.SetFieldNull(name)
+        elif field_type == 'OFTDateTime':
+            # esri dates are milliseconds since the epoch (UTC)
+            dt = datetime.datetime(1970, 1, 1) + datetime.timedelta(
+                milliseconds=value)
+            feature.SetField(name, dt.year, dt.month, dt.day, dt.hour,
+                             dt.minute, dt.second + dt.microsecond / 1e6,
+                             100)
+        else:
+            feature.SetField(name, value)
+
+    def write(self, features):
+        layer_defn = self._layer.GetLayerDefn()
+
+        self._layer.StartTransaction()
+        for feature in features:
+            ogr_feature = ogr.Feature(layer_defn)
+            properties = feature.get('properties') or {}
+            for name, field_type in self._fields:
+                self._set_field(ogr_feature, name, field_type,
+                                properties.get(name))
+            if feature.get('geometry'):
+                ogr_feature.SetGeometry(self._geometry(feature['geometry']))
+            self._layer.CreateFeature(ogr_feature)
+            self.count += 1
+        self._layer.CommitTransaction()
+
+    def checkpoint(self):
+        return {'count': self.count}
+
+    def build_spatial_index(self):
+        pass
+
+    def close(self):
+        if self._dataset is None:
+            return
+        self.build_spatial_index()
+        self._layer = None
+        self._dataset = None
+        if self.metadata:
+            write_metadata(self.path, self.metadata)
+        os.replace(self.part_path, self.path)
+
+    def abort(self):
+        self._layer = None
+        self._dataset = None
+
+    @classmethod
+    def exists(cls, path):
+        return os.path.exists(path)
+
+    @classmethod
+    def is_dump(cls, path):
+        # OGR outputs are always rewritten in full
+        return False
+
+    def __enter__(self):
+        if self._dataset is None:
+            self.open()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+
+class FlatGeobufWriter(OGRWriter):
+    # needs GDAL >= 3.1, the packed Hilbert R-tree is written on close
+    extension = '.fgb'
+    driver_name = 'FlatGeobuf'
+    layer_options = ['SPATIAL_INDEX=YES']
+
+
+class GeoPackageWriter(OGRWriter):
+    extension = '.gpkg'
+    driver_name = 'GPKG'
+    layer_options = ['SPATIAL_INDEX=NO']
+
+    def build_spatial_index(self):
+        # building the rtree once is much faster than maintaining it
+        # through every insert
+        if self._layer.GetGeomType() == ogr.wkbNone:
+            return
+        sql = "SELECT CreateSpatialIndex('{}', '{}')".format(
+            self._layer.GetName(), self._layer.GetGeometryColumn())
+        result = self._dataset.ExecuteSQL(sql)
+        if result is not None:
+            self._dataset.ReleaseResultSet(result)
+
+
+def write_metadata(path, metadata):
+    atomic_write(path + '.meta.json',
+                 json.dumps(metadata, indent=2, sort_keys=True))
+
+
+WRITERS = {
+    'geojson': GeoJSONWriter,
+    'ndjson': NDJSONWriter,
+    'fgb': FlatGeobufWriter,
+    'gpkg': GeoPackageWriter,
+    'postgis': PostGISWriter,
+}
+
+
+def get_writer(output_format):
+    if output_format not in WRITERS:
+        raise ValueError("unknown output format {}".format(output_format))
+    return WRITERS[output_format]
@@ -0,0 +1,174 @@
+# End to end benchmark of dump_styles and dump_data against a local mock
+# MapServer: wall time, peak RSS and the requests issued per phase. The
+# server runs in a child process, the peak RSS is agsdump's own.
+#
+#   python benchmarks/dump_benchmark.py --layers 4 --features 20000 \
+#       --latency 0.05 --error-rate 0.01 --jobs 4 --page-workers 4
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import resource
+import tempfile
+from contextlib import contextmanager
+
+# the mock server, and the checkout's agsdump whether it is installed or not
+here = os.path.dirname(os.path.abspath(__file__))
+sys.path[:0] = [here, os.path.dirname(here)]
+
+from mock_server import MockServerProcess, MockLayer, GEOMETRY_TYPES
+from agsdump import session
+from agsdump.agsdump import dump_styles, dump_data, dump_attachments
+from agsdump.descriptors import descriptor_cache
+from agsdump.metrics import metrics
+from agsdump.writers import WRITERS
+
+
+def peak_rss():
+    # in MB; ru_maxrss is in kilobytes on Linux but bytes on macOS
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / (1024.0 * 1024 if sys.platform == 'darwin' else 1024.0)
+
+
+@contextmanager
+def quiet(verbose):
+    if verbose:
+        yield
+        return
+    stdout = sys.stdout
+    with open(os.devnull, 'w') as devnull:
+        sys.stdout = devnull
+        try:
+            yield
+        finally:
+            sys.stdout = stdout
+
+
+def measure(name, func, server, verbose):
+    # the peak RSS is that of the whole process so far, phases are run
+    # from the cheapest to the most expensive
+    server.clear()
+    metrics.reset()
+    start = time.time()
+    with quiet(verbose):
+        func()
+    elapsed = time.time() - start
+
+    features = sum(counter['value'] for counter in metrics.report()['counters']
+                   if counter['name'] == 'features_total')
+    requests = server.requests
+    return {
+        'phase': name,
+        'seconds': elapsed,
+        'peak_rss_mb': peak_rss(),
+        'requests': sum(requests.values()) - requests['errors'],
+        'errors': requests['errors'],
+        'requests_by_kind': dict(requests),
+        'features': features,
+        'features_per_second': features / elapsed if features else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Benchmark agsdump against a local mock MapServer')
+    parser.add_argument('--layers', type=int, default=2)
+    parser.add_argument('--features', type=int, default=10000,
+                        help='features per layer')
+    parser.add_argument('--geometry', choices=sorted(GEOMETRY_TYPES),
+                        default='polygon')
+    parser.add_argument('--vertices', type=int, default=32,
+                        help='vertices per line or outer ring')
+    parser.add_argument('--max-record-count', type=int, default=1000)
+    parser.add_argument('--no-pagination', action='store_true',
+                        help='the server does not support resultOffset')
+    parser.add_argument('--latency', type=float, default=0,
+                        help='seconds added to every response')
+    parser.add_argument('--feature-latency', type=float, default=0,
+                        help='seconds added per feature returned')
+    parser.add_argument('--error-rate', type=float, default=0,
+                        help='fraction of requests failing with a 503')
+    parser.add_argument('--jobs', type=int, default=1)
+    parser.add_argument('--page-workers', type=int, default=1)
+    parser.add_argument('--adaptive', action='store_true')
+    parser.add_argument('--quadtree', action='store_true')
+    parser.add_argument('--tiles', action='store_true')
+    parser.add_argument('--format', choices=sorted(WRITERS),
+                        default='geojson')
+    parser.add_argument('--attachments', type=int, default=0,
+                        help='attachments per feature, downloaded in a '
+                        'phase of their own')
+    parser.add_argument('--attachment-size', type=int, default=100000,
+                        help='bytes per attachment')
+    parser.add_argument('--attachment-workers', type=int, default=4)
+    parser.add_argument('--skip-styles', action='store_true')
+    parser.add_argument('--json', metavar='FILE',
+                        help='also write the results to this file')
+    parser.add_argument('--verbose', action='store_true',
+                        help='show the output of agsdump')
+    args = parser.parse_args()
+
+    layers = [MockLayer(i, 'layer_{}'.format(i), args.features,
+                        args.geometry, args.vertices, args.attachments,
+                        args.attachment_size)
+              for i in range(args.layers)]
+    server = MockServerProcess(layers,
+                               max_record_count=args.max_record_count,
+                               latency=args.latency,
+                               feature_latency=args.feature_latency,
+                               error_rate=args.error_rate,
+                               pagination=not args.no_pagination)
+
+    # retry injected errors right away, the latency is simulated already
+    workers = max(args.page_workers, args.attachment_workers)
+    session.configure(pool_size=max(10, args.jobs * workers),
+                      retries=10, backoff=0)
+
+    folder = tempfile.mkdtemp(prefix='agsdump-bench-')
+    cwd = os.getcwd()
+    os.chdir(folder)
+    results = []
+    try:
+        with server:
+            if not args.skip_styles:
+                results.append(measure('styles', lambda: dump_styles(
+                    'bench', server.url, jobs=args.jobs), server,
+                    args.verbose))
+            # descriptors are cached, fetch them again for a fair count
+            descriptor_cache.invalidate()
+            results.append(measure('data', lambda: dump_data(
+                'bench', server.url, jobs=args.jobs,
+                page_workers=args.page_workers, adaptive=args.adaptive,
+                quadtree=args.quadtree, tiles=args.tiles,
+                output_format=args.format), server, args.verbose))
+            if args.attachments:
+                results.append(measure('attachments', lambda: dump_attachments(
+                    'bench', server.url, jobs=args.jobs,
+                    workers=args.attachment_workers), server, args.verbose))
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(folder)
+
+    print("{} layers x {} {} features, {} vertices, maxRecordCount {}, "
+          "latency {}s, error rate {}".format(
+              args.layers, args.features, args.geometry, args.vertices,
+              args.max_record_count, args.latency, args.error_rate))
+    print("{:<11} {:>9} {:>10} {:>9} {:>7} {:>12}".format(
+        'phase', 'seconds', 'peak MB', 'requests', 'errors', 'features/s'))
+    for result in results:
+        print("{:<11} {:>9.2f} {:>10.1f} {:>9} {:>7} {:>12}".format(
+            result['phase'], result['seconds'], result['peak_rss_mb'],
+            result['requests'], result['errors'],
+            '{:.0f}'.format(result['features_per_second'])
+            if result['features_per_second'] else '-'))
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'options': vars(args), 'results': results}, f,
+                      indent=2, sort_keys=True)
+
+
+if __name__ == '__main__':
+    main()
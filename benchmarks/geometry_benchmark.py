@@ -0,0 +1,70 @@
+# Features per second of the Esri JSON -> GeoJSON conversion, agsdump's
+# geometry module against what the arcgis library it replaced did for
+# polygons: all rings relabelled as one Polygon, without grouping holes or
+# fixing their orientation. That baseline is an upper bound, agsdump does
+# more work per feature and is expected to be slower than it.
+#
+#   python benchmarks/geometry_benchmark.py [features] [vertices]
+import os
+import sys
+import math
+import time
+import random
+
+# the checkout's agsdump, whether it is installed or not
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(
+    __file__))))
+
+from agsdump.geometry import features_to_geojson
+
+
+def relabel(features):
+    # the arcgis-rest-query polygon parser, a Python 2 only package
+    return [{'type': 'Feature', 'properties': feature.get('attributes'),
+             'geometry': {'type': 'Polygon',
+                          'coordinates': feature['geometry']['rings']}}
+            for feature in features]
+
+
+def ring(cx, cy, radius, vertices, clockwise=True):
+    step = 2 * math.pi / vertices
+    if clockwise:
+        step = -step
+    coords = [[cx + radius * math.cos(i * step),
+               cy + radius * math.sin(i * step)] for i in range(vertices)]
+    return coords + [coords[0]]
+
+
+def polygon_features(count, vertices):
+    features = []
+    for oid in range(count):
+        cx, cy = random.uniform(0, 1000), random.uniform(0, 1000)
+        rings = [ring(cx, cy, 10, vertices),
+                 ring(cx, cy, 2, max(4, vertices // 4), clockwise=False)]
+        if oid % 5 == 0:
+            rings.append(ring(cx + 30, cy, 5, vertices))
+        features.append({'attributes': {'OBJECTID': oid},
+                         'geometry': {'rings': rings}})
+    return features
+
+
+def measure(name, func, features, page_size=1000):
+    start = time.time()
+    for i in range(0, len(features), page_size):
+        func(features[i:i + page_size])
+    elapsed = time.time() - start
+    print("{:<10} {:>12.0f} features/s".format(name, len(features) / elapsed))
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    vertices = int(sys.argv[2]) if len(sys.argv) > 2 else 64
+    features = polygon_features(count, vertices)
+
+    print("{} polygons, {} vertices per outer ring".format(count, vertices))
+    measure('relabel', relabel, features)
+    measure('agsdump', features_to_geojson, features)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,95 @@
+# Throughput of every installed json backend on the two hot paths of a
+# dump: parsing Esri JSON feature pages as they come off the wire, and
+# serializing the converted GeoJSON features into the output file. Pages
+# are generated like the mock server's, or read from saved query
+# responses (f=json) given as arguments.
+#
+#   python benchmarks/json_benchmark.py --pages 20 --page-size 1000
+#   python benchmarks/json_benchmark.py page1.json page2.json
+import os
+import sys
+import json
+import time
+import argparse
+
+# the mock server, and the checkout's agsdump whether it is installed or not
+here = os.path.dirname(os.path.abspath(__file__))
+sys.path[:0] = [here, os.path.dirname(here)]
+
+from mock_server import MockLayer, GEOMETRY_TYPES
+from agsdump import jsonlib
+from agsdump.geometry import features_to_geojson
+
+
+def mock_pages(pages, page_size, geometry, vertices):
+    layer = MockLayer(0, 'Layer', pages * page_size, geometry, vertices)
+    for start in range(0, pages * page_size, page_size):
+        page = {
+            'objectIdFieldName': 'OBJECTID',
+            'geometryType': layer.geometry_type,
+            'spatialReference': {'wkid': 4326},
+            'features': [layer.feature(oid)
+                         for oid in range(start, start + page_size)],
+            'exceededTransferLimit': True,
+        }
+        yield json.dumps(page).encode('utf-8')
+
+
+def measure(func, items, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.time()
+        for item in items:
+            func(item)
+        elapsed = time.time() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('files', nargs='*',
+                        help="saved query responses to parse instead")
+    parser.add_argument('--pages', type=int, default=20)
+    parser.add_argument('--page-size', type=int, default=1000)
+    parser.add_argument('--geometry', choices=sorted(GEOMETRY_TYPES),
+                        default='polygon')
+    parser.add_argument('--vertices', type=int, default=32)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    if args.files:
+        pages = []
+        for path in args.files:
+            with open(path, 'rb') as f:
+                pages.append(f.read())
+    else:
+        pages = list(mock_pages(args.pages, args.page_size, args.geometry,
+                                args.vertices))
+
+    decoded = [json.loads(page) for page in pages]
+    features = [feature for page in decoded
+                for feature in features_to_geojson(page.get('features') or
+                                                   [])]
+    size = sum(len(page) for page in pages) / (1024.0 * 1024)
+    print("{} pages, {:.1f} MB, {} features".format(len(pages), size,
+                                                     len(features)))
+    print("{:<10} {:>12} {:>16}".format('backend', 'parse MB/s',
+                                         'write features/s'))
+
+    current = jsonlib.backend
+    try:
+        for name in jsonlib.PREFERENCE:
+            if name not in jsonlib.BACKENDS:
+                continue
+            jsonlib.use(name)
+            parse = measure(jsonlib.loads, pages, args.repeat)
+            write = measure(jsonlib.dumps, features, args.repeat)
+            print("{:<10} {:>12.1f} {:>16.0f}".format(
+                name, size / parse, len(features) / write))
+    finally:
+        jsonlib.use(current)
+
+
+if __name__ == '__main__':
+    main()
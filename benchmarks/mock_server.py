@@ -0,0 +1,419 @@
+# A local stand-in for an ArcGIS MapServer serving synthetic layers, for
+# benchmarking agsdump without a real server. Features are generated from
+# their objectId, so every run sees the same data.
+#
+#   server = MockMapServer([MockLayer(0, 'parcels', 50000)],
+#                          max_record_count=1000, latency=0.05,
+#                          error_rate=0.01)
+#   with server:
+#       dump_data('bench', server.url)
+#
+# MockServerProcess takes the same arguments and runs the server in a
+# child process instead.
+import re
+import json
+import hashlib
+import math
+import time
+import random
+import threading
+import multiprocessing
+from collections import Counter
+
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+
+GEOMETRY_TYPES = {
+    'point': 'esriGeometryPoint',
+    'polyline': 'esriGeometryPolyline',
+    'polygon': 'esriGeometryPolygon',
+}
+
+SYMBOLS = {
+    'esriGeometryPoint': {
+        'type': 'esriSMS', 'style': 'esriSMSCircle', 'size': 6,
+        'color': [230, 0, 0, 255],
+        'outline': {'color': [0, 0, 0, 255], 'width': 1},
+    },
+    'esriGeometryPolyline': {
+        'type': 'esriSLS', 'style': 'esriSLSSolid', 'width': 1.5,
+        'color': [0, 92, 230, 255],
+    },
+    'esriGeometryPolygon': {
+        'type': 'esriSFS', 'style': 'esriSFSSolid',
+        'color': [190, 232, 255, 128],
+        'outline': {'type': 'esriSLS', 'style': 'esriSLSSolid',
+                    'color': [0, 0, 0, 255], 'width': 0.5},
+    },
+}
+
+FIELDS = [
+    {'name': 'OBJECTID', 'type': 'esriFieldTypeOID', 'alias': 'OBJECTID'},
+    {'name': 'NAME', 'type': 'esriFieldTypeString', 'alias': 'NAME',
+     'length': 50},
+    {'name': 'VALUE', 'type': 'esriFieldTypeDouble', 'alias': 'VALUE'},
+    {'name': 'CREATED', 'type': 'esriFieldTypeDate', 'alias': 'CREATED'},
+]
+
+_OID_WHERE = re.compile(r'OBJECTID\s*>\s*(\d+)')
+
+
+class MockLayer:
+    # `vertices` is the number of vertices of every line and outer ring,
+    # every fifth polygon also gets a hole. Every feature has `attachments`
+    # attachments of `attachment_size` bytes.
+    def __init__(self, layer_id, name, count, geometry='polygon',
+                 vertices=32, attachments=0, attachment_size=100000):
+        self.id = layer_id
+        self.name = name
+        self.count = count
+        self.geometry_type = GEOMETRY_TYPES[geometry]
+        self.vertices = vertices
+        self.attachments = attachments
+        self.attachment_size = attachment_size
+        self._bounds = None
+
+    def descriptor(self, max_record_count, pagination):
+        return {
+            'id': self.id,
+            'name': self.name,
+            'type': 'Feature Layer',
+            'geometryType': self.geometry_type,
+            'objectIdField': 'OBJECTID',
+            'fields': FIELDS,
+            'maxRecordCount': max_record_count,
+            'advancedQueryCapabilities': {
+                'supportsPagination': pagination,
+                'supportsQueryAttachments': True,
+            },
+            'hasAttachments': bool(self.attachments),
+            'drawingInfo': {
+                'renderer': {'type': 'simple',
+                             'symbol': SYMBOLS[self.geometry_type]},
+                'transparency': 0,
+            },
+            'extent': {'xmin': 0, 'ymin': 0, 'xmax': 1000, 'ymax': 1000,
+                       'spatialReference': {'wkid': 4326}},
+        }
+
+    def _ring(self, cx, cy, radius, vertices, clockwise=True):
+        step = 2 * math.pi / vertices
+        if clockwise:
+            step = -step
+        coords = [[round(cx + radius * math.cos(i * step), 6),
+                   round(cy + radius * math.sin(i * step), 6)]
+                  for i in range(vertices)]
+        return coords + [coords[0]]
+
+    def geometry(self, oid, rand):
+        cx, cy = rand.uniform(0, 1000), rand.uniform(0, 1000)
+        if self.geometry_type == 'esriGeometryPoint':
+            return {'x': cx, 'y': cy}
+        if self.geometry_type == 'esriGeometryPolyline':
+            return {'paths': [[[cx + i, cy + rand.uniform(-1, 1)]
+                               for i in range(self.vertices)]]}
+        rings = [self._ring(cx, cy, 1, self.vertices)]
+        if oid % 5 == 0:
+            rings.append(self._ring(cx, cy, 0.25, max(4, self.vertices // 4),
+                                    clockwise=False))
+        return {'rings': rings}
+
+    def bounds(self):
+        # the bbox of every feature, by objectId, for envelope queries;
+        # drawn from the same random numbers as feature()
+        if self._bounds is None:
+            bounds = {}
+            for oid in range(1, self.count + 1):
+                rand = random.Random(oid)
+                rand.uniform(0, 100)
+                cx, cy = rand.uniform(0, 1000), rand.uniform(0, 1000)
+                if self.geometry_type == 'esriGeometryPoint':
+                    bounds[oid] = (cx, cy, cx, cy)
+                elif self.geometry_type == 'esriGeometryPolyline':
+                    bounds[oid] = (cx, cy - 1, cx + self.vertices - 1, cy + 1)
+                else:
+                    bounds[oid] = (cx - 1, cy - 1, cx + 1, cy + 1)
+            self._bounds = bounds
+        return self._bounds
+
+    def feature(self, oid):
+        rand = random.Random(oid)
+        return {
+            'attributes': {
+                'OBJECTID': oid,
+                'NAME': '{} {}'.format(self.name, oid),
+                'VALUE': rand.uniform(0, 100),
+                'CREATED': 1500000000000 + oid * 1000,
+            },
+            'geometry': self.geometry(oid, rand),
+        }
+
+    def attachment_infos(self, oid):
+        return [{'id': oid * 100 + i, 'name': 'photo {}.jpg'.format(i),
+                 'contentType': 'image/jpeg', 'size': self.attachment_size}
+                for i in range(self.attachments)]
+
+    def attachment(self, oid, attachment_id):
+        # repeatable bytes, as large as the info says
+        line = '{} {}\n'.format(oid, attachment_id).encode('ascii')
+        return (line * (self.attachment_size // len(line) + 1))[
+            :self.attachment_size]
+
+
+class _Handler(BaseHTTPRequestHandler):
+    # the MockMapServer is reachable as self.server.mock
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        self._handle(parse_qs(urlparse(self.path).query))
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length).decode('utf-8')
+        params = parse_qs(urlparse(self.path).query)
+        params.update(parse_qs(body))
+        self._handle(params)
+
+    def _handle(self, params):
+        params = dict((key, values[-1]) for key, values in params.items())
+        path = urlparse(self.path).path
+        status, payload = self.server.mock.respond(path, params)
+        if isinstance(payload, bytes):
+            body, content_type = payload, 'application/octet-stream'
+        else:
+            body = json.dumps(payload).encode('utf-8')
+            content_type = 'application/json'
+
+        # layer descriptors can be revalidated, like on a real server
+        etag = None
+        if status == 200 and set(params) <= set(['f', 'token']):
+            etag = '"{}"'.format(hashlib.sha1(body).hexdigest())
+            if self.headers.get('If-None-Match') == etag:
+                self.send_response(304)
+                self.send_header('ETag', etag)
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        if etag:
+            self.send_header('ETag', etag)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class MockMapServer:
+    # `latency` seconds are added to every response, plus `feature_latency`
+    # for every feature returned, and `error_rate` of the requests fail
+    # with a 503. `requests` counts what was asked for.
+    path = '/arcgis/rest/services/Bench/MapServer'
+
+    def __init__(self, layers, max_record_count=1000, latency=0,
+                 feature_latency=0, error_rate=0, pagination=True, port=0):
+        self.layers = dict((layer.id, layer) for layer in layers)
+        self.max_record_count = max_record_count
+        self.latency = latency
+        self.feature_latency = feature_latency
+        self.error_rate = error_rate
+        self.pagination = pagination
+        self.requests = Counter()
+        self._lock = threading.Lock()
+        self._random = random.Random(0)
+        self._server = ThreadingHTTPServer(('127.0.0.1', port), _Handler)
+        self._server.mock = self
+        self._thread = None
+
+    @property
+    def url(self):
+        return 'http://127.0.0.1:{}{}'.format(self._server.server_port,
+                                              self.path)
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever)
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+        self._thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+    def _count(self, kind):
+        with self._lock:
+            self.requests[kind] += 1
+            return self._random.random() < self.error_rate
+
+    def respond(self, path, params):
+        if self.latency:
+            time.sleep(self.latency)
+
+        parts = path[len(self.path):].strip('/').split('/')
+        if not parts[0]:
+            kind = 'service'
+        elif len(parts) == 1:
+            kind = 'layer'
+        elif parts[1] == 'queryAttachments':
+            kind = 'attachment_infos'
+        elif len(parts) == 3 and parts[2] == 'attachments':
+            kind = 'attachment_infos'
+        elif len(parts) == 4 and parts[2] == 'attachments':
+            kind = 'attachments'
+        elif params.get('returnCountOnly', '').lower() == 'true':
+            kind = 'count'
+        elif params.get('returnIdsOnly', '').lower() == 'true':
+            kind = 'ids'
+        else:
+            kind = 'features'
+
+        if self._count(kind):
+            self.requests['errors'] += 1
+            return 503, {'error': {'code': 503, 'message': 'injected'}}
+
+        if kind == 'service':
+            return 200, self.service_descriptor()
+        layer = self.layers.get(int(parts[0]))
+        if layer is None:
+            return 404, {'error': {'code': 404, 'message': 'not found'}}
+        if kind == 'layer':
+            return 200, layer.descriptor(self.max_record_count,
+                                         self.pagination)
+
+        if kind == 'attachments':
+            return 200, layer.attachment(int(parts[1]), int(parts[3]))
+        if kind == 'attachment_infos':
+            return 200, self.attachment_infos(layer, parts, params)
+
+        object_ids = self._select(layer, params.get('where', ''),
+                                  params.get('geometry'))
+        if kind == 'count':
+            return 200, {'count': len(object_ids)}
+        if kind == 'ids':
+            return 200, {'objectIdFieldName': 'OBJECTID',
+                         'objectIds': object_ids}
+        return 200, self.query(layer, object_ids, params)
+
+    def attachment_infos(self, layer, parts, params):
+        if parts[1] != 'queryAttachments':
+            return {'attachmentInfos': layer.attachment_infos(int(parts[1]))}
+        object_ids = [int(oid) for oid in params['objectIds'].split(',')]
+        return {'attachmentGroups': [
+            {'parentObjectId': oid,
+             'attachmentInfos': layer.attachment_infos(oid)}
+            for oid in object_ids if layer.attachment_infos(oid)]}
+
+    def service_descriptor(self):
+        return {
+            'mapName': 'Bench',
+            'layers': [{'id': layer.id, 'name': layer.name,
+                        'parentLayerId': -1, 'subLayerIds': None}
+                       for _, layer in sorted(self.layers.items())],
+        }
+
+    def _select(self, layer, where, envelope=None):
+        # only the objectId paging clause and envelopes are understood,
+        # anything else matches every feature
+        match = _OID_WHERE.search(where)
+        first = int(match.group(1)) + 1 if match else 1
+        object_ids = range(max(first, 1), layer.count + 1)
+        if not envelope:
+            return list(object_ids)
+
+        xmin, ymin, xmax, ymax = [float(v) for v in envelope.split(',')]
+        bounds = layer.bounds()
+        return [oid for oid in object_ids
+                if bounds[oid][0] <= xmax and bounds[oid][2] >= xmin and
+                bounds[oid][1] <= ymax and bounds[oid][3] >= ymin]
+
+    def query(self, layer, object_ids, params):
+        if params.get('objectIds'):
+            wanted = set(int(oid) for oid in params['objectIds'].split(','))
+            object_ids = [oid for oid in object_ids if oid in wanted]
+        elif 'resultOffset' in params:
+            offset = int(params['resultOffset'])
+            object_ids = object_ids[offset:]
+
+        count = min(int(params.get('resultRecordCount') or
+                        self.max_record_count), self.max_record_count)
+        exceeded = len(object_ids) > count
+        object_ids = object_ids[:count]
+        if self.feature_latency:
+            time.sleep(self.feature_latency * len(object_ids))
+        return {
+            'objectIdFieldName': 'OBJECTID',
+            'geometryType': layer.geometry_type,
+            'spatialReference': {'wkid': 4326},
+            'fields': FIELDS,
+            'features': [layer.feature(oid) for oid in object_ids],
+            'exceededTransferLimit': exceeded,
+        }
+
+
+def _serve(conn, args, kwargs):
+    # the child of MockServerProcess: answers its commands until 'stop'
+    server = MockMapServer(*args, **kwargs).start()
+    conn.send(server.url)
+    while True:
+        command = conn.recv()
+        with server._lock:
+            if command == 'requests':
+                conn.send(dict(server.requests))
+                continue
+            server.requests.clear()
+        if command == 'stop':
+            server.stop()
+            conn.send(None)
+            return
+        conn.send(None)
+
+
+class MockServerProcess:
+    # A MockMapServer in a child process, so that generating and encoding
+    # its pages neither adds to the memory of the process being measured
+    # nor competes with it for the GIL. requests and clear() reach the
+    # child's counters over a pipe.
+    def __init__(self, *args, **kwargs):
+        self._args = args
+        self._kwargs = kwargs
+        self._conn = None
+        self._process = None
+        self.url = None
+
+    def _call(self, command):
+        self._conn.send(command)
+        return self._conn.recv()
+
+    @property
+    def requests(self):
+        return Counter(self._call('requests'))
+
+    def clear(self):
+        self._call('clear')
+
+    def start(self):
+        self._conn, child = multiprocessing.Pipe()
+        self._process = multiprocessing.Process(
+            target=_serve, args=(child, self._args, self._kwargs))
+        self._process.daemon = True
+        self._process.start()
+        self.url = self._conn.recv()
+        return self
+
+    def stop(self):
+        self._call('stop')
+        self._process.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
@@ -0,0 +1,188 @@
+# Time to build and serialize the SLD of one layer with a uniqueValue or
+# classBreaks renderer of N classes, the case that dominates dump_styles.
+# When python-sld is installed (and can load its schema) the same rules
+# are also built with the python-sld calls Layer used to make, wrapper
+# objects and normalize() included, for comparison. That baseline is a
+# transcription of the old code path for these symbols, not the old
+# Layer itself, so the numbers are indicative.
+#
+#   python benchmarks/sld_benchmark.py --classes 10 100 500
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+import lxml.etree
+
+# the checkout's agsdump, whether it is installed or not
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(
+    __file__))))
+
+from agsdump.layer import Layer
+from agsdump.symbols import SymbolizerCache
+
+try:
+    import sld
+except ImportError:
+    sld = None
+
+
+def fill(i):
+    return {'type': 'esriSFS', 'style': 'esriSFSSolid',
+            'color': [i % 256, (i * 7) % 256, (i * 13) % 256, 255],
+            'outline': {'type': 'esriSLS', 'style': 'esriSLSSolid',
+                        'color': [0, 0, 0, 255], 'width': 0.4}}
+
+
+def descriptor(renderer, classes):
+    if renderer == 'uniqueValue':
+        renderer = {'type': 'uniqueValue', 'field1': 'KIND',
+                    'uniqueValueInfos': [
+                        {'label': 'Kind {}'.format(i), 'value': str(i),
+                         'symbol': fill(i)} for i in range(classes)]}
+    else:
+        renderer = {'type': 'classBreaks', 'field': 'AREA', 'minValue': 0,
+                    'classBreakInfos': [
+                        {'label': '< {}'.format(i + 1),
+                         'classMaxValue': i + 1, 'symbol': fill(i)}
+                        for i in range(classes)]}
+    return {'name': 'Benchmark', 'type': 'Feature Layer',
+            'geometryType': 'esriGeometryPolygon', 'minScale': 0,
+            'maxScale': 0, 'drawingInfo': {'renderer': renderer}}
+
+
+class BenchmarkLayer(Layer):
+    def __init__(self, descriptor, folder):
+        Layer.__init__(self, 'http://server/MapServer', 0, folder,
+                       log=lambda message: None,
+                       symbolizers=SymbolizerCache())
+        self._descriptor = descriptor
+
+    @property
+    def descriptor(self):
+        return self._descriptor
+
+
+def build(descriptor, folder):
+    BenchmarkLayer(descriptor, folder).dump_sld_file()
+
+
+def color(rgba):
+    return '#{:02x}{:02x}{:02x}'.format(*rgba[:3])
+
+
+def build_python_sld(descriptor, folder):
+    # The python-sld calls the old Layer made for these renderers and
+    # esriSFS symbols, transcribed rather than the old class itself, which
+    # fetched its descriptor and could not be timed on its own. Scales,
+    # labels and the other symbol types are left out, so this is close to
+    # but not exactly the old code path.
+    renderer = descriptor['drawingInfo']['renderer']
+    doc = sld.StyledLayerDescriptor()
+    fts = doc.create_namedlayer('Benchmark').create_userstyle() \
+        .create_featuretypestyle()
+    if renderer['type'] == 'uniqueValue':
+        infos = renderer['uniqueValueInfos']
+    else:
+        infos = renderer['classBreakInfos']
+        min_value = str(renderer.get('minValue'))
+    for info in infos:
+        rule = fts.create_rule(info['label'], MinScaleDenominator=None,
+                               MaxScaleDenominator=None)
+        del rule.PointSymbolizer
+        if renderer['type'] == 'uniqueValue':
+            rule.create_filter(renderer['field1'], '==', info['value'])
+        else:
+            max_value = str(info.get('classMaxValue'))
+            filter1 = sld.Filter(rule)
+            filter1.PropertyIsGreaterThanOrEqualTo = sld.PropertyCriterion(
+                filter1, 'PropertyIsGreaterThanOrEqualTo')
+            filter1.PropertyIsGreaterThanOrEqualTo.PropertyName = \
+                renderer['field']
+            filter1.PropertyIsGreaterThanOrEqualTo.Literal = min_value
+            filter2 = sld.Filter(rule)
+            filter2.PropertyIsLessThanOrEqualTo = sld.PropertyCriterion(
+                filter2, 'PropertyIsLessThanOrEqualTo')
+            filter2.PropertyIsLessThanOrEqualTo.PropertyName = \
+                renderer['field']
+            filter2.PropertyIsLessThanOrEqualTo.Literal = max_value
+            rule.Filter = filter1 + filter2
+            min_value = max_value
+
+        symbol = info['symbol']
+        symbolizer = rule.create_symbolizer('Polygon')
+        fill = symbolizer.create_fill()
+        fill.create_cssparameter('fill', color(symbol['color']))
+        fill.create_cssparameter('fill-opacity',
+                                 str(symbol['color'][3] / 255))
+        outline = symbol['outline']
+        stroke = symbolizer.create_stroke()
+        stroke.create_cssparameter('stroke', color(outline['color']))
+        stroke.create_cssparameter('stroke-width', str(outline['width']))
+        stroke.create_cssparameter('stroke-linejoin', 'bevel')
+        stroke.create_cssparameter('stroke-opacity',
+                                   str(outline['color'][3] / 255))
+    doc.normalize()
+    data = lxml.etree.tostring(doc._node, pretty_print=True,
+                               encoding="UTF-8", xml_declaration=True)
+    with open(os.path.join(folder, 'python-sld.sld'), 'wb') as f:
+        f.write(data)
+
+
+def python_sld_available():
+    if sld is None:
+        return False
+    try:
+        sld.StyledLayerDescriptor()
+    except Exception:
+        return False
+    return True
+
+
+def measure(func, descriptor, folder, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.time()
+        func(descriptor, folder)
+        elapsed = time.time() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--classes', type=int, nargs='+',
+                        default=[10, 100, 500])
+    parser.add_argument('--renderer', choices=['uniqueValue', 'classBreaks'],
+                        default='uniqueValue')
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    # python-sld looks for (and leaves behind) a schema backup in the
+    # working directory
+    folder = tempfile.mkdtemp()
+    cwd = os.getcwd()
+    os.chdir(folder)
+    try:
+        builders = [('sldbuilder', build)]
+        if python_sld_available():
+            builders.append(('python-sld', build_python_sld))
+        else:
+            print("python-sld not available, no baseline", file=sys.stderr)
+
+        print("{:<12} {:>8} {:>14}".format('builder', 'classes',
+                                           'ms per layer'))
+        for classes in args.classes:
+            case = descriptor(args.renderer, classes)
+            for name, func in builders:
+                elapsed = measure(func, case, folder, args.repeat)
+                print("{:<12} {:>8} {:>14.2f}".format(name, classes,
+                                                      elapsed * 1000))
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(folder)
+
+
+if __name__ == '__main__':
+    main()
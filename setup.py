@@ -9,8 +9,19 @@ config = {
     'url': 'http://github.com/gmioannou/agsdump',
     'download_url': 'http://github.com/gmioannou/fginspect',
     'author_email': 'gmioannou@gmail.com',
-    'version': '0.1',
-    'install_requires': ['nose'],
+    'version': '0.2',
+    'python_requires': '>=3.7',
+    'install_requires': [
+        'awesome-slugify',
+        'lxml',
+        'requests',
+        'urllib3',
+    ],
+    'extras_require': {
+        'async': ['aiohttp'],
+        'fast': ['orjson'],
+        'test': ['pytest'],
+    },
     'packages': ['agsdump'],
     'scripts': [],
     'name': 'agsdump',
@@ -0,0 +1,148 @@
+import json
+import time
+import requests
+from agsdump.adaptive import PageSizer, ConcurrencyLimiter, adaptive_chunks
+from agsdump.mapservice import MapService
+from agsdump.concurrency import ordered_map
+
+
+def test_page_sizer():
+    sizer = PageSizer(1000, target_seconds=2.0)
+    # 1000 features in 4 seconds, 500 would have fit
+    sizer.observe(1000, 4.0)
+    assert sizer.size == 500
+    sizer.observe(500, 0.5)
+    assert sizer.size == 600
+    sizer.shrink()
+    assert sizer.size == 300
+    # payloads over target_bytes shrink pages too
+    sizer = PageSizer(1000, target_bytes=1000)
+    sizer.observe(1000, 0.1, 4000)
+    assert sizer.size == 250
+
+
+def test_adaptive_chunks():
+    sizer = PageSizer(4)
+    sizes = []
+    for chunk in adaptive_chunks(list(range(10)), sizer):
+        sizes.append(len(chunk))
+        sizer.shrink()
+    assert sizes == [4, 2, 1, 1, 1, 1]
+
+
+def test_concurrency_limiter():
+    limiter = ConcurrencyLimiter(8)
+    for i in range(8):
+        limiter.observe(100, 1.0)
+    limiter.observe(100, 5.0)
+    assert limiter.limit == 4
+    # pages already in flight do not cut it again
+    limiter.observe(100, 5.0)
+    assert limiter.limit == 4
+    for i in range(4):
+        limiter.observe(100, 1.0)
+    assert limiter.limit == 5
+
+
+class FakeResponse:
+    def __init__(self, payload):
+        self.text = json.dumps(payload)
+        self.content = self.text
+
+
+class FakeMapService(MapService):
+    # times out on pages of more than 2 features and truncates pages of 2
+    def __init__(self):
+        MapService.__init__(self, 'http://example.com/MapServer')
+        self.pages = []
+
+    def get_object_id_field(self, layer):
+        return 'OBJECTID'
+
+    def _request(self, layer, params, method='get'):
+        object_ids = [int(oid) for oid in params['objectIds'].split(',')]
+        self.pages.append(object_ids)
+        if len(object_ids) > 2:
+            raise requests.Timeout()
+        return FakeResponse({
+            'geometryType': 'esriGeometryPoint',
+            'exceededTransferLimit': len(object_ids) > 1,
+            'features': [{'attributes': {'OBJECTID': oid},
+                          'geometry': {'x': oid, 'y': oid}}
+                         for oid in object_ids[:1]],
+        })
+
+
+def test_get_features_splits_pages():
+    map_service = FakeMapService()
+    features = map_service.get_features(0, [1, 2, 3, 4, 5])
+
+    assert ([feature['properties']['OBJECTID'] for feature in features] ==
+            [1, 2, 3, 4, 5])
+    assert map_service.pages[:3] == [[1, 2, 3, 4, 5], [1, 2], [2]]
+
+
+class TruncatingMapService(MapService):
+    # returns at most 100 features per page, like a server with a transfer
+    # limit under its maxRecordCount
+    def __init__(self):
+        MapService.__init__(self, 'http://example.com/MapServer')
+        self.pages = []
+
+    def get_object_id_field(self, layer):
+        return 'OBJECTID'
+
+    def _request(self, layer, params, method='get'):
+        object_ids = [int(oid) for oid in params['objectIds'].split(',')]
+        self.pages.append(object_ids)
+        return FakeResponse({
+            'geometryType': 'esriGeometryPoint',
+            'exceededTransferLimit': len(object_ids) > 100,
+            'features': [{'attributes': {'OBJECTID': oid},
+                          'geometry': {'x': oid, 'y': oid}}
+                         for oid in object_ids[:100]],
+        })
+
+
+def test_sizer_settles_at_the_transfer_limit():
+    map_service = TruncatingMapService()
+    sizer = PageSizer(1000)
+    object_ids = list(range(10000))
+
+    features = [feature for batch in adaptive_chunks(object_ids, sizer)
+                for feature in map_service.get_features(0, batch,
+                                                        sizer=sizer)]
+
+    assert len(features) == 10000
+    assert sizer.size == sizer.max_size == 100
+    # only the first page is truncated, its rest is fetched in pages of 100
+    assert [len(page) for page in map_service.pages] == [1000] + [100] * 99
+
+
+class SteadyMapService(MapService):
+    # answers every page in the same time, however many are in flight
+    def get_object_id_field(self, layer):
+        return 'OBJECTID'
+
+    def _request(self, layer, params, method='get'):
+        time.sleep(0.02)
+        object_ids = [int(oid) for oid in params['objectIds'].split(',')]
+        return FakeResponse({
+            'geometryType': 'esriGeometryPoint',
+            'features': [{'attributes': {'OBJECTID': oid},
+                          'geometry': {'x': oid, 'y': oid}}
+                         for oid in object_ids],
+        })
+
+
+def test_waiting_for_the_limiter_is_not_slowness():
+    map_service = SteadyMapService('http://example.com/MapServer')
+    limiter = ConcurrencyLimiter(8)
+    # cut by an earlier slow page; the callers queue up behind it
+    limiter.limit = 2
+    pages = [list(range(i * 10, i * 10 + 10)) for i in range(60)]
+
+    list(ordered_map(lambda page: map_service.get_features(
+        0, page, limiter=limiter), pages, 8))
+
+    assert limiter.limit == 8
@@ -1,13 +1,64 @@
 
-from nose.tools import *
 import agsdump
+from agsdump.agsdump import unique_names
 
-def setup():
-    print "SETUP!"
+def setup_module():
+    print("SETUP!")
 
-def teardown():
-    print "TEAR DOWN!"
+def teardown_module():
+    print("TEAR DOWN!")
 
 def test_basic():
-    print "I RAN!"
-    
\ No newline at end of file
+    print("I RAN!")
+    
+def test_unique_names():
+    layers = [{'id': 0, 'name': 'Parcels'}, {'id': 1, 'name': 'Roads'},
+              {'id': 2, 'name': 'Parcels'}]
+    assert unique_names(layers) == {0: 'Parcels_0', 1: 'Roads',
+                                    2: 'Parcels_2'}
+
+
+class FakeMapService:
+    # two feature layers of one feature each
+    counted = []
+
+    def __init__(self, url):
+        self.url = url
+
+    @property
+    def layers(self):
+        return [{'id': 0, 'name': 'Parcels'}, {'id': 1, 'name': 'Roads'}]
+
+    def _build_request(self, layer):
+        return "{}/{}".format(self.url, layer)
+
+    def get_descriptor_for_layer(self, layer):
+        return {'geometryType': 'esriGeometryPoint', 'fields': []}
+
+    def get_max_record_count(self, layer):
+        return 1000
+
+    def get_count(self, layer, query=None):
+        self.counted.append(layer)
+        return 1
+
+    def iter_batches(self, layer, query=None, **kwargs):
+        yield layer, [{'type': 'Feature', 'properties': {'OBJECTID': layer},
+                       'geometry': None}]
+
+
+def test_resume_does_not_plan_done_layers(tmpdir, monkeypatch, capsys):
+    monkeypatch.chdir(tmpdir)
+    monkeypatch.setattr(agsdump.agsdump, 'MapService', FakeMapService)
+
+    agsdump.agsdump.dump_data('map', 'http://example.com/MapServer', jobs=2)
+    assert sorted(FakeMapService.counted) == [0, 1]
+    assert "Plan: 2 layers" in capsys.readouterr().out
+
+    del FakeMapService.counted[:]
+    agsdump.agsdump.dump_data('map', 'http://example.com/MapServer', jobs=2,
+                              resume=True)
+    assert FakeMapService.counted == []
+    out = capsys.readouterr().out
+    assert "Plan: 0 layers" in out
+    assert "0 Parcels (done)" in out and "1 Roads (done)" in out
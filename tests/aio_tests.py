@@ -0,0 +1,196 @@
+import json
+import time
+import asyncio
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+import pytest
+from agsdump import aio
+from agsdump.session import Session
+from agsdump.mapservice import MapService
+from agsdump.query import QueryOptions
+from agsdump.adaptive import PageSizer
+
+
+def test_ordered_gather():
+    async def square(x):
+        await asyncio.sleep((10 - x) * 0.001)
+        return x * x
+
+    results = aio.ordered_gather((square(x) for x in range(10)), 4)
+    assert list(results) == [x * x for x in range(10)]
+
+
+def test_limiter():
+    limiter = aio.AsyncConcurrencyLimiter(2)
+    active = []
+
+    async def page():
+        async with limiter:
+            active.append(limiter._active)
+            await asyncio.sleep(0.001)
+
+    async def pages():
+        await asyncio.gather(*[page() for i in range(6)])
+
+    aio.get_loop().run(pages())
+    assert max(active) == 2
+
+
+class FakeResponse:
+    def __init__(self, payload):
+        self.content = json.dumps(payload).encode('utf-8')
+
+    def raise_for_status(self):
+        pass
+
+
+class FakeClient:
+    # times out on pages of more than 2 features
+    def __init__(self):
+        self.pages = []
+
+    async def post(self, url, data=None):
+        object_ids = [int(oid) for oid in data['objectIds'].split(',')]
+        self.pages.append(object_ids)
+        if len(object_ids) > 2:
+            raise asyncio.TimeoutError()
+        return FakeResponse({
+            'geometryType': 'esriGeometryPoint',
+            'features': [{'attributes': {'OBJECTID': oid},
+                          'geometry': {'x': oid, 'y': oid}}
+                         for oid in object_ids],
+        })
+
+
+def test_afetch_features_splits_pages():
+    map_service = MapService('http://example.com/MapServer')
+    client = FakeClient()
+    features = aio.get_loop().run(
+        map_service._afetch_features(client, 0, [1, 2, 3, 4, 5],
+                                     QueryOptions(), 'OBJECTID', None,
+                                     aio.AsyncConcurrencyLimiter(2)))
+
+    assert sorted(f['attributes']['OBJECTID'] for f in features) == [
+        1, 2, 3, 4, 5]
+    assert client.pages[0] == [1, 2, 3, 4, 5]
+
+
+class TruncatingClient:
+    # returns at most 100 features per page
+    def __init__(self):
+        self.pages = []
+
+    async def post(self, url, data=None):
+        object_ids = [int(oid) for oid in data['objectIds'].split(',')]
+        self.pages.append(object_ids)
+        return FakeResponse({
+            'geometryType': 'esriGeometryPoint',
+            'exceededTransferLimit': len(object_ids) > 100,
+            'features': [{'attributes': {'OBJECTID': oid},
+                          'geometry': {'x': oid, 'y': oid}}
+                         for oid in object_ids[:100]],
+        })
+
+
+def test_afetch_features_caps_the_sizer():
+    map_service = MapService('http://example.com/MapServer')
+    client = TruncatingClient()
+    sizer = PageSizer(1000)
+    features = aio.get_loop().run(
+        map_service._afetch_features(client, 0, list(range(1000)),
+                                     QueryOptions(), 'OBJECTID', sizer,
+                                     aio.AsyncConcurrencyLimiter(4)))
+
+    assert len(features) == 1000
+    assert sizer.size == sizer.max_size == 100
+    assert sorted(len(page) for page in client.pages) == [100] * 9 + [1000]
+
+
+class FlakyHandler(BaseHTTPRequestHandler):
+    # every other request fails with a 503
+    requests = []
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        self.requests.append(self.path)
+        status = 503 if len(self.requests) % 2 else 200
+        body = json.dumps({'count': 3}).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def test_async_session_retries():
+    pytest.importorskip('aiohttp')
+    server = ThreadingHTTPServer(('127.0.0.1', 0), FlakyHandler)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.start()
+    session = aio.AsyncSession(retries=2, backoff=0)
+    try:
+        url = 'http://127.0.0.1:{}/query'.format(server.server_port)
+        response = aio.get_loop().run(session.get(url, {'f': 'json'}))
+        assert response.status_code == 200
+        assert json.loads(response.content) == {'count': 3}
+        assert len(FlakyHandler.requests) == 2
+    finally:
+        aio.get_loop().run(session.close())
+        server.shutdown()
+        server.server_close()
+        thread.join()
+
+
+class SlowHandler(BaseHTTPRequestHandler):
+    # answers after 50ms and records the most requests it had in flight
+    lock = threading.Lock()
+    active = 0
+    most = 0
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        cls = type(self)
+        with cls.lock:
+            cls.active += 1
+            cls.most = max(cls.most, cls.active)
+        time.sleep(0.05)
+        with cls.lock:
+            cls.active -= 1
+        body = b'{}'
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def test_max_requests_shared_with_sync_session():
+    pytest.importorskip('aiohttp')
+    server = ThreadingHTTPServer(('127.0.0.1', 0), SlowHandler)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.start()
+    sync_session = Session(max_requests=2)
+    async_session = aio.AsyncSession(slots=sync_session.slots)
+    url = 'http://127.0.0.1:{}/query'.format(server.server_port)
+    try:
+        threads = [threading.Thread(target=sync_session.get, args=(url, ))
+                   for i in range(4)]
+        for sync_thread in threads:
+            sync_thread.start()
+
+        async def requests():
+            await asyncio.gather(*[async_session.get(url) for i in range(4)])
+
+        aio.get_loop().run(requests())
+        for sync_thread in threads:
+            sync_thread.join()
+        assert SlowHandler.most == 2
+    finally:
+        aio.get_loop().run(async_session.close())
+        sync_session.close()
+        server.shutdown()
+        server.server_close()
+        thread.join()
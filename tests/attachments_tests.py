@@ -0,0 +1,119 @@
+import os
+import json
+import shutil
+import tempfile
+from agsdump import attachments
+from agsdump.attachments import AttachmentDump, file_name
+from agsdump.mapservice import MapService
+from agsdump.writers import NDJSONWriter
+
+tmp_dir = None
+
+
+class FakeResponse:
+    def __init__(self, payload):
+        self.content = json.dumps(payload).encode('utf-8')
+
+    def raise_for_status(self):
+        pass
+
+
+class FakeDownload:
+    def __init__(self, url):
+        self.url = url
+
+    def raise_for_status(self):
+        pass
+
+    def iter_content(self, chunk_size):
+        yield b'file '
+        yield self.url.encode('utf-8')
+
+    def close(self):
+        pass
+
+
+class FakeSession:
+    urls = []
+
+    def get(self, url, params=None, stream=False):
+        self.urls.append(url)
+        return FakeDownload(url)
+
+
+class FakeMapService(MapService):
+    # objectIds 1-5, the odd ones with two attachments each
+    def __init__(self):
+        MapService.__init__(self, 'http://example.com/MapServer')
+        self.queries = []
+
+    def get_descriptor_for_layer(self, layer):
+        return {'hasAttachments': True,
+                'advancedQueryCapabilities': {
+                    'supportsQueryAttachments': True}}
+
+    def get_object_ids(self, layer, query=None):
+        return [1, 2, 3, 4, 5]
+
+    def _request(self, layer, params, method='get', operation='query'):
+        object_ids = [int(oid) for oid in params['objectIds'].split(',')]
+        self.queries.append((operation, object_ids))
+        return FakeResponse({'attachmentGroups': [
+            {'parentObjectId': oid,
+             'attachmentInfos': [{'id': oid * 10 + i, 'name': 'a b.jpg',
+                                  'size': None} for i in range(2)]}
+            for oid in object_ids if oid % 2]})
+
+
+get_session = attachments.get_session
+
+
+def setup_module():
+    global tmp_dir
+    tmp_dir = tempfile.mkdtemp()
+    attachments.get_session = FakeSession
+
+
+def teardown_module():
+    attachments.get_session = get_session
+    shutil.rmtree(tmp_dir)
+
+
+def test_file_name():
+    assert file_name({'id': 7, 'name': 'My photo (1).JPG'}) == \
+        '7-My_photo_1_.JPG'
+    assert file_name({'id': 7, 'name': '..\\..\\evil.exe'}) == '7-evil.exe'
+    assert file_name({'id': 7, 'name': None}) == '7-attachment'
+
+
+def test_dump_and_resume():
+    map_service = FakeMapService()
+    folder = os.path.join(tmp_dir, 'layer')
+    index_path = os.path.join(tmp_dir, 'layer.ndjson')
+    checkpoints = []
+
+    with NDJSONWriter(index_path) as index:
+        dump = AttachmentDump(map_service, 0, folder, index, batch_size=2,
+                              workers=2)
+        dump.run(checkpoint=checkpoints.append)
+
+    assert checkpoints == [2, 4, 5]
+    assert [ids for _, ids in map_service.queries] == [[1, 2], [3, 4], [5]]
+    assert map_service.queries[0][0] == 'queryAttachments'
+    assert dump.downloaded == 6
+
+    rows = list(NDJSONWriter.read(index_path))
+    assert [(row['objectId'], row['attachmentId']) for row in rows] == \
+        [(1, 10), (1, 11), (3, 30), (3, 31), (5, 50), (5, 51)]
+    assert rows[0]['path'] == 'layer/1/10-a_b.jpg'
+    with open(os.path.join(tmp_dir, rows[0]['path']), 'rb') as f:
+        assert f.read() == (b'file http://example.com/MapServer/0/1/'
+                            b'attachments/10')
+
+    # files already on disk are not downloaded again
+    FakeSession.urls = []
+    with NDJSONWriter(index_path) as index:
+        dump = AttachmentDump(map_service, 0, folder, index, batch_size=2)
+        dump.run(after=2)
+    assert dump.skipped == 4
+    assert FakeSession.urls == []
@@ -0,0 +1,122 @@
+import time
+import shutil
+import tempfile
+
+import pytest
+import requests
+from agsdump.cache import ResponseCache, CacheMiss, cache_key
+
+tmp_dir = None
+
+
+def setup_module():
+    global tmp_dir
+    tmp_dir = tempfile.mkdtemp()
+
+
+def teardown_module():
+    shutil.rmtree(tmp_dir)
+
+
+class FakeServer:
+    # answers with `body`, honouring If-None-Match when it has an etag
+    def __init__(self, body=b'{}', etag=None):
+        self.body = body
+        self.etag = etag
+        self.requests = []
+
+    def send(self, method, url, **kwargs):
+        headers = kwargs.get('headers') or {}
+        self.requests.append(headers)
+        response = requests.Response()
+        response.url = url
+        response.status_code = 200
+        if self.etag:
+            response.headers['ETag'] = self.etag
+            if headers.get('If-None-Match') == self.etag:
+                response.status_code = 304
+                return response
+        response._content = self.body
+        return response
+
+
+def test_cache_key():
+    assert (cache_key('get', 'http://a/0', {'f': 'json', 'x': 1}) ==
+            cache_key('GET', 'http://a/0/', {'x': '1', 'f': 'json',
+                                             'token': 'secret'}))
+    assert (cache_key('GET', 'http://a/0', {'f': 'json'}) !=
+            cache_key('POST', 'http://a/0', {'f': 'json'}))
+
+
+class TestResponseCache:
+    def setup_method(self):
+        self.folder = tempfile.mkdtemp(dir=tmp_dir)
+
+    def request(self, cache, server, url='http://a/0', **params):
+        response = cache.request('GET', url, {'params': params}, server.send)
+        return response.content
+
+    def test_ttl(self):
+        server = FakeServer(b'{"id": 0}')
+        cache = ResponseCache(self.folder, ttl=60)
+        assert self.request(cache, server) == b'{"id": 0}'
+        assert self.request(cache, server) == b'{"id": 0}'
+        assert len(server.requests) == 1
+
+        cache.ttl = 0
+        server.body = b'{"id": 1}'
+        assert self.request(cache, server) == b'{"id": 1}'
+        assert len(server.requests) == 2
+
+    def test_errors_not_cached(self):
+        error = b'{"error": {"code": 498, "message": "Invalid token"}}'
+        server = FakeServer(error)
+        cache = ResponseCache(self.folder, ttl=60)
+        assert self.request(cache, server, returnCountOnly='true') == error
+        server.body = b'{"count": 3}'
+        assert self.request(cache, server,
+                            returnCountOnly='true') == b'{"count": 3}'
+        assert len(server.requests) == 2
+
+        cache.offline = True
+        assert self.request(cache, server,
+                            returnCountOnly='true') == b'{"count": 3}'
+
+    def test_revalidation(self):
+        server = FakeServer(b'{"id": 0}', etag='"v1"')
+        cache = ResponseCache(self.folder)
+        self.request(cache, server)
+        assert self.request(cache, server) == b'{"id": 0}'
+        assert server.requests[1] == {'If-None-Match': '"v1"'}
+
+        server.etag = '"v2"'
+        server.body = b'{"id": 1}'
+        assert self.request(cache, server) == b'{"id": 1}'
+
+    def test_eviction(self):
+        server = FakeServer(b'x' * 100)
+        cache = ResponseCache(self.folder, max_size=250)
+        for layer in range(3):
+            self.request(cache, server, 'http://a/{}'.format(layer))
+        # the first one was least recently used
+        self.request(cache, server, 'http://a/1')
+        self.request(cache, server, 'http://a/3')
+        assert cache.size == 200
+
+        # a new process finds what is left on disk
+        cache = ResponseCache(self.folder, max_size=250, offline=True)
+        assert cache.size == 200
+        with pytest.raises(CacheMiss):
+            self.request(cache, server, 'http://a/0')
+        assert self.request(cache, server, 'http://a/3') == b'x' * 100
+
+    def test_offline(self):
+        server = FakeServer(b'{}', etag='"v1"')
+        ResponseCache(self.folder).request('GET', 'http://a/0', {},
+                                           server.send)
+        cache = ResponseCache(self.folder, ttl=0, offline=True)
+        time.sleep(0.01)
+        assert self.request(cache, server) == b'{}'
+        assert len(server.requests) == 1
+        with pytest.raises(CacheMiss):
+            cache.request('GET', 'http://a/0', {'stream': True}, server.send)
@@ -0,0 +1,67 @@
+import json
+import time
+from agsdump import catalog
+from agsdump.session import RateLimiter
+
+root = 'http://example.com/arcgis/rest/services'
+
+directory = {
+    root: {
+        'folders': ['Cadastre'],
+        'services': [
+            {'name': 'Basemap', 'type': 'MapServer'},
+            {'name': 'Geocoder', 'type': 'GeocodeServer'},
+        ]
+    },
+    root + '/Cadastre': {
+        'folders': [],
+        'services': [
+            {'name': 'Cadastre/Parcels', 'type': 'MapServer'},
+            {'name': 'Cadastre/Parcels', 'type': 'FeatureServer'},
+        ]
+    },
+}
+
+
+class FakeResponse:
+    def __init__(self, payload):
+        self.text = json.dumps(payload)
+        self.content = self.text.encode('utf-8')
+
+    def raise_for_status(self):
+        pass
+
+
+class FakeSession:
+    def get(self, url, params=None):
+        return FakeResponse(directory[url])
+
+
+get_session = catalog.get_session
+
+
+def setup_module():
+    catalog.get_session = FakeSession
+
+
+def teardown_module():
+    catalog.get_session = get_session
+
+
+def test_crawl():
+    assert catalog.crawl(root + '/') == [
+        ('Basemap_MapServer', root + '/Basemap/MapServer'),
+        ('Cadastre/Parcels_MapServer', root + '/Cadastre/Parcels/MapServer'),
+        ('Cadastre/Parcels_FeatureServer',
+         root + '/Cadastre/Parcels/FeatureServer'),
+    ]
+
+
+def test_rate_limiter():
+    limiter = RateLimiter(20)
+    start = time.time()
+    for i in range(5):
+        limiter.wait('example.com')
+    limiter.wait('other.example.com')
+
+    assert time.time() - start >= 4 / 20.0
@@ -0,0 +1,21 @@
+import time
+import random
+from agsdump.concurrency import ordered_map, chunks
+
+
+def slow_square(x):
+    time.sleep(random.random() * 0.01)
+    return x * x
+
+
+def test_ordered_map_keeps_order():
+    assert (list(ordered_map(slow_square, range(50), 8)) ==
+            [x * x for x in range(50)])
+
+
+def test_ordered_map_serial():
+    assert list(ordered_map(slow_square, range(5), 1)) == [0, 1, 4, 9, 16]
+
+
+def test_chunks():
+    assert list(chunks([1, 2, 3, 4, 5], 2)) == [[1, 2], [3, 4], [5]]
@@ -0,0 +1,97 @@
+import time
+import json
+from multiprocessing.pool import ThreadPool
+from agsdump import descriptors
+
+
+class FakeResponse:
+    def __init__(self, payload):
+        self.text = json.dumps(payload)
+        self.content = self.text.encode('utf-8')
+
+    def raise_for_status(self):
+        pass
+
+
+class FakeSession:
+    def get(self, url, params=None):
+        return FakeResponse({'url': url})
+
+
+get_session = descriptors.get_session
+
+
+def setup_module():
+    descriptors.get_session = FakeSession
+
+
+def teardown_module():
+    descriptors.get_session = get_session
+
+
+def test_descriptor_fetched_once():
+    cache = descriptors.DescriptorCache()
+    url = 'http://example.com/arcgis/rest/services/map/MapServer/0'
+
+    for i in range(5):
+        assert cache.get(url)['url'] == url
+    cache.get(url + '/')
+
+    assert cache.fetch_count[url] == 1
+
+
+def test_invalidate():
+    cache = descriptors.DescriptorCache()
+    url = 'http://example.com/arcgis/rest/services/map/MapServer/1'
+
+    cache.get(url)
+    cache.invalidate(url)
+    assert url not in cache
+    cache.get(url)
+
+    assert cache.fetch_count[url] == 2
+
+
+class SlowSession:
+    # a 0.1s server; error bodies come with a 200 like ArcGIS sends them
+    def get(self, url, params=None):
+        time.sleep(0.1)
+        if url.endswith('/expired'):
+            return FakeResponse({'error': {'code': 498,
+                                           'message': 'Invalid token'}})
+        return FakeResponse({'url': url})
+
+
+def test_different_urls_fetched_in_parallel():
+    descriptors.get_session = SlowSession
+    try:
+        cache = descriptors.DescriptorCache()
+        url = 'http://example.com/arcgis/rest/services/map/MapServer/{}'
+        urls = [url.format(i % 4) for i in range(8)]
+
+        start = time.time()
+        pool = ThreadPool(8)
+        try:
+            results = pool.map(cache.get, urls)
+        finally:
+            pool.terminate()
+
+        assert time.time() - start < 0.3
+        assert [result['url'] for result in results] == urls
+        assert sum(cache.fetch_count.values()) == 4
+    finally:
+        descriptors.get_session = FakeSession
+
+
+def test_errors_not_cached():
+    descriptors.get_session = SlowSession
+    try:
+        cache = descriptors.DescriptorCache()
+        url = 'http://example.com/arcgis/rest/services/map/MapServer/expired'
+
+        assert cache.get(url)['error']['code'] == 498
+        assert url not in cache
+        cache.get(url)
+        assert cache.fetch_count[url] == 2
+    finally:
+        descriptors.get_session = FakeSession
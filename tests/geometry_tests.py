@@ -0,0 +1,101 @@
+from agsdump.geometry import esri_to_geojson, features_to_geojson, ring_area
+
+# esri outer rings are clockwise, holes counter-clockwise
+outer = [[0, 0], [0, 10], [10, 10], [10, 0], [0, 0]]
+hole = [[2, 2], [4, 2], [4, 4], [2, 4], [2, 2]]
+island = [[2.5, 2.5], [2.5, 3.5], [3.5, 3.5], [3.5, 2.5], [2.5, 2.5]]
+far = [[20, 20], [20, 30], [30, 30], [30, 20], [20, 20]]
+far_hole = [[22, 22], [24, 22], [24, 24], [22, 24], [22, 22]]
+
+
+def rev(ring):
+    return ring[::-1]
+
+
+def test_point():
+    assert (esri_to_geojson({'x': 1, 'y': 2}) ==
+            {'type': 'Point', 'coordinates': [1, 2]})
+    assert (esri_to_geojson({'x': 1, 'y': 2, 'z': 3}) ==
+            {'type': 'Point', 'coordinates': [1, 2, 3]})
+    assert esri_to_geojson({'x': 'NaN', 'y': 'NaN'}) is None
+    assert esri_to_geojson(None) is None
+
+
+def test_multipoint():
+    assert (esri_to_geojson({'points': [[1, 2], [3, 4]]}) ==
+            {'type': 'MultiPoint', 'coordinates': [[1, 2], [3, 4]]})
+
+
+def test_polyline():
+    assert (esri_to_geojson({'paths': [[[0, 0], [1, 1]]]}) ==
+            {'type': 'LineString', 'coordinates': [[0, 0], [1, 1]]})
+    assert (esri_to_geojson({'paths': [[[0, 0], [1, 1]], [[2, 2], [3, 3]]]}) ==
+            {'type': 'MultiLineString',
+             'coordinates': [[[0, 0], [1, 1]], [[2, 2], [3, 3]]]})
+
+
+def test_polygon_orientation():
+    assert (esri_to_geojson({'rings': [outer]}) ==
+            {'type': 'Polygon', 'coordinates': [rev(outer)]})
+
+
+def test_polygon_hole():
+    assert (esri_to_geojson({'rings': [outer, hole]}) ==
+            {'type': 'Polygon', 'coordinates': [rev(outer), rev(hole)]})
+
+
+def test_multipolygon_hole_assignment():
+    # holes listed before their polygons still end up in the right one
+    assert (esri_to_geojson({'rings': [far_hole, outer, hole, far]}) ==
+            {'type': 'MultiPolygon',
+             'coordinates': [[rev(outer), rev(hole)],
+                             [rev(far), rev(far_hole)]]})
+
+
+def test_hole_outside_the_only_polygon():
+    # a counter-clockwise ring nowhere near the polygon is not its hole
+    assert (esri_to_geojson({'rings': [outer, far_hole]}) ==
+            {'type': 'MultiPolygon',
+             'coordinates': [[rev(outer)], [far_hole]]})
+
+
+def test_nested_island():
+    assert (esri_to_geojson({'rings': [outer, hole, island]}) ==
+            {'type': 'MultiPolygon',
+             'coordinates': [[rev(outer), rev(hole)], [rev(island)]]})
+
+
+def test_counter_clockwise_only():
+    # wrongly wound data: each ring becomes a polygon
+    assert (esri_to_geojson({'rings': [rev(outer)]}) ==
+            {'type': 'Polygon', 'coordinates': [rev(outer)]})
+
+
+def test_degenerate_rings():
+    assert esri_to_geojson({'rings': [[[0, 0], [1, 1], [0, 0]]]}) is None
+
+
+def test_ring_area():
+    assert ring_area(outer) == -100.0
+    assert ring_area(hole) == 4.0
+    # z values are ignored
+    assert ring_area([c + [7] for c in hole]) == 4.0
+
+
+def test_features_to_geojson():
+    features = [
+        {'attributes': {'OBJECTID': 1}, 'geometry': {'rings': [outer, hole]}},
+        {'attributes': {'OBJECTID': 2}, 'geometry': None},
+        {'attributes': {'OBJECTID': 3}, 'geometry': {'rings': [far]}},
+    ] * 50
+
+    converted = features_to_geojson(features)
+
+    assert len(converted) == 150
+    assert converted[0] == {
+        'type': 'Feature', 'properties': {'OBJECTID': 1},
+        'geometry': {'type': 'Polygon',
+                     'coordinates': [rev(outer), rev(hole)]}}
+    assert converted[1]['geometry'] is None
+    assert (converted[149]['geometry'] ==
+            {'type': 'Polygon', 'coordinates': [rev(far)]})
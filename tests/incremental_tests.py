@@ -0,0 +1,66 @@
+import os
+import json
+import shutil
+import tempfile
+from agsdump.writers import GeoJSONWriter
+from agsdump.query import QueryOptions
+from agsdump.incremental import edited_since, merge_changes
+
+tmp_dir = None
+
+
+def setup_module():
+    global tmp_dir
+    tmp_dir = tempfile.mkdtemp()
+
+
+def teardown_module():
+    shutil.rmtree(tmp_dir)
+
+
+def feature(oid, version=0):
+    return {
+        'type': 'Feature',
+        'properties': {'OBJECTID': oid, 'VERSION': version},
+        'geometry': None
+    }
+
+
+class FakeMapService:
+    def __init__(self, object_ids, changed):
+        self.object_ids = object_ids
+        self.changed = changed
+
+    def get_object_id_field(self, layer):
+        return 'OBJECTID'
+
+    def get_object_ids(self, layer, query=None):
+        return self.object_ids
+
+    def iter_batches(self, layer, query=None, workers=1):
+        assert query.where == 'EDITDATE > 0'
+        yield self.changed[-1], [feature(oid, 1) for oid in self.changed]
+
+
+def test_edited_since():
+    assert (edited_since('EDITDATE', 1577880000123) ==
+            "EDITDATE >= timestamp '2020-01-01 12:00:00'")
+
+
+def test_merge_changes():
+    path = os.path.join(tmp_dir, 'layer.json')
+    with GeoJSONWriter(path) as writer:
+        writer.write([feature(oid) for oid in [1, 2, 3, 5]])
+
+    # 2 edited, 3 deleted, 4 and 6 added
+    map_service = FakeMapService([1, 2, 4, 5, 6], [2, 4, 6])
+    count, changed = merge_changes(map_service, 0, path, QueryOptions(),
+                                   'EDITDATE > 0')
+
+    with open(path) as f:
+        features = json.load(f)['features']
+
+    assert (count, changed) == (5, 3)
+    assert ([(f['properties']['OBJECTID'], f['properties']['VERSION'])
+             for f in features] ==
+            [(1, 0), (2, 1), (4, 1), (5, 0), (6, 1)])
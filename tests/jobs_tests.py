@@ -0,0 +1,39 @@
+import time
+import random
+from agsdump.jobs import run_layer_jobs
+
+LAYERS = [{'id': i, 'name': 'Layer {}'.format(i)} for i in range(6)]
+
+
+def dump(layer, job):
+    if layer['id'] == 2:
+        raise ValueError("no such layer")
+    for line in range(3):
+        job.log("layer {} line {}".format(layer['id'], line))
+        time.sleep(random.random() * 0.01)
+
+
+def test_failing_layer_does_not_abort_the_others():
+    for jobs in (1, 4):
+        results = run_layer_jobs(dump, LAYERS, jobs=jobs)
+
+        assert sorted(job.layer_id for job in results) == list(range(6))
+        failed = [job for job in results if job.failed]
+        assert [job.layer_id for job in failed] == [2]
+        assert failed[0].error == "ValueError: no such layer"
+        assert all(job.duration is not None for job in results)
+
+
+def test_layers_print_as_blocks(capsys):
+    run_layer_jobs(dump, LAYERS, jobs=4)
+    lines = capsys.readouterr().out.splitlines()
+
+    summary = lines.index("Summary: 6 layers, 1 failed")
+    assert "  2 Layer 2: failed (ValueError: no such layer) in" in \
+        lines[summary + 3]
+    output = [line for line in lines[:summary] if line.startswith('layer ')]
+    assert len(output) == 15
+    for start in range(0, len(output), 3):
+        layer = output[start].split()[1]
+        assert output[start:start + 3] == [
+            "layer {} line {}".format(layer, line) for line in range(3)]
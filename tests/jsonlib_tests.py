@@ -0,0 +1,36 @@
+import pytest
+from agsdump import jsonlib
+
+FEATURE = {
+    'type': 'Feature',
+    'geometry': {'type': 'Point', 'coordinates': [33.0123456789, 35.1]},
+    'properties': {'OBJECTID': 7, 'NAME': u'Λεμεσός',
+                   'VALUE': None, 'FLAG': True},
+}
+
+
+class TestBackends:
+    def setup_method(self):
+        self.backend = jsonlib.backend
+
+    def teardown_method(self):
+        jsonlib.use(self.backend)
+
+    @pytest.mark.parametrize('name', sorted(jsonlib.BACKENDS))
+    def test_round_trip(self, name):
+        jsonlib.use(name)
+        data = jsonlib.dumps(FEATURE)
+        assert isinstance(data, bytes)
+        assert b'\n' not in data
+        assert jsonlib.loads(data) == FEATURE
+        assert jsonlib.loads(data.decode('utf-8')) == FEATURE
+
+    def test_fastest_installed_backend_is_default(self):
+        installed = [name for name in jsonlib.PREFERENCE
+                     if name in jsonlib.BACKENDS]
+        assert self.backend == installed[0]
+
+    def test_unknown_backend(self):
+        with pytest.raises(ValueError):
+            jsonlib.use('simplejson')
+        assert jsonlib.backend == self.backend
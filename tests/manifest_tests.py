@@ -0,0 +1,27 @@
+import shutil
+import tempfile
+from agsdump.manifest import Manifest
+
+tmp_dir = None
+
+
+def setup_module():
+    global tmp_dir
+    tmp_dir = tempfile.mkdtemp()
+
+
+def teardown_module():
+    shutil.rmtree(tmp_dir)
+
+
+def test_manifest_roundtrip():
+    manifest = Manifest(tmp_dir)
+    manifest.reset(3, status='partial')
+    manifest.update(3, last_oid=1000, offset=52, count=1000)
+
+    state = Manifest(tmp_dir).get(3)
+    assert state == {'status': 'partial', 'last_oid': 1000, 'offset': 52,
+                     'count': 1000}
+
+    manifest.reset(3, status='complete', count=1200)
+    assert Manifest(tmp_dir).get('3') == {'status': 'complete', 'count': 1200}
@@ -0,0 +1,52 @@
+import os
+import json
+import shutil
+import tempfile
+from agsdump.metrics import Metrics, Histogram
+
+
+def test_histogram():
+    histogram = Histogram()
+    for value in [0.001, 0.02, 0.02, 0.3, 4]:
+        histogram.observe(value)
+    assert histogram.count == 5
+    assert histogram.min == 0.001
+    assert histogram.max == 4
+    assert histogram.quantile(0.5) == 0.025
+    assert histogram.quantile(0.99) == 4
+
+
+class TestMetrics:
+    def setup_method(self):
+        self.folder = tempfile.mkdtemp()
+        self.metrics = Metrics()
+        self.metrics.inc('features_total', 1500, layer='roads/data/0')
+        self.metrics.observe('layer_seconds', 3.0, layer='roads/data/0')
+        self.metrics.inc('http_requests_total', host='example.com',
+                         status=200)
+        self.metrics.inc('http_requests_total', host='example.com',
+                         status=200)
+        with self.metrics.timer('page'):
+            pass
+
+    def teardown_method(self):
+        shutil.rmtree(self.folder)
+
+    def test_report(self):
+        path = os.path.join(self.folder, 'report.json')
+        self.metrics.write_report(path)
+        with open(path) as f:
+            report = json.load(f)
+
+        assert report['layers']['roads/data/0'] == {
+            'features': 1500, 'seconds': 3.0, 'features_per_second': 500.0}
+        assert report['counters'][1]['value'] == 2
+        assert report['histograms'][1]['labels'] == {'phase': 'page'}
+
+    def test_prometheus(self):
+        text = self.metrics.prometheus()
+        assert '# TYPE agsdump_http_requests_total counter' in text
+        assert ('agsdump_http_requests_total{host="example.com",'
+                'status="200"} 2' in text)
+        assert 'agsdump_phase_seconds_bucket{phase="page",le="+Inf"} 1' in text
+        assert 'agsdump_phase_seconds_count{phase="page"} 1' in text
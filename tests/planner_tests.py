@@ -0,0 +1,78 @@
+import os
+import json
+import shutil
+import tempfile
+from agsdump.mapservice import MapService
+from agsdump.planner import (LayerPlan, plan_layers, schedule, totals,
+                             write_plan)
+from agsdump.query import QueryOptions
+
+tmp_dir = None
+
+LAYERS = [{'id': 0, 'name': 'small'}, {'id': 1, 'name': 'group'},
+          {'id': 2, 'name': 'large'}, {'id': 3, 'name': 'table'}]
+COUNTS = {0: 10, 2: 5000, 3: 200}
+
+
+def setup_module():
+    global tmp_dir
+    tmp_dir = tempfile.mkdtemp()
+
+
+def teardown_module():
+    shutil.rmtree(tmp_dir)
+
+
+class FakeMapService(MapService):
+    def __init__(self):
+        MapService.__init__(self, 'http://example.com/MapServer')
+        self.queries = {}
+
+    def get_descriptor_for_layer(self, layer):
+        if layer == 3:
+            return {'maxRecordCount': 100, 'fields': [{}, {}]}
+        return {'geometryType': 'esriGeometryPolygon', 'maxRecordCount': 1000,
+                'fields': [{}, {}, {}]}
+
+    def get_count(self, layer, query=None):
+        if layer not in COUNTS:
+            raise ValueError('not a feature layer')
+        self.queries[layer] = query
+        return COUNTS[layer]
+
+
+def test_plan_layers():
+    query = QueryOptions(where='A = 1')
+    query._layers['large'] = QueryOptions(fields='NAME')
+
+    map_service = FakeMapService()
+    plans = plan_layers(map_service, LAYERS, query, workers=3)
+
+    assert [plan.layer_id for plan in plans] == [0, 1, 2, 3]
+    assert [plan.count for plan in plans] == [10, None, 5000, 200]
+    assert plans[1].error == 'ValueError: not a feature layer'
+    assert [plan.pages for plan in plans] == [1, 0, 5, 2]
+    # fields of the query, or else all of the layer's
+    assert plans[2].fields == 1
+    assert plans[3].fields == 2
+    assert plans[3].bytes == 200 * 2 * 24
+    assert map_service.queries[0].where == 'A = 1'
+
+    assert totals(plans)['count'] == 5210
+
+
+def test_schedule_longest_first():
+    plans = [LayerPlan(0, 'small', count=10, latency=0.1),
+             LayerPlan(1, 'group', error='ValueError'),
+             LayerPlan(2, 'large', count=5000, latency=0.1),
+             LayerPlan(3, 'table', count=200, max_record_count=100,
+                       latency=0.1)]
+
+    assert [layer['id'] for layer in schedule(LAYERS, plans)] == [2, 3, 0, 1]
+
+    path = os.path.join(tmp_dir, 'plan.json')
+    write_plan(path, plans, jobs=2)
+    with open(path) as f:
+        written = json.load(f)
+    assert written['order'] == [2, 3, 0, 1]
+    assert written['layers'][2]['pages'] == 5
@@ -0,0 +1,87 @@
+import os
+import pytest
+from agsdump import postgis
+
+# e.g. AGSDUMP_TEST_DSN="dbname=agsdump_test" against a local database
+# with the postgis extension installed
+TEST_DSN = os.environ.get('AGSDUMP_TEST_DSN')
+
+descriptor = {
+    'geometryType': 'esriGeometryPolygon',
+    'fields': [
+        {'name': 'OBJECTID', 'type': 'esriFieldTypeOID'},
+        {'name': 'NAME', 'type': 'esriFieldTypeString', 'length': 50},
+        {'name': 'UPDATED', 'type': 'esriFieldTypeDate'},
+        {'name': 'SHAPE', 'type': 'esriFieldTypeGeometry'},
+    ]
+}
+
+square = [[0, 0], [0, 1], [1, 1], [1, 0], [0, 0]]
+
+
+def test_geojson_to_wkt():
+    point = {'type': 'Point', 'coordinates': [1.5, 2]}
+    polygon = {'type': 'Polygon', 'coordinates': [square]}
+    assert postgis.geojson_to_wkt(point) == 'POINT(1.5 2)'
+    assert (postgis.geojson_to_wkt(polygon, multi=True) ==
+            'MULTIPOLYGON(((0 0, 0 1, 1 1, 1 0, 0 0)))')
+    assert (postgis.geojson_to_wkt({'type': 'MultiLineString',
+                                    'coordinates': [[[0, 0], [1, 1]],
+                                                    [[2, 2], [3, 3]]]}) ==
+            'MULTILINESTRING((0 0, 1 1), (2 2, 3 3))')
+
+
+def test_copy_value():
+    assert postgis.copy_value(None, 'text') == '\\N'
+    assert postgis.copy_value(u'a\tb\\c\nd', 'text') == u'a\\tb\\\\c\\nd'
+    assert (postgis.copy_value(1577880000000, 'timestamptz') ==
+            '2020-01-01T12:00:00+00')
+    assert postgis.copy_value(42, 'bigint') == '42'
+
+
+def test_table_name():
+    assert postgis.table_name('Land Parcels (2019)') == 'land_parcels_2019'
+
+    long_names = [postgis.table_name('x' * 80 + suffix)
+                  for suffix in ('a', 'b')]
+    assert long_names[0] != long_names[1]
+    assert all(len(name) == postgis.MAX_TABLE_NAME for name in long_names)
+
+
+def test_table_per_service():
+    if postgis.psycopg2 is None:
+        pytest.skip('psycopg2 is not installed')
+
+    tables = [postgis.PostGISWriter(os.path.join('dumps', service, 'data',
+                                                 'Parcels')).table
+              for service in ('City', 'County')]
+    assert tables == ['city_parcels', 'county_parcels']
+
+
+def test_copy_into_postgis():
+    if not TEST_DSN or postgis.psycopg2 is None:
+        pytest.skip('set AGSDUMP_TEST_DSN to run against postgres')
+
+    features = [{
+        'type': 'Feature',
+        'properties': {'OBJECTID': oid, 'NAME': u'parcel\t{}'.format(oid),
+                       'UPDATED': 1577880000000},
+        'geometry': {'type': 'Polygon', 'coordinates': [square]}
+    } for oid in range(1, 101)]
+
+    with postgis.PostGISWriter('agsdump_test_parcels', descriptor,
+                               dsn=TEST_DSN) as writer:
+        writer.write(features[:60])
+        writer.write(features[60:])
+
+    conn = postgis.psycopg2.connect(TEST_DSN)
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute('SELECT count(*), min("NAME"), '
+                           'ST_GeometryType(min(geom)) '
+                           'FROM agsdump_test_parcels')
+            assert cursor.fetchone() == (100, 'parcel\t1', 'ST_MultiPolygon')
+            cursor.execute('DROP TABLE agsdump_test_parcels')
+        conn.commit()
+    finally:
+        conn.close()
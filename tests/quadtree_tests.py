@@ -0,0 +1,80 @@
+import json
+from agsdump.quadtree import Cell, plan
+from agsdump.mapservice import MapService
+
+# objectId: (x, y); 5 is on the border of all four quarters
+POINTS = {1: (10, 10), 2: (20, 20), 3: (30, 80), 4: (90, 90), 5: (50, 50),
+          6: (12, 12), 7: (15, 15)}
+
+
+def inside(bbox, point):
+    return bbox[0] <= point[0] <= bbox[2] and bbox[1] <= point[1] <= bbox[3]
+
+
+def test_children():
+    keys = [(cell.key, cell.bbox) for cell in Cell((0, 0, 4, 2)).children()]
+    assert keys == [('0', (0, 1.0, 2.0, 2)), ('1', (2.0, 1.0, 4, 2)),
+                    ('2', (0, 0, 2.0, 1.0)), ('3', (2.0, 0, 4, 1.0))]
+
+
+def test_plan():
+    def count(cell):
+        return len([p for p in POINTS.values() if inside(cell.bbox, p)])
+
+    cells = plan(Cell((0, 0, 100, 100)), count, 3, workers=2)
+    assert [(cell.key, cell.count) for cell in cells] == [
+        ('0', 2), ('1', 2), ('21', 1), ('221', 2), ('222', 2), ('3', 1)]
+
+    # cells are not split past max_depth
+    cells = plan(Cell((0, 0, 100, 100)), count, 1, max_depth=1)
+    assert [cell.key for cell in cells] == ['0', '1', '2', '3']
+
+
+class FakeResponse:
+    def __init__(self, payload):
+        self.content = json.dumps(payload).encode('utf-8')
+
+
+class FakeMapService(MapService):
+    # a point layer of POINTS and one feature, 8, without a geometry
+    def __init__(self):
+        MapService.__init__(self, 'http://example.com/MapServer')
+
+    def get_descriptor_for_layer(self, layer):
+        return {'objectIdField': 'OBJECTID', 'maxRecordCount': 3,
+                'extent': {'xmin': 0, 'ymin': 0, 'xmax': 100, 'ymax': 100,
+                           'spatialReference': {'wkid': 3857}}}
+
+    def _select(self, params):
+        if 'geometry' not in params:
+            return sorted(POINTS) + [8]
+        bbox = [float(v) for v in params['geometry'].split(',')]
+        return [oid for oid, point in sorted(POINTS.items())
+                if inside(bbox, point)]
+
+    def _request(self, layer, params, method='get', operation='query'):
+        if params.get('returnCountOnly'):
+            return FakeResponse({'count': len(self._select(params))})
+        if params.get('returnIdsOnly'):
+            return FakeResponse({'objectIds': self._select(params)})
+        if 'objectIds' in params:
+            object_ids = [int(oid) for oid in params['objectIds'].split(',')]
+        else:
+            object_ids = self._select(params)
+        return FakeResponse({'geometryType': 'esriGeometryPoint', 'features': [
+            {'attributes': {'OBJECTID': oid},
+             'geometry': ({'x': POINTS[oid][0], 'y': POINTS[oid][1]}
+                          if oid in POINTS else None)}
+            for oid in object_ids]})
+
+
+def test_iter_cells():
+    cells = list(FakeMapService().iter_cells(0, workers=2))
+    oids = [[feature['properties']['OBJECTID'] for feature in features]
+            for cell, features in cells]
+
+    assert [cell.key for cell, _ in cells] == ['0', '1', '21', '221', '222',
+                                               '3', 'rest']
+    # 5 only comes with the first cell it is in
+    assert oids == [[3, 5], [4], [], [2, 7], [1, 6], [], [8]]
+    assert cells[-1][0].bbox is None
@@ -0,0 +1,98 @@
+import os
+import json
+import shutil
+import tempfile
+from agsdump.query import QueryOptions
+
+tmp_dir = None
+
+
+def setup_module():
+    global tmp_dir
+    tmp_dir = tempfile.mkdtemp()
+
+
+def teardown_module():
+    shutil.rmtree(tmp_dir)
+
+
+def test_defaults():
+    query = QueryOptions()
+    assert query.filter_params() == {'where': '1 = 1'}
+    assert (query.feature_params('OBJECTID') ==
+            {'outFields': '*', 'returnGeometry': True, 'outSR': 4326})
+
+
+def test_pushdown_params():
+    query = QueryOptions(fields='NAME, OBJECTID,AREA', where="TYPE = 'A'",
+                         bbox='0,0,10,10', bbox_sr=2100, out_sr=102100,
+                         max_allowable_offset=5, geometry_precision=1)
+
+    assert query.filter_params() == {
+        'where': "TYPE = 'A'",
+        'geometry': '0.0,0.0,10.0,10.0',
+        'geometryType': 'esriGeometryEnvelope',
+        'spatialRel': 'esriSpatialRelIntersects',
+        'inSR': 2100,
+    }
+    assert query.feature_params('OBJECTID') == {
+        'outFields': 'OBJECTID,NAME,AREA',
+        'returnGeometry': True,
+        'outSR': 102100,
+        'maxAllowableOffset': 5,
+        'geometryPrecision': 1,
+    }
+    assert query.epsg == 3857
+
+
+def test_and_where():
+    assert QueryOptions().and_where('A > 1').where == 'A > 1'
+    assert (QueryOptions(where='B = 2').and_where('A > 1').where ==
+            '(B = 2) AND (A > 1)')
+
+
+def test_config():
+    path = os.path.join(tmp_dir, 'query.json')
+    with open(path, 'w') as f:
+        json.dump({
+            'defaults': {'max_allowable_offset': 10},
+            'layers': {'3': {'fields': ['NAME']},
+                       'Roads': {'where': 'CLASS < 3'}}
+        }, f)
+
+    query = QueryOptions.from_config(path, out_sr=2100, where=None)
+
+    assert query.metadata() == {'out_sr': 2100, 'max_allowable_offset': 10}
+    assert query.for_layer(3, 'Parcels').fields == ['NAME']
+    assert query.for_layer(5, 'Roads').where == 'CLASS < 3'
+    assert query.for_layer(5, 'Roads').max_allowable_offset == 10
+    assert query.for_layer(7, 'Rivers') is query
+
+
+def test_config_precedence():
+    path = os.path.join(tmp_dir, 'precedence.json')
+    with open(path, 'w') as f:
+        json.dump({
+            'defaults': {'out_sr': 3857, 'where': 'A > 1',
+                         'geometry_precision': 6},
+            'layers': {'Roads': {'where': 'CLASS < 3'}}
+        }, f)
+
+    query = QueryOptions.from_config(path, out_sr=2100, where='B = 2',
+                                     geometry_precision=None)
+
+    # explicit values win over the file's defaults, not given ones do not
+    assert query.out_sr == 2100
+    assert query.where == 'B = 2'
+    assert query.geometry_precision == 6
+    # per layer entries win over both
+    roads = query.for_layer(5, 'Roads')
+    assert roads.where == 'CLASS < 3'
+    assert roads.out_sr == 2100
+
+    # without an explicit --out-sr the file's applies, else 4326
+    assert QueryOptions.from_config(path).out_sr == 3857
+    empty = os.path.join(tmp_dir, 'empty.json')
+    with open(empty, 'w') as f:
+        json.dump({}, f)
+    assert QueryOptions.from_config(empty).out_sr == 4326
@@ -0,0 +1,107 @@
+import os
+import shutil
+import tempfile
+import lxml.etree
+from agsdump.layer import Layer
+from agsdump.sldbuilder import SLD, OGC
+
+data_dir = os.path.join(os.path.dirname(__file__), 'data', 'sld')
+tmp_dir = None
+
+FILL = {'type': 'esriSFS', 'style': 'esriSFSSolid',
+        'color': [190, 232, 255, 128],
+        'outline': {'type': 'esriSLS', 'style': 'esriSLSSolid',
+                    'color': [0, 0, 0, 255], 'width': 0.5}}
+LINE = {'type': 'esriSLS', 'style': 'esriSLSDash',
+        'color': [0, 92, 230, 255], 'width': 1.5}
+MARK = {'type': 'esriSMS', 'style': 'esriSMSCircle', 'size': 6,
+        'color': [230, 0, 0, 255],
+        'outline': {'color': [0, 0, 0, 255], 'width': 1}}
+SQUARE = dict(MARK, style='esriSMSSquare')
+TEXT = {'type': 'esriTS', 'color': [0, 0, 0, 255],
+        'font': {'family': 'Arial', 'size': 8, 'style': 'normal',
+                 'weight': 'bold'},
+        'haloSize': 1, 'haloColor': [255, 255, 255, 255],
+        'horizontalAlignment': 'center', 'verticalAlignment': 'baseline'}
+
+
+def descriptor(renderer, geometry='esriGeometryPolygon', minScale=0,
+               maxScale=0, labels=None):
+    return {'name': 'Land Parcels', 'type': 'Feature Layer',
+            'geometryType': geometry, 'minScale': minScale,
+            'maxScale': maxScale,
+            'drawingInfo': {'renderer': renderer, 'labelingInfo': labels}}
+
+
+# written by the python-sld based Layer this replaced
+GOLDEN = {
+    'simple_polygon': descriptor({'type': 'simple', 'symbol': FILL},
+                                 minScale=50000),
+    'simple_line': descriptor({'type': 'simple', 'symbol': LINE},
+                              'esriGeometryPolyline', 100000, 1000),
+    'unique_points': descriptor({
+        'type': 'uniqueValue', 'field1': 'KIND', 'uniqueValueInfos': [
+            {'label': 'A', 'value': 'a', 'symbol': MARK},
+            {'label': 'B & C', 'value': 'b', 'symbol': SQUARE},
+            {'label': 'A again', 'value': 'c', 'symbol': MARK}]},
+        'esriGeometryPoint'),
+    'class_breaks': descriptor({
+        'type': 'classBreaks', 'field': 'AREA', 'minValue': 0,
+        'classBreakInfos': [
+            {'label': 'small', 'classMaxValue': 10.5, 'symbol': FILL},
+            {'label': 'large', 'classMaxValue': 100,
+             'symbol': dict(FILL, color=[1, 2, 3, 255])}]}),
+    'default_line': descriptor({'type': 'heatmap'}, 'esriGeometryPolyline'),
+}
+
+
+class FakeLayer(Layer):
+    def __init__(self, descriptor):
+        Layer.__init__(self, 'http://server/MapServer', 0, tmp_dir,
+                       log=lambda message: None)
+        self._descriptor = descriptor
+
+    @property
+    def descriptor(self):
+        return self._descriptor
+
+
+def setup_module():
+    global tmp_dir
+    tmp_dir = tempfile.mkdtemp()
+
+
+def teardown_module():
+    shutil.rmtree(tmp_dir)
+
+
+def dump(descriptor):
+    layer = FakeLayer(descriptor)
+    layer.dump_sld_file()
+    with open(layer.sld_file_path, 'rb') as f:
+        return f.read()
+
+
+def test_same_output_as_python_sld():
+    for name, case in sorted(GOLDEN.items()):
+        with open(os.path.join(data_dir, name + '.sld'), 'rb') as f:
+            assert dump(case) == f.read(), name
+
+
+def test_labels():
+    doc = lxml.etree.fromstring(dump(descriptor(
+        {'type': 'simple', 'symbol': FILL},
+        labels=[{'labelExpression': '[OWNER]', 'symbol': TEXT}])))
+
+    rules = doc.findall('.//' + SLD + 'Rule')
+    assert [rule.findtext(SLD + 'Title') for rule in rules] == [
+        'Land-Parcels', 'Labels']
+
+    text = rules[1].find(SLD + 'TextSymbolizer')
+    assert text.findtext(SLD + 'Label/' + OGC + 'PropertyName') == 'OWNER'
+    assert [css.get('name') for css in text.find(SLD + 'Font')] == [
+        'font-family', 'font-size', 'font-style', 'font-weight']
+    assert text.findtext(SLD + 'Halo/' + SLD + 'Radius') == '1'
+    anchor = text.find('.//' + SLD + 'AnchorPoint')
+    assert anchor.findtext(SLD + 'AnchorPointX') == '0.5'
+    assert anchor.findtext(SLD + 'AnchorPointY') == '0.0'
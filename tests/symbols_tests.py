@@ -0,0 +1,50 @@
+import os
+import base64
+import shutil
+import tempfile
+from agsdump.symbols import IconStore, SymbolizerCache
+
+tmp_dir = None
+
+
+def setup_module():
+    global tmp_dir
+    tmp_dir = tempfile.mkdtemp()
+
+
+def teardown_module():
+    shutil.rmtree(tmp_dir)
+
+
+def test_icons_written_once():
+    written = []
+
+    def write(path, base64data):
+        written.append(path)
+        if not os.path.exists(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        with open(path, 'wb') as f:
+            f.write(base64.b64decode(base64data))
+
+    red = base64.b64encode(b'red pixel').decode('ascii')
+    blue = base64.b64encode(b'blue pixel').decode('ascii')
+
+    store = IconStore(tmp_dir)
+    names = [store.add(data, 'png', write) for data in [red, blue, red, red]]
+
+    assert len(written) == 2
+    assert names[0] == names[2]
+    assert names[0] != names[1]
+    assert names[0].startswith('icons/')
+
+    # a later run finds the icons already on disk
+    assert IconStore(tmp_dir).add(red, 'png', write) == names[0]
+    assert len(written) == 2
+
+
+def test_symbolizer_cache_keys_on_content():
+    cache = SymbolizerCache()
+    cache.put({'type': 'esriSMS', 'size': 4}, [])
+
+    assert cache.get({'size': 4, 'type': 'esriSMS'}) == []
+    assert cache.get({'type': 'esriSMS', 'size': 5}) is None
@@ -0,0 +1,210 @@
+import os
+import json
+import shutil
+import sqlite3
+import tempfile
+
+import pytest
+from agsdump import files
+from agsdump.writers import (GeoJSONWriter, NDJSONWriter, FlatGeobufWriter,
+                             GeoPackageWriter)
+
+tmp_dir = None
+
+
+def setup_module():
+    global tmp_dir
+    tmp_dir = tempfile.mkdtemp()
+
+
+def teardown_module():
+    shutil.rmtree(tmp_dir)
+
+
+def feature(oid):
+    return {
+        'type': 'Feature',
+        'properties': {'OBJECTID': oid},
+        'geometry': {'type': 'Point', 'coordinates': [oid, oid]}
+    }
+
+
+def test_geojson_pages():
+    path = os.path.join(tmp_dir, 'pages.json')
+    with GeoJSONWriter(path) as writer:
+        writer.write([feature(1), feature(2)])
+        writer.write([])
+        writer.write([feature(3)])
+
+    with open(path) as f:
+        collection = json.load(f)
+
+    assert writer.count == 3
+    assert collection['type'] == 'FeatureCollection'
+    assert ([f['properties']['OBJECTID'] for f in collection['features']] ==
+            [1, 2, 3])
+
+
+def test_geojson_empty():
+    path = os.path.join(tmp_dir, 'empty.json')
+    with GeoJSONWriter(path):
+        pass
+
+    with open(path) as f:
+        assert json.load(f)['features'] == []
+
+
+def test_geojson_resume():
+    path = os.path.join(tmp_dir, 'resume.json')
+    writer = GeoJSONWriter(path).open()
+    writer.write([feature(1), feature(2)])
+    state = writer.checkpoint()
+    writer.write([feature(3)])
+    writer.abort()
+
+    assert not os.path.exists(path)
+
+    writer = GeoJSONWriter(path)
+    assert writer.can_resume(state)
+    with writer.resume(state):
+        writer.write([feature(3), feature(4)])
+
+    with open(path) as f:
+        collection = json.load(f)
+
+    assert ([f['properties']['OBJECTID'] for f in collection['features']] ==
+            [1, 2, 3, 4])
+    assert not os.path.exists(path + '.part')
+
+
+def test_ndjson_roundtrip():
+    path = os.path.join(tmp_dir, 'layer.ndjson')
+    with NDJSONWriter(path) as writer:
+        writer.write([feature(1), feature(2)])
+        writer.write([feature(3)])
+
+    with open(path) as f:
+        assert len(f.read().splitlines()) == 3
+
+    assert ([f['properties']['OBJECTID'] for f in NDJSONWriter.read(path)] ==
+            [1, 2, 3])
+
+
+def test_geojson_metadata():
+    path = os.path.join(tmp_dir, 'metadata.json')
+    metadata = {'query': {'where': "TYPE = 'A'"}}
+    with GeoJSONWriter(path, metadata=metadata) as writer:
+        writer.write([feature(1)])
+
+    with open(path) as f:
+        assert json.load(f)['metadata'] == metadata
+    assert GeoJSONWriter.is_dump(path)
+    assert len(list(GeoJSONWriter.read(path))) == 1
+
+
+def test_compressed_roundtrip():
+    for compression, extension in [('gzip', '.json.gz'), ('zstd', '.json.zst')]:
+        if compression == 'zstd' and files.zstandard is None:
+            continue
+
+        path = os.path.join(tmp_dir, 'layer' + extension)
+        writer = GeoJSONWriter(path, compression=compression)
+        with writer:
+            writer.write([feature(1), feature(2)])
+            assert not writer.can_resume(writer.checkpoint())
+
+        assert GeoJSONWriter.is_dump(path)
+        features = GeoJSONWriter.read(path)
+        assert [f['properties']['OBJECTID'] for f in features] == [1, 2]
+
+
+parcels = {
+    'geometryType': 'esriGeometryPolygon',
+    'fields': [
+        {'name': 'OBJECTID', 'type': 'esriFieldTypeOID'},
+        {'name': 'NAME', 'type': 'esriFieldTypeString', 'length': 50},
+        {'name': 'UPDATED', 'type': 'esriFieldTypeDate'},
+        {'name': 'AREA', 'type': 'esriFieldTypeDouble'},
+        {'name': 'SHAPE', 'type': 'esriFieldTypeGeometry'},
+    ]
+}
+
+
+def parcel(oid):
+    # polygons, which the writers store as multipolygons
+    square = [[oid, 0], [oid, 1], [oid + 1, 1], [oid + 1, 0], [oid, 0]]
+    return {
+        'type': 'Feature',
+        'properties': {'OBJECTID': oid,
+                       'NAME': 'parcel {}'.format(oid) if oid % 2 else None,
+                       'UPDATED': 1577880000000 + oid * 1000,
+                       'AREA': oid * 1.5},
+        'geometry': {'type': 'Polygon', 'coordinates': [square]},
+    }
+
+
+def write_parcels(writer_class, name):
+    path = os.path.join(tmp_dir, name + writer_class.extension)
+    with writer_class(path, parcels, metadata={'source': name}) as writer:
+        writer.write([parcel(oid) for oid in range(1, 6)])
+        writer.write([parcel(oid) for oid in range(6, 11)])
+    assert writer.count == 10
+    assert os.path.exists(path + '.meta.json')
+    assert not os.path.exists(writer.part_path)
+    return path
+
+
+def check_parcels(ogr, path):
+    dataset = ogr.Open(path)
+    layer = dataset.GetLayer(0)
+    assert layer.GetFeatureCount() == 10
+    assert layer.GetGeomType() == ogr.wkbMultiPolygon
+
+    defn = layer.GetLayerDefn()
+    fields = [defn.GetFieldDefn(i) for i in range(defn.GetFieldCount())]
+    types = dict((field.GetName(), field.GetType()) for field in fields)
+    assert types == {'OBJECTID': ogr.OFTInteger64, 'NAME': ogr.OFTString,
+                     'UPDATED': ogr.OFTDateTime, 'AREA': ogr.OFTReal}
+
+    features = sorted(layer, key=lambda feature: feature.GetField('OBJECTID'))
+    first, second = features[0], features[1]
+    assert first.GetField('NAME') == 'parcel 1'
+    assert second.IsFieldNull('NAME')
+    assert first.GetField('AREA') == 1.5
+    # 2020-01-01 12:00:01 UTC
+    assert first.GetFieldAsDateTime('UPDATED')[:6] == [2020, 1, 1, 12, 0, 1]
+    assert (first.GetGeometryRef().GetGeometryType() ==
+            ogr.wkbMultiPolygon)
+    return dataset, layer
+
+
+def test_geopackage():
+    ogr = pytest.importorskip('osgeo.ogr')
+    path = write_parcels(GeoPackageWriter, 'parcels')
+    dataset, layer = check_parcels(ogr, path)
+    assert layer.GetLayerDefn().GetFieldDefn(1).GetWidth() == 50
+    geometry_column = layer.GetGeometryColumn()
+    del dataset, layer
+
+    # the rtree is created once, on close
+    conn = sqlite3.connect(path)
+    try:
+        extensions = conn.execute(
+            "SELECT table_name, column_name FROM gpkg_extensions "
+            "WHERE extension_name = 'gpkg_rtree_index'").fetchall()
+        assert extensions == [('parcels', geometry_column)]
+        rtree = 'rtree_parcels_{}'.format(geometry_column)
+        assert conn.execute(
+            'SELECT count(*) FROM "{}"'.format(rtree)).fetchone() == (10, )
+    finally:
+        conn.close()
+
+
+def test_flatgeobuf():
+    ogr = pytest.importorskip('osgeo.ogr')
+    if ogr.GetDriverByName('FlatGeobuf') is None:
+        pytest.skip('needs GDAL >= 3.1')
+    path = write_parcels(FlatGeobufWriter, 'parcels')
+    dataset, layer = check_parcels(ogr, path)
+    # the packed Hilbert R-tree
+    assert layer.TestCapability(ogr.OLCFastSpatialFilter)